@@ -25,6 +25,15 @@ setup(
         'Programming Language :: Python :: 3 :: Only',
     ],
     install_requires=['requests'],
+    entry_points={
+        'console_scripts': [
+            'spectra-downloader = spectra_downloader.cli:main',
+        ],
+    },
+    extras_require={
+        'numpy': ['numpy'],
+        'zstd': ['zstandard'],
+    },
     setup_requires=['pytest-runner'],
     tests_require=['pytest'],
 )
\ No newline at end of file
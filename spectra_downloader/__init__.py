@@ -1,3 +1,7 @@
 from .downloader.downloader import SpectraDownloader
 from .ssap_parser.parser import parse_ssap
 from .ssap_parser.model import IndexedSSAPVotable
+from .downloader.paging import PagedSSAPQuery, PartitionedSSAPQuery
+from .downloader.mirrors import MirrorSelector
+from .downloader.workqueue import WorkQueue, QueueWorker
+from .downloader.partial import PartialFetch
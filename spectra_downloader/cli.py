@@ -0,0 +1,242 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from .downloader.downloader import SpectraDownloader
+from .downloader.scheduler import Scheduler
+from .downloader.throttle import RateLimiter, AIMDController
+from .downloader.metrics import MetricsRegistry, PrometheusExporter
+from .downloader.storage import BundleStorage, DirectoryStorage
+from .downloader.results import ResultLog
+
+
+class Job:
+    """One SSAP source of the batch together with its DataLink parameters and output directory."""
+
+    def __init__(self, source, parameters, location):
+        self.source = source
+        self.parameters = parameters
+        self.location = location
+        self.downloader = None
+
+    def load(self, timeout, rate_limiter, metrics=None, concurrency=None, storage=None, scheduler=None,
+             result_log=None):
+        """Parses the source (HTTP link or VOTable file) and creates SpectraDownloader instance."""
+        if self.source.startswith("http://") or self.source.startswith("https://"):
+            self.downloader = SpectraDownloader.from_link(self.source, metrics, timeout=timeout)
+        else:
+            self.downloader = SpectraDownloader.from_file(self.source, metrics)
+        self.downloader.timeout = timeout
+        self.downloader.rate_limiter = rate_limiter
+        self.downloader.concurrency = concurrency
+        if storage is not None:
+            self.downloader.storage = storage
+        if scheduler is not None:
+            self.downloader.scheduler = scheduler
+        self.downloader.result_log = result_log
+        return self.downloader.parsed_ssap.rows
+
+
+def parse_parameters(values):
+    """Converts list of KEY=VALUE strings into dictionary of DataLink parameters (None if list is empty)."""
+    if not values:
+        return None
+    parameters = dict()
+    for value in values:
+        key, sep, val = value.partition("=")
+        if not sep or not key:
+            raise argparse.ArgumentTypeError("DataLink parameter must be in KEY=VALUE format: {}".format(value))
+        parameters[key] = val
+    return parameters
+
+
+def read_jobs(file, parameters, location):
+    """
+    Reads job list file. Every non-empty line not starting with # is either a source (HTTP link or file path) or
+    a JSON object with key "source" and optional keys "datalink" (dictionary of DataLink parameters) and "output"
+    (output directory relative to the global one).
+    """
+    jobs = list()
+    with open(file, "r") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                spec = json.loads(line)
+                jobs.append(Job(spec["source"], spec.get("datalink", parameters),
+                                os.path.join(location, spec.get("output", ""))))
+            else:
+                jobs.append(Job(line, parameters, location))
+    return jobs
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog="spectra-downloader",
+                                     description="Download spectra listed in SSAP query results as one batch.")
+    parser.add_argument("sources", nargs="*", help="SSAP query HTTP links or SSAP VOTable files")
+    parser.add_argument("-j", "--jobs", action="append", default=list(),
+                        help="file with list of sources (one per line)")
+    parser.add_argument("-o", "--output", required=True, help="output directory")
+    parser.add_argument("-d", "--datalink", action="append", default=list(), metavar="KEY=VALUE",
+                        help="DataLink parameter, DataLink protocol is used if at least one is passed")
+    parser.add_argument("-w", "--workers", type=int, default=4, help="number of concurrent downloads")
+    parser.add_argument("-a", "--adaptive", action="store_true",
+                        help="adapt number of concurrent downloads per host (up to --workers) by AIMD")
+    parser.add_argument("-r", "--rate", type=float, default=None, help="maximal number of requests per second")
+    parser.add_argument("-t", "--timeout", type=float, default=5, help="HTTP timeout in seconds")
+    parser.add_argument("-l", "--log", default=None, help="file for JSON lines output (standard output by default)")
+    parser.add_argument("-m", "--metrics-port", type=int, default=None,
+                        help="serve live metrics in Prometheus text format on this local port")
+    parser.add_argument("-b", "--bundle", choices=BundleStorage.FORMATS, default=None,
+                        help="store spectra into rolling tar or zip bundles with index instead of separate files")
+    parser.add_argument("--bundle-size", type=int, default=1024, help="target size of one bundle in MiB")
+    parser.add_argument("-s", "--shard", choices=DirectoryStorage.SHARDINGS, default=None,
+                        help="spread files into hash or name prefix based subdirectories")
+    parser.add_argument("--results", default=None, help="append results of downloads to this JSON lines file")
+    return parser
+
+
+class BatchRunner:
+    """
+    Runs downloads of all jobs on one shared scheduler and reports progress as JSON lines. Jobs have the same
+    priority, so every source gets its share of workers.
+    """
+
+    def __init__(self, jobs, workers, timeout, rate_limiter, output, metrics=None, concurrency=None, storage=None,
+                 result_log=None, scheduler=None):
+        self.jobs = jobs
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.output = output
+        self.metrics = metrics
+        self.concurrency = concurrency
+        self.storage = storage
+        self.result_log = result_log
+        self._own_scheduler = scheduler is None
+        self.scheduler = Scheduler(workers) if scheduler is None else scheduler
+        self.total = 0
+        self.done = 0
+        self.succeeded = 0
+        self._lock = threading.RLock()  # results are reported from worker threads
+
+    def emit(self, event, **values):
+        values["event"] = event
+        with self._lock:
+            self.output.write(json.dumps(values) + "\n")
+            self.output.flush()
+
+    def _progress_callback(self, job):
+        """Returns progress callback reporting results of downloads of the job."""
+
+        def report(result):
+            with self._lock:
+                self.done += 1
+                if result.success:
+                    self.succeeded += 1
+                if self.metrics is not None:
+                    self.metrics.queue_depth(self.total - self.done)
+                self.emit("result", source=job.source, name=result.name, url=result.url,
+                          success=result.success, error=None if result.success else str(result.exception),
+                          done=self.done, total=self.total)
+
+        return report
+
+    def _start_jobs(self):
+        """Loads all jobs and submits downloads of their spectra. Returns list of DownloadJob handles."""
+        loaded = list()
+        for job in self.jobs:
+            try:
+                loaded.append((job, job.load(self.timeout, self.rate_limiter, self.metrics, self.concurrency,
+                                             self.storage, self.scheduler, self.result_log), None))
+            except Exception as ex:
+                loaded.append((job, None, ex))
+        self.total = sum(len(spectra) for _, spectra, _ in loaded if spectra is not None)
+        handles = list()
+        for job, spectra, error in loaded:
+            # results of started downloads are reported after the source event
+            with self._lock:
+                if error is None:
+                    try:
+                        if job.parameters is None:
+                            handle = job.downloader.download_direct(spectra, job.location,
+                                                                    self._progress_callback(job))
+                        else:
+                            handle = job.downloader.download_datalink(spectra, job.parameters, job.location,
+                                                                      self._progress_callback(job))
+                    except Exception as ex:
+                        self.total -= len(spectra)
+                        error = ex
+                if error is not None:
+                    self.emit("source_error", source=job.source, error=str(error))
+                    continue
+                self.emit("source", source=job.source, spectra=len(spectra), location=job.location,
+                          datalink=job.parameters is not None)
+                handles.append(handle)
+        return handles
+
+    def run(self):
+        """Runs the batch. Returns True if all sources were loaded and all spectra downloaded."""
+        started = time.monotonic()
+        try:
+            handles = self._start_jobs()
+            for handle in handles:
+                handle.wait()
+        finally:
+            if self._own_scheduler:
+                self.scheduler.shutdown(cancel=True)
+        elapsed = time.monotonic() - started
+        self.emit("summary", sources=len(self.jobs), loaded_sources=len(handles), total=self.total,
+                  succeeded=self.succeeded, failed=self.total - self.succeeded, elapsed=round(elapsed, 3),
+                  rate=round(self.total / elapsed, 3) if elapsed > 0 else None)
+        return len(handles) == len(self.jobs) and self.succeeded == self.total
+
+
+def main(argv=None):
+    """Console entry point. Returns exit code 0 if everything was downloaded successfully, 1 otherwise."""
+    parser = create_parser()
+    args = parser.parse_args(argv)
+    try:
+        parameters = parse_parameters(args.datalink)
+        jobs = [Job(source, parameters, args.output) for source in args.sources]
+        for file in args.jobs:
+            jobs.extend(read_jobs(file, parameters, args.output))
+    except (argparse.ArgumentTypeError, IOError, ValueError, KeyError) as ex:
+        parser.error(str(ex))
+    if not jobs:
+        parser.error("at least one source or job file must be passed")
+    if args.workers < 1:
+        parser.error("at least one worker is required")
+    if args.bundle and args.shard:
+        parser.error("bundles can not be sharded")
+    rate_limiter = RateLimiter(args.rate) if args.rate else None
+    concurrency = AIMDController(initial=min(2, args.workers), maximum=args.workers) if args.adaptive else None
+    metrics = exporter = None
+    if args.metrics_port is not None:
+        metrics = MetricsRegistry()
+        exporter = PrometheusExporter(metrics, args.metrics_port).start()
+    # one storage shared by all jobs, so jobs writing into the same directory know about files of each other
+    if args.bundle:
+        storage = BundleStorage(args.bundle, args.bundle_size * 1024 ** 2)
+    else:
+        storage = DirectoryStorage(args.shard)
+    result_log = ResultLog(args.results) if args.results else None
+    output = sys.stdout if args.log is None else open(args.log, "a")
+    try:
+        success = BatchRunner(jobs, args.workers, args.timeout, rate_limiter, output, metrics,
+                              concurrency, storage, result_log).run()
+    finally:
+        if result_log is not None:
+            result_log.close()
+        storage.close()
+        if output is not sys.stdout:
+            output.close()
+        if exporter is not None:
+            exporter.stop()
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+import collections
+import threading
+import time
+
+
+class CallbackDispatcher:
+    """
+    Calls progress callback on its own thread so that slow callbacks (GUI updates, database writes) do not slow down
+    downloading. The instance is passed as progress_callback instead of the callback itself. Results are queued in
+    a bounded queue and delivered one by one or in batches (lists of DownloadResult) of batch_size items or of items
+    collected during interval seconds. When the queue is full, the policy decides what happens with a new result:
+    "block" waits for free space, "drop" discards the new result and "coalesce" replaces the newest queued result
+    by the new one (suitable for progress reporting when only the latest state matters).
+    """
+
+    POLICIES = ("block", "drop", "coalesce")
+
+    def __init__(self, callback, batch_size=None, interval=None, max_queue=1000, policy="block"):
+        """
+        :param callback: Function called with DownloadResult instance, or with list of them if batching is enabled.
+        :param batch_size: Maximal number of results delivered in one batch. Batching is enabled if batch_size or
+        interval is set.
+        :param interval: Maximal time in seconds the first result of a batch waits for the batch to be delivered.
+        :param max_queue: Maximal number of queued results.
+        :param policy: Policy applied when the queue is full - "block", "drop" or "coalesce".
+        """
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown policy {}".format(policy))
+        if max_queue < 1:
+            raise ValueError("max_queue must be positive")
+        self.callback = callback
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_queue = max_queue
+        self.policy = policy
+        self.dropped = 0  # number of results discarded by "drop" policy
+        self.coalesced = 0  # number of results replaced by "coalesce" policy
+        self.last_error = None  # the last exception raised by the callback
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._delivering = False
+        self._flushing = 0
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="callback-dispatcher", daemon=True)
+        self._thread.start()
+
+    @property
+    def batching(self):
+        return self.batch_size is not None or self.interval is not None
+
+    def __call__(self, result):
+        """Queues the result for delivery. Returns without waiting for the callback (unless the queue is full)."""
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Dispatcher is closed")
+            while len(self._queue) >= self.max_queue:
+                if self.policy == "drop":
+                    self.dropped += 1
+                    return
+                if self.policy == "coalesce":
+                    self._queue[-1] = result
+                    self.coalesced += 1
+                    return
+                self._condition.wait()
+            self._queue.append(result)
+            self._condition.notify_all()
+
+    def _collect(self):
+        """Waits for the next result or batch. Returns None when the dispatcher is closed and drained."""
+        with self._condition:
+            while not self._queue and not self._closed:
+                self._condition.wait()
+            if not self._queue:
+                return None
+            if not self.batching:
+                item = self._queue.popleft()
+            else:
+                deadline = None if self.interval is None else time.monotonic() + self.interval
+                while not self._closed and not self._flushing and (
+                        self.batch_size is None or len(self._queue) < self.batch_size):
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                count = len(self._queue) if self.batch_size is None else min(self.batch_size, len(self._queue))
+                item = [self._queue.popleft() for _ in range(count)]
+            self._delivering = True
+            self._condition.notify_all()
+            return item
+
+    def _run(self):
+        while True:
+            item = self._collect()
+            if item is None:
+                return
+            try:
+                self.callback(item)
+            except Exception as ex:
+                self.last_error = ex
+            finally:
+                with self._condition:
+                    self._delivering = False
+                    self._condition.notify_all()
+
+    def flush(self):
+        """Blocks until all queued results are delivered (incomplete batches are delivered immediately)."""
+        with self._condition:
+            self._flushing += 1
+            self._condition.notify_all()
+            try:
+                while self._queue or self._delivering:
+                    self._condition.wait()
+            finally:
+                self._flushing -= 1
+
+    def close(self):
+        """Delivers all queued results and stops the dispatcher thread."""
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
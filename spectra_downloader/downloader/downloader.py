@@ -1,9 +1,14 @@
 from ..ssap_parser import parser
 import requests
-from concurrent.futures import ThreadPoolExecutor
-from .exceptions import DownloadException, SaveException, DataLinkUnavailableException
+from .exceptions import DownloadException, DataLinkUnavailableException, VerificationException, DeferredException
+from .sync import MirrorSync
+from .storage import DirectoryStorage
+from .dispatch import CallbackDispatcher
+from .scheduler import Scheduler
+from .verification import FITS_BLOCK
 import os
-from urllib.parse import quote
+import time
+from urllib.parse import quote, urlsplit
 
 # known DataLink Content-Type mappings
 EXTENSIONS = {
@@ -23,7 +28,7 @@ class DownloadResult:
     about spectrum final name, download link, exception in case of download failure.
     """
 
-    def __init__(self, name, url, exception=None):
+    def __init__(self, name, url, exception=None, spectrum=None, verification=None):
         """
         Initializes instance by passed arguments.
         :param name: Final expected name of spectrum on the filesystem.
@@ -31,10 +36,16 @@ class DownloadResult:
         :param exception: Exception that was thrown during spectrum download process.
         The exception signalizes the download failed. If None is passed spectrum is considered
         as successfully downloaded.
+        :param spectrum: Record instance of the downloaded spectrum.
+        :param verification: List of VerificationResult instances of checks done while downloading (if any).
         """
         self.name = name
         self.url = url
         self.exception = exception
+        self.spectrum = spectrum
+        self.verification = verification
+        self.normalized = None  # path of normalized spectrum (if Normalizer is used)
+        self.normalization_error = None  # exception raised during normalization (if Normalizer is used)
 
     @property
     def success(self):
@@ -52,39 +63,112 @@ class SpectraDownloader:
     result of SSAP query.
     """
 
+    @staticmethod
+    def _parse(content, metrics, columns=None, predicate=None):
+        """Parses SSAP XML and reports parsing time to metrics hook (if any)."""
+        started = time.monotonic()
+        parsed = parser.parse_ssap(content, columns, predicate)
+        if metrics is not None:
+            metrics.parse_time(time.monotonic() - started)
+        return parsed
+
     @classmethod
-    def from_file(cls, file):
+    def from_file(cls, file, metrics=None, columns=None, predicate=None):
         """
         Creates new instance of SpectraDownloader by parsing specified file.
-        :param file: File containing SSAP XML.
+        :param file: File containing SSAP XML. The file may be compressed by gzip, bzip2, xz or zstd, it is
+        decompressed while parsing.
+        :param metrics: Optional MetricsHook instance receiving events of parsing and downloading.
+        :param columns: Optional names or utypes of columns kept while parsing (see parse_ssap).
+        :param predicate: Optional function selecting rows while parsing (see parse_ssap).
         :return: SpectraDownloader constructed instance.
         """
-        with open(file, "r") as f:
-            content = f.read()
-        return cls(parser.parse_ssap(content))
+        with open(file, "rb") as f:
+            parsed = cls._parse(f, metrics, columns, predicate)
+        return cls(parsed, metrics=metrics)
 
     @classmethod
-    def from_string(cls, string):
+    def from_string(cls, string, metrics=None, columns=None, predicate=None):
         """
         Creates new instance of SpectraDownloader by parsing passed string.
         :param string: String containing the SSAP XML - result of SSAP query.
+        :param metrics: Optional MetricsHook instance receiving events of parsing and downloading.
+        :param columns: Optional names or utypes of columns kept while parsing (see parse_ssap).
+        :param predicate: Optional function selecting rows while parsing (see parse_ssap).
         :return: SpectraDownloader constructed instance.
         """
-        return cls(parser.parse_ssap(string))
+        return cls(cls._parse(string, metrics, columns, predicate), metrics=metrics)
 
     @classmethod
-    def from_link(cls, http_link):
+    def from_link(cls, http_link, metrics=None, columns=None, predicate=None, timeout=5):
         """
-        Creates new instance of SpectraDownloader by doing SSAP query and parsing the downloaded results.
+        Creates new instance of SpectraDownloader by doing SSAP query and parsing the downloaded results. The response
+        is parsed as it arrives, gzip or deflate Content-Encoding and compressed bodies are decompressed on the fly.
         :param http_link: Constructed HTTP link of SSAP query.
+        :param metrics: Optional MetricsHook instance receiving events of parsing and downloading.
+        :param columns: Optional names or utypes of columns kept while parsing (see parse_ssap).
+        :param predicate: Optional function selecting rows while parsing (see parse_ssap).
+        :param timeout: Timeout of the query in seconds.
         :return: SpectraDownloader constructed instance.
         """
-        r = requests.get(http_link, timeout=5)
-        if r.status_code != 200:
-            raise IOError("Expected HTTP status code to be 200")
-        content = r.text
-        # try to parse content
-        return cls(parser.parse_ssap(content))
+        r = requests.get(http_link, stream=True, timeout=timeout)
+        try:
+            if r.status_code != 200:
+                raise IOError("Expected HTTP status code to be 200")
+            r.raw.decode_content = True  # undo Content-Encoding while reading
+            # try to parse content
+            parsed = cls._parse(r.raw, metrics, columns, predicate)
+        finally:
+            r.close()
+        return cls(parsed, metrics=metrics)
+
+    @classmethod
+    def from_paged_query(cls, query):
+        """
+        Creates new instance of SpectraDownloader by fetching all pages of SSAP query split by paging or range
+        partitioning. Pages are fetched concurrently and merged into one result.
+        :param query: Instance of PagedSSAPQuery or PartitionedSSAPQuery.
+        :return: SpectraDownloader constructed instance.
+        """
+        return cls(query.fetch())
+
+    @classmethod
+    def download_paged(cls, query, location, parameters=None, progress_callback=None, done_callback=None,
+                       result_log=None):
+        """
+        Fetches pages of SSAP query split by paging or range partitioning and downloads spectra of every page
+        as soon as the page arrives. Spectra are downloaded using ACC_REF direct method if parameters are None,
+        DataLink protocol otherwise. This method is blocking.
+        :param query: Instance of PagedSSAPQuery or PartitionedSSAPQuery.
+        :param location: String definition of location directory on filesystem where the spectra should be
+        downloaded to.
+        :param parameters: DataLink protocol parameters or None for direct download.
+        :param progress_callback: Function callback argument that will be called whenever downloading of ONE single
+        spectrum was finished. Function must take 1 - instance of DownloadResult class.
+        :param done_callback: Function callback argument that will be called when all pages were downloaded.
+        The function must take one boolean argument signalizing success of all downloads.
+        :param result_log: Optional ResultLog instance results of all pages are appended to.
+        :return: SpectraDownloader instance containing merged result of all pages. Its attribute
+        last_download_results contains results of all pages (unless result_log is used).
+        """
+        instance = None
+        results = list()
+        page_success = list()
+        for page in query.iter_pages():
+            if instance is None:
+                instance = cls(page, result_log=result_log)
+            else:
+                instance.parsed_ssap.extend(page)
+            if len(page.rows) == 0:
+                continue
+            instance._spectra_download(page.rows, parameters, location, progress_callback,
+                                       page_success.append, False)
+            results.extend(instance.last_download_results)
+        instance.parsed_ssap.query_status = "OVERFLOW" if query.truncated else "OK"
+        instance.last_download_results = results
+        if done_callback is not None:
+            done_callback(all(page_success))
+        return instance
 
     @staticmethod
     def _file_name(link):
@@ -101,22 +185,65 @@ class SpectraDownloader:
     def _file_name_without_extension(link):
         return SpectraDownloader._file_name(link).split('.')[0]
 
-    def __init__(self, parsed_ssap):
+    def __init__(self, parsed_ssap, timeout=5, rate_limiter=None, metrics=None, mirrors=None, hedging=None,
+                 concurrency=None, verifiers=None, normalizer=None, storage=None, result_log=None,
+                 scheduler=None, partial=None):
+        """
+        Initializes downloader of spectra listed in the parsed SSAP result.
+        :param parsed_ssap: Instance of IndexedSSAPVotable.
+        :param timeout: Timeout of HTTP requests in seconds.
+        :param rate_limiter: Optional RateLimiter instance shared by all downloads to limit request rate.
+        :param metrics: Optional MetricsHook instance receiving instrumentation events of downloading.
+        :param mirrors: Optional MirrorSelector instance with alternative sources of spectra. If set, every spectrum
+        is downloaded from the fastest healthy mirror with automatic failover to the other ones.
+        :param hedging: Optional HedgingPolicy instance. If set, slow requests are duplicated (to the next mirror if
+        mirrors are set) and the first response is used.
+        :param concurrency: Optional AIMDController instance limiting number of concurrent requests per host. It is
+        useful when the instance (or several instances sharing the controller) is used from several threads.
+        :param verifiers: Optional list of Verifier instances checking integrity of every spectrum while it is
+        streamed to the file. Spectra failing some check are removed and reported as failed downloads.
+        :param normalizer: Optional Normalizer instance converting downloaded spectra into memory-mappable arrays
+        on a process pool. Progress callback is then invoked once the spectrum is normalized.
+        :param storage: Optional Storage instance spectra are written to (e.g. BundleStorage appending spectra into
+        tar or zip bundles). DirectoryStorage writing one file per spectrum is used if None. Normalizer and sync
+        require storage writing separate files, ValueError is raised otherwise.
+        :param result_log: Optional ResultLog instance. If set, results of downloads are appended to the log on disk
+        instead of being collected in attribute last_download_results.
+        :param scheduler: Optional Scheduler instance shared by several SpectraDownloader instances. All downloads of
+        this instance are run by it. Own scheduler with one worker is used if None.
+        :param partial: Optional PartialFetch instance. If set, only selected HDUs (or only headers) of FITS spectra
+        are downloaded using HTTP Range requests. Verifiers and hedging are not used for partial downloads.
+        """
         if parsed_ssap is None:
             raise ValueError("Passed indexed SSAP table is invalid")
         self.parsed_ssap = parsed_ssap
+        self.timeout = timeout
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.mirrors = mirrors
+        self.hedging = hedging
+        self.concurrency = concurrency
+        self.verifiers = list(verifiers) if verifiers is not None else list()
+        self.normalizer = normalizer
+        self.storage = storage if storage is not None else DirectoryStorage()
+        self._check_storage()
+        self.result_log = result_log
+        self.scheduler = scheduler if scheduler is not None else Scheduler()
+        self.partial = partial
         self.last_download_results = list()
 
-    def _construct_datalink_url(self, spectrum, parameters):
-        """Constructs URL for DataLink downloading using passed spectrum and parameters."""
-        result = self.parsed_ssap.datalink_resource_url
+    def _construct_datalink_url(self, spectrum, parameters, votable=None):
+        """Constructs URL for DataLink downloading using passed spectrum and parameters. The spectrum is taken from
+        parsed SSAP result of this instance unless a different votable (e.g. of mirror archive) is passed."""
+        ssap = self.parsed_ssap if votable is None else votable
+        result = ssap.datalink_resource_url
         prepend_amp = False
         if not result[-1] == "?":
             result += "?"
         for key, val in parameters.items():
             if key.lower() == "id":
                 # this must be replaced for PUBDID column
-                pubdid = self.parsed_ssap.get_pubdid(spectrum)
+                pubdid = ssap.get_pubdid(spectrum)
                 val = quote(pubdid, safe='')
                 id_set = True
             else:
@@ -129,9 +256,9 @@ class SpectraDownloader:
         # set id
         id_set = False
         # find name of argument in SSAP definition
-        for param in self.parsed_ssap.datalink_input_params:
+        for param in ssap.datalink_input_params:
             if param.id_param:
-                pubdid = self.parsed_ssap.get_pubdid(spectrum)
+                pubdid = ssap.get_pubdid(spectrum)
                 val = quote(pubdid, safe='')
                 if prepend_amp:
                     result += "&"
@@ -143,66 +270,283 @@ class SpectraDownloader:
             raise DataLinkUnavailableException("Unable to find id parameter inside DataLink specification")
         return result
 
-    def _spectra_download(self, spectra, parameters, location, progress_callback=None, done_callback=None, async=True):
+    def _check_storage(self):
+        """Checks that features reading downloaded files are not combined with storage that does not write them."""
+        if self.normalizer is not None and not self.storage.files:
+            raise ValueError("Normalizer requires storage writing spectra into separate files")
+
+    def _prepare_download(self, spectra, parameters, location):
+        """Checks arguments of spectra downloading, creates target directory if necessary and prepares storage."""
+        # check that at least one spectrum was passed
+        if len(spectra) == 0:
+            raise ValueError("at least one spectrum must be passed")
+        self._check_storage()
+        # create target directory if it does not exist already
+        if not os.path.isdir(location):
+            os.makedirs(location)
+        self.storage.prepare(location)
+        # check that DataLink is truly available if parameters are passed
+        if parameters is not None and not self.parsed_ssap.datalink_available:
+            raise DataLinkUnavailableException("DataLink parameters were passed however DataLink is not available")
+
+    def _download_spectrum(self, session, spectrum, parameters, location):
+        """
+        Downloads single spectrum into the target directory using either ACC_REF (parameters are None) or DataLink
+        protocol. Download failures are not raised but passed in the result.
+        :param session: HTTP session (requests.Session instance) used for downloading.
+        :param spectrum: Record instance of the spectrum.
+        :param parameters: DataLink protocol parameters or None for direct download.
+        :param location: String definition of target directory.
+        :return: Instance of DownloadResult representing the spectrum download result.
+        """
+        if parameters is None:
+            # use ACC_REF
+            # find out acc_ref link
+            url = self.parsed_ssap.get_accref(spectrum)
+            file_name = self._file_name(url)
+        else:
+            # use DataLink
+            url = self._construct_datalink_url(spectrum, parameters)
+            file_name = self._file_name_without_extension(self.parsed_ssap.get_accref(spectrum))
+        if self.mirrors is not None:
+            result = self._download_mirrored(session, spectrum, parameters, location, url, file_name)
+        else:
+            try:
+                file_name, verification, url = self._fetch(session, url, file_name, parameters is not None,
+                                                           location, keys=self._spectrum_keys(spectrum))
+                result = DownloadResult(file_name, url, spectrum=spectrum, verification=verification)
+            except DeferredException:
+                raise
+            except Exception as ex:
+                # pass exception to the result
+                result = DownloadResult(file_name, url, ex, spectrum, getattr(ex, "results", None))
+        if self.metrics is not None:
+            self.metrics.download_finished(result)
+        return result
+
+    def _mirror_urls(self, spectrum, parameters, url):
+        """Returns list of all known URLs of the spectrum - the passed one and URLs of its mirrors."""
+        urls = [url]
+        for votable, row in self.mirrors.sources(self.parsed_ssap.get_pubdid(spectrum)):
+            if parameters is None:
+                mirror_url = votable.get_accref(row)
+            elif votable.datalink_available:
+                mirror_url = self._construct_datalink_url(row, parameters, votable)
+            else:
+                continue
+            if mirror_url and mirror_url not in urls:
+                urls.append(mirror_url)
+        return urls
+
+    def _download_mirrored(self, session, spectrum, parameters, location, url, file_name):
+        """
+        Downloads the spectrum from the fastest healthy mirror. If the download fails because of network or HTTP
+        error, the next mirror is used. Only errors telling something about the mirror (connection errors, timeouts,
+        5xx and 429 responses, corrupted data) count as its failures, e.g. 404 of a spectrum missing in one archive
+        does not. Errors of saving the file are not retried. Statistics are recorded for the mirror that actually
+        served the response (it differs from the requested one if hedged request won).
+        """
+        result = None
+        deferred = None
+        ranked = self.mirrors.rank(self._mirror_urls(spectrum, parameters, url))
+        for index, mirror_url in enumerate(ranked):
+            # the next mirror is used for hedged request (if hedging is enabled)
+            alternate_url = ranked[index + 1] if index + 1 < len(ranked) else None
+            started = time.monotonic()
+            try:
+                final_name, verification, served_url = self._fetch(session, mirror_url, file_name,
+                                                                   parameters is not None, location, alternate_url,
+                                                                   self._spectrum_keys(spectrum))
+            except DeferredException as ex:
+                # mirror is busy, try the next one
+                deferred = ex
+                continue
+            except (DownloadException, VerificationException, requests.RequestException) as ex:
+                # corrupted transfer is handled as failure of the mirror too
+                failed_url = getattr(ex, "url", None) or mirror_url
+                status_code = getattr(ex, "status_code", None)
+                if status_code is None or status_code == 429 or status_code >= 500:
+                    self.mirrors.record_failure(failed_url)
+                result = DownloadResult(file_name, failed_url, ex, spectrum, getattr(ex, "results", None))
+                continue
+            except Exception as ex:
+                return DownloadResult(file_name, mirror_url, ex, spectrum)
+            size = self.storage.size(location, final_name)
+            self.mirrors.record_success(served_url, time.monotonic() - started, size)
+            return DownloadResult(final_name, served_url, spectrum=spectrum, verification=verification)
+        if deferred is not None:
+            # all healthy mirrors are busy or failed - try again later
+            raise deferred
+        return result
+
+    def _spectrum_keys(self, spectrum):
+        """Returns identifiers of the spectrum stored by storages supporting them."""
+        return {"accref": self.parsed_ssap.get_accref(spectrum), "pubdid": self.parsed_ssap.get_pubdid(spectrum)}
+
+    @staticmethod
+    def _datalink_file_name(file_name, headers):
+        """Extends name of DataLink downloaded file by suffix corresponding to the returned Content-Type."""
+        ctype = headers.get("content-type")
+        if ctype is not None:
+            ctype = ctype.split(";")[0]  # just to be sure to have only plain content type
+            suffix = EXTENSIONS.get(ctype)
+            if suffix is not None:
+                file_name += ".{}".format(suffix)
+        return file_name
+
+    def _fetch_partial(self, reader, file_name, datalink, location, keys):
+        """Downloads selected parts of FITS spectrum using the range reader (see PartialFetch)."""
+        # the first request tells the Content-Type
+        reader.read(0, FITS_BLOCK)
+        if datalink:
+            file_name = self._datalink_file_name(file_name, reader.headers)
+        writer = self.storage.create(location, file_name, keys)
+        try:
+            self.partial.transfer(reader, writer.write)
+        except BaseException:
+            writer.abort()
+            raise
+        writer.commit()
+        return writer.name
+
+    def _fetch(self, session, url, file_name, datalink, location, alternate_url=None, keys=None):
+        """
+        Downloads content of the passed URL into the target directory.
+        :param session: HTTP session used for downloading.
+        :param url: URL of the spectrum.
+        :param file_name: Name of the target file. In case of DataLink download the name is extended by suffix
+        corresponding to the returned Content-Type.
+        :param datalink: True if URL is DataLink request.
+        :param location: String definition of target directory.
+        :param alternate_url: Alternative URL of the same spectrum used for hedged request.
+        :param keys: Dictionary of spectrum identifiers passed to the storage.
+        :return: Tuple of final name of the downloaded file (relative to location), list of VerificationResult
+        instances (None if no verifiers are set) and URL that served the data (alternate URL if hedged request won).
+        VerificationException is raised (and the file removed) if some verification fails.
+        """
+        metrics = self.metrics
+        host = urlsplit(url).netloc
+        status_code = None
+        size = 0
+        abandoned = list()  # hosts of sent requests whose responses were not used (lost hedged requests)
+        if self.concurrency is not None and not self.concurrency.try_acquire(host):
+            # do not block the worker, the scheduler runs other downloads meanwhile
+            raise DeferredException("Host {} is at its concurrency limit".format(host))
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+        if metrics is not None:
+            metrics.request_started(host)
+        started = time.monotonic()
+        try:
+            if self.partial is not None:
+                reader = self.partial.open(session, url, self.timeout)
+                try:
+                    return self._fetch_partial(reader, file_name, datalink, location, keys), None, url
+                finally:
+                    reader.close()
+                    status_code = reader.status_code
+                    size = reader.received
+                    if metrics is not None:
+                        metrics.bytes_received(host, reader.received)
+            # invoke http get
+            if self.hedging is None:
+                r = session.get(url, stream=True, timeout=self.timeout)
+            else:
+                r, url = self.hedging.get(session, url, self.timeout, alternate_url,
+                                          lambda hedge_url: self._reserve_hedge(hedge_url, abandoned))
+                # statistics belong to the host that served the response
+                abandoned.append(host)
+                host = urlsplit(url).netloc
+                abandoned.remove(host)
+            status_code = r.status_code
+            if r.status_code != 200:
+                # bad status code - raise exception
+                raise DownloadException("Unexpected HTTP status code {} for URL: {}".format(r.status_code, url), url,
+                                        r.status_code)
+            # specify file_name if DataLink
+            if datalink:
+                file_name = self._datalink_file_name(file_name, r.headers)
+            writer = self.storage.create(location, file_name, keys)
+            stages = [verifier.begin(r, file_name) for verifier in self.verifiers]
+            try:
+                for chunk in r.iter_content(1024):
+                    writer.write(chunk)
+                    size += len(chunk)
+                    for stage in stages:
+                        stage.update(chunk)
+                    if metrics is not None:
+                        metrics.bytes_received(host, len(chunk))
+                verification = [stage.finish() for stage in stages] if stages else None
+                failed = [check for check in verification or list() if not check.ok]
+                if failed:
+                    raise VerificationException("Verification of {} failed: {}".format(
+                        url, "; ".join("{} - {}".format(check.check, check.message) for check in failed)),
+                        verification, url)
+            except BaseException:
+                # do not leave incomplete or corrupted spectrum behind
+                writer.abort()
+                raise
+            writer.commit()
+            return writer.name, verification, url
+        finally:
+            elapsed = time.monotonic() - started
+            if metrics is not None:
+                metrics.request_finished(host, status_code, elapsed)
+            if self.concurrency is not None:
+                self.concurrency.release(host, status_code, elapsed, size)
+            for other in abandoned:
+                if metrics is not None:
+                    metrics.request_abandoned(other)
+                if self.concurrency is not None:
+                    self.concurrency.cancel(other)
+
+    def _reserve_hedge(self, url, hosts):
+        """
+        Takes concurrency slot of the host of hedged request and rate limit token without blocking. Returns False if
+        the hedged request must not be sent. Host of the reserved request is appended to the passed list.
+        """
+        host = urlsplit(url).netloc
+        if self.concurrency is not None and not self.concurrency.try_acquire(host):
+            return False
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+            if self.concurrency is not None:
+                self.concurrency.cancel(host)
+            return False
+        if self.metrics is not None:
+            self.metrics.request_started(host)
+        hosts.append(host)
+        return True
+
+    def _spectra_download(self, spectra, parameters, location, progress_callback=None, done_callback=None, async=True,
+                          priority=0):
         """
         Generic method for spectra downloading using either ACC_REF or DataLink protocol. If parameters are None
         direct download will be used. DataLink otherwise.
         See download_direct or download_datalink for more info.
         """
+        failed = list()  # indexes of failed downloads
+        normalizations = list()
 
-        def process_download():
+        def download(session, index):
             """
-            This function goes through all passed spectra and it tries to
-            download them into specified target directory. If progress callback are defined appropriate function
-            is invoked.
-            :return: If all spectra are successfully downloaded the function returns True. If at least
-            one spectrum was downloaded with exception it returns False.
+            This function tries to download one of the passed spectra into specified target directory. It is run
+            by the scheduler. If progress callback is defined appropriate function is invoked.
+            :return: Instance of DownloadResult or None if results are written to result log.
             """
-            success = True  # flag signalizing success in all downloads
-            download_results = list()
-            session = requests.session()
-            for spectrum in spectra:
-                if parameters is None:
-                    # use ACC_REF
-                    # find out acc_ref link
-                    url = self.parsed_ssap.get_accref(spectrum)
-                    file_name = self._file_name(url)
-                else:
-                    # use DataLink
-                    url = self._construct_datalink_url(spectrum, parameters)
-                    file_name = self._file_name_without_extension(self.parsed_ssap.get_accref(spectrum))
-                try:
-                    # invoke http get
-                    r = session.get(url, stream=True, timeout=5)
-                    if r.status_code == 200:
-                        # specify file_name if DataLink
-                        if parameters is not None:
-                            ctype = r.headers.get("content-type")
-                            if ctype is not None:
-                                ctype = ctype.split(";")[0]  # just to be sure to have only plain content type
-                                suffix = EXTENSIONS.get(ctype)
-                                if suffix is not None:
-                                    file_name += ".{}".format(suffix)
-                        final_path = os.path.join(location, file_name)
-                        if os.path.isfile(final_path):
-                            raise SaveException("File {} already exists".format(final_path))
-                        with open(final_path, "wb") as f:
-                            for chunk in r.iter_content(1024):
-                                f.write(chunk)
-                        result = DownloadResult(file_name, url)
-                        download_results.append(result)
-                        invoke_progress_callback(result)
-                    else:
-                        # bad status code - raise exception
-                        raise DownloadException("Unexpected HTTP status code {} for URL: {}".format(r.status_code, url))
-                        # pass exception to progress callback
-                except Exception as ex:
-                    success = False
-                    result = DownloadResult(file_name, url, ex)
-                    download_results.append(result)
-                    invoke_progress_callback(result)
-            self.last_download_results = download_results
-            return success
+            spectrum = spectra[index]
+            if self.metrics is not None:
+                self.metrics.queue_depth(len(spectra) - index)
+            result = self._download_spectrum(session, spectrum, parameters, location)
+            if not result.success:
+                failed.append(index)
+            if self.result_log is not None:
+                self.result_log.record(result, self._spectrum_keys(spectrum))
+            if self.normalizer is not None and result.success:
+                # progress callback is invoked after normalization
+                normalizations.append(self.normalizer.submit(result, location, invoke_progress_callback))
+            else:
+                invoke_progress_callback(result)
+            return result if self.result_log is None else None
 
         def invoke_progress_callback(result):
             """
@@ -212,56 +556,54 @@ class SpectraDownloader:
             if progress_callback is not None:
                 progress_callback(result)
 
-        def invoke_done_callback(fut):
-            """Helper function for utilizing done_callback (if any)."""
-            success = fut.result()
+        def finish(job):
+            """Called by the scheduler when all spectra of the job were processed."""
+            for finished in normalizations:
+                finished.wait()
+            if isinstance(progress_callback, CallbackDispatcher):
+                # done callback must follow delivery of all results
+                progress_callback.flush()
+            # all spectra are successfully downloaded if none failed and none was skipped
+            job.success = not failed and not job.cancelled and job.exception is None
+            self.last_download_results = [result for result in job.results if result is not None]
             if done_callback is not None:
-                done_callback(success)
+                done_callback(job.success)
 
-        # check that at least one spectrum was passed
-        if len(spectra) == 0:
-            raise ValueError("at least one spectrum must be passed")
-        # create target directory if it does not exist already
-        if not os.path.isdir(location):
-            os.makedirs(location)
-        # check that DataLink is truly available if parameters are passed
-        if parameters is not None and not self.parsed_ssap.datalink_available:
-            raise DataLinkUnavailableException("DataLink parameters were passed however DataLink is not available")
+        self._prepare_download(spectra, parameters, location)
+        job = self.scheduler.submit(download, len(spectra), priority, finish)
+        if not async:
+            job.wait()
+        return job
 
-        # setup executor
-        if async:
-            executor = ThreadPoolExecutor(max_workers=1)
-            future = executor.submit(process_download)
-            future.add_done_callback(invoke_done_callback)
-        else:
-            success = process_download()
-            if done_callback is not None:
-                done_callback(success)
-
-    def download_direct(self, spectra, location, progress_callback=None, done_callback=None, async=True):
+    def download_direct(self, spectra, location, progress_callback=None, done_callback=None, async=True, priority=0):
         """
         Download selected spectra to the target location on filesystem. This method is implicitly non-blocking.
-        Downloading process takes a place in a separate thread. This behaviour can be changed by setting argument
-        async to False.
+        Downloading process takes a place in threads of the scheduler. This behaviour can be changed by setting
+        argument async to False.
         :param spectra: Non-empty list of Record instances. Spectra to be downloaded.
         :param location: String definition of location directory on filesystem where the spectra should be
         downloaded to.
         :param progress_callback: Function callback argument that will be called whenever downloading of ONE single
         spectrum was finished (either with state OK or ERROR). Function must take 1 - instance of DownloadResult
         class representing the result of spectrum download.
+        Pass CallbackDispatcher wrapping the callback to call it on a separate thread.
         :param done_callback: Function callback argument that will be called when the downloading process was finished.
         The function must take one boolean argument. This argument will be set to True if all spectra have been
         downloaded successfully. False otherwise.
         :param async: If True, the downloading process takes place in a separate thread. If False, method is blocking
-        and executed in a same thread as a caller.
+        until all spectra are downloaded.
+        :param priority: Priority of the downloads in the scheduler - higher priority downloads are served first,
+        downloads of the same priority share the scheduler workers fairly.
+        :return: DownloadJob instance - handle of the downloads with their results.
         """
-        self._spectra_download(spectra, None, location, progress_callback, done_callback, async)
+        return self._spectra_download(spectra, None, location, progress_callback, done_callback, async, priority)
 
-    def download_datalink(self, spectra, parameters, location, progress_callback=None, done_callback=None, async=True):
+    def download_datalink(self, spectra, parameters, location, progress_callback=None, done_callback=None, async=True,
+                          priority=0):
         """
         Download selected spectra to the target directory on filesystem. This method is implicitly non-blocking.
-        Downloading process takes a place in a separate thread. This behaviour can be changed by setting argument
-        async to False.
+        Downloading process takes a place in threads of the scheduler. This behaviour can be changed by setting
+        argument async to False.
         :param spectra: Non-empty list of Record instances. Selected spectra to be downloaded.
         :param parameters: DataLink protocol parameters corresponding to the definition in SSAP definition. Note that
         despite id parameter can be specified here, this parameter will not be used and instead it will be dynamically
@@ -271,10 +613,38 @@ class SpectraDownloader:
         :param progress_callback: Function callback argument that will be called whenever downloading of ONE single
         spectrum was finished (either with stage OK or ERROR). Function must take 1 - instance of DownloadResult
         class representing the result of spectrum download.
+        Pass CallbackDispatcher wrapping the callback to call it on a separate thread.
         :param done_callback: Function callback argument that will be called when the downloading process was finished.
         The function must take oe boolean argument. This argument will be set to True if all spectra have been
         downloaded successfully. False otherwise.
         :param async: If True, the downloading process takes place in a separate thread. If False, method is blocking
-        and executed in a same thread as a caller.
+        until all spectra are downloaded.
+        :param priority: Priority of the downloads in the scheduler - higher priority downloads are served first,
+        downloads of the same priority share the scheduler workers fairly.
+        :return: DownloadJob instance - handle of the downloads with their results.
+        """
+        return self._spectra_download(spectra, parameters, location, progress_callback, done_callback, async,
+                                      priority)
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Shuts down scheduler of the instance (see Scheduler.shutdown). Note that the scheduler may be shared with
+        other instances.
+        """
+        self.scheduler.shutdown(wait, cancel)
+
+    def sync(self, location, spectra=None, parameters=None, prune=False, progress_callback=None):
+        """
+        Synchronizes local mirror directory with spectra of the parsed SSAP result. Only spectra that are not present
+        in the mirror yet or whose SSAP record changed since the last sync are downloaded. This method is blocking.
+        :param location: String definition of mirror directory on filesystem.
+        :param spectra: List of Record instances to be mirrored. All rows of parsed SSAP result are used if None.
+        :param parameters: DataLink protocol parameters or None for direct download.
+        :param prune: If True, files of spectra that are no longer listed are removed from the mirror.
+        :param progress_callback: Function callback that will be called whenever downloading of ONE single
+        spectrum was finished. Function must take 1 - instance of DownloadResult class.
+        :return: SyncReport instance describing the differences found and resolved.
         """
-        self._spectra_download(spectra, parameters, location, progress_callback, done_callback, async)
+        if spectra is None:
+            spectra = self.parsed_ssap.rows
+        return MirrorSync(self, location).sync(spectra, parameters, prune, progress_callback)
@@ -1,5 +1,8 @@
 class DownloadException(Exception):
-    pass
+    def __init__(self, message, url=None, status_code=None):
+        super().__init__(message)
+        self.url = url  # URL of the failed request (if known)
+        self.status_code = status_code  # HTTP status code of unexpected response (if any)
 
 
 class SaveException(Exception):
@@ -8,3 +11,18 @@ class SaveException(Exception):
 
 class DataLinkUnavailableException(Exception):
     pass
+
+
+class VerificationException(Exception):
+    def __init__(self, message, results, url=None):
+        super().__init__(message)
+        self.results = results
+        self.url = url  # URL the verified data were downloaded from
+
+
+class DeferredException(Exception):
+    """Raised by a download that can not start now (e.g. its host is at the concurrency limit) to be run later."""
+
+    def __init__(self, message, delay=0.05):
+        super().__init__(message)
+        self.delay = delay  # seconds before the download is tried again
@@ -0,0 +1,126 @@
+import collections
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait, TimeoutError as FutureTimeoutError
+
+
+class HedgingPolicy:
+    """
+    Policy of hedged HTTP requests. If the response headers of a request do not arrive until the given percentile
+    of recently observed times to first byte, a duplicate request (to the same or alternate URL) is started and
+    the first response is used. The other request is abandoned and its response closed as soon as it arrives.
+    The number of duplicate requests is limited by budget - a fraction of all issued requests.
+    """
+
+    def __init__(self, percentile=0.95, budget=0.05, initial_delay=1.0, min_delay=0.05, window=200,
+                 min_samples=20, max_workers=32):
+        """
+        :param percentile: Percentile of observed times to first byte used as hedging delay.
+        :param budget: Maximal number of duplicate requests as a fraction of all requests.
+        :param initial_delay: Hedging delay in seconds used until min_samples observations are collected.
+        :param min_delay: Lower bound of hedging delay in seconds.
+        :param window: Number of the most recent observations the percentile is computed from.
+        :param min_samples: Number of observations required for adaptive delay.
+        :param max_workers: Maximal number of concurrently running requests of the policy.
+        """
+        if not 0 < percentile < 1:
+            raise ValueError("percentile must be between 0 and 1")
+        self.percentile = percentile
+        self.budget = budget
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.requests = 0
+        self.hedges = 0
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def delay(self):
+        """Returns current hedging delay in seconds."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(self._samples)
+        index = min(int(self.percentile * len(ordered)), len(ordered) - 1)
+        return max(ordered[index], self.min_delay)
+
+    def record(self, seconds):
+        """Records observed time to first byte."""
+        with self._lock:
+            self._samples.append(seconds)
+
+    def _try_hedge(self):
+        """Reserves one duplicate request from the budget. Returns False if the budget is exhausted."""
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _refund_hedge(self):
+        with self._lock:
+            self.hedges -= 1
+
+    def get(self, session, url, timeout, alternate_url=None, reserve=None):
+        """
+        Issues hedged streaming GET request.
+        :param session: HTTP session used for requests.
+        :param url: Requested URL.
+        :param timeout: Timeout of the requests in seconds.
+        :param alternate_url: URL used for the duplicate request (e.g. mirror of the spectrum). The same URL is used
+        if None.
+        :param reserve: Function called with URL of the duplicate request before it is sent (e.g. to take rate limit
+        token and concurrency slot of its host). If it returns False, no duplicate request is sent.
+        :return: Tuple of the first received response and the URL it belongs to.
+        """
+        with self._lock:
+            self.requests += 1
+        started = time.monotonic()
+        primary = self._executor.submit(session.get, url, stream=True, timeout=timeout)
+        try:
+            response = primary.result(timeout=self.delay())
+            self.record(time.monotonic() - started)
+            return response, url
+        except FutureTimeoutError:
+            pass
+        hedge_url = url if alternate_url is None else alternate_url
+        hedging = self._try_hedge()
+        if hedging and reserve is not None and not reserve(hedge_url):
+            self._refund_hedge()
+            hedging = False
+        if not hedging:
+            response = primary.result()
+            self.record(time.monotonic() - started)
+            return response, url
+        hedge = self._executor.submit(session.get, hedge_url, stream=True, timeout=timeout)
+        urls = {primary: url, hedge: hedge_url}
+        pending = set(urls)
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                response = future.result()
+                if response.status_code >= 500 and pending:
+                    # server error - prefer the other request if it is still running
+                    response.close()
+                    continue
+                self.record(time.monotonic() - started)
+                for other in urls:
+                    if other is not future:
+                        other.add_done_callback(_close_response)
+                return response, urls[future]
+        raise error
+
+    def shutdown(self):
+        """Releases threads of the policy."""
+        self._executor.shutdown(wait=False)
+
+
+def _close_response(future):
+    """Closes response of abandoned request so its connection is released."""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
@@ -0,0 +1,256 @@
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+PROMETHEUS_PREFIX = "spectra_downloader"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class MetricsHook:
+    """
+    Instrumentation hook of the download engine. Every method is a no-op so custom hooks can override only
+    the events they are interested in. Methods may be called from several threads at once.
+    """
+
+    def request_started(self, host):
+        """Called when HTTP request to the host is initiated."""
+        pass
+
+    def bytes_received(self, host, count):
+        """Called whenever a chunk of spectrum data is received from the host."""
+        pass
+
+    def request_finished(self, host, status_code, elapsed):
+        """
+        Called when request to the host is finished (including download of the content).
+        :param host: Host name of the request.
+        :param status_code: HTTP status code or None if request failed without response.
+        :param elapsed: Duration of the request in seconds.
+        """
+        pass
+
+    def request_abandoned(self, host):
+        """Called instead of request_finished when response of the request is not used (e.g. lost hedged request)."""
+        pass
+
+    def download_finished(self, result):
+        """Called with DownloadResult instance whenever downloading of one spectrum is finished."""
+        pass
+
+    def queue_depth(self, depth):
+        """Called with number of spectra waiting for download."""
+        pass
+
+    def parse_time(self, seconds):
+        """Called with duration of SSAP VOTable parsing."""
+        pass
+
+
+class CompositeHook(MetricsHook):
+    """Hook forwarding all events to several other hooks."""
+
+    def __init__(self, *hooks):
+        self.hooks = hooks
+
+    def request_started(self, host):
+        for hook in self.hooks:
+            hook.request_started(host)
+
+    def bytes_received(self, host, count):
+        for hook in self.hooks:
+            hook.bytes_received(host, count)
+
+    def request_finished(self, host, status_code, elapsed):
+        for hook in self.hooks:
+            hook.request_finished(host, status_code, elapsed)
+
+    def request_abandoned(self, host):
+        for hook in self.hooks:
+            hook.request_abandoned(host)
+
+    def download_finished(self, result):
+        for hook in self.hooks:
+            hook.download_finished(result)
+
+    def queue_depth(self, depth):
+        for hook in self.hooks:
+            hook.queue_depth(depth)
+
+    def parse_time(self, seconds):
+        for hook in self.hooks:
+            hook.parse_time(seconds)
+
+
+class MetricsRegistry(MetricsHook):
+    """
+    Hook collecting counters and gauges of the download engine in memory. Collected values can be read as
+    a dictionary by snapshot method or rendered in Prometheus text format.
+    """
+
+    def __init__(self, rate_window=10):
+        """
+        :param rate_window: Length of the window in seconds used for computing current bytes per second.
+        """
+        self.rate_window = rate_window
+        self._lock = threading.Lock()
+        self.in_flight = collections.Counter()  # host -> number of running requests
+        self.requests = collections.Counter()  # (host, status) -> number of finished requests
+        self.request_seconds = collections.Counter()  # host -> total duration of finished requests
+        self.bytes = collections.Counter()  # host -> number of received bytes
+        self.succeeded = 0
+        self.failed = 0
+        self.queued = 0
+        self.parse_seconds = 0.0
+        self.parse_count = 0
+        self._buckets = collections.deque()  # [second, bytes] pairs for the rate window
+
+    def request_started(self, host):
+        with self._lock:
+            self.in_flight[host] += 1
+
+    def bytes_received(self, host, count):
+        second = int(time.monotonic())
+        with self._lock:
+            self.bytes[host] += count
+            if self._buckets and self._buckets[-1][0] == second:
+                self._buckets[-1][1] += count
+            else:
+                self._buckets.append([second, count])
+                while self._buckets[0][0] <= second - self.rate_window:
+                    self._buckets.popleft()
+
+    def request_finished(self, host, status_code, elapsed):
+        status = "error" if status_code is None else str(status_code)
+        with self._lock:
+            self.in_flight[host] -= 1
+            self.requests[(host, status)] += 1
+            self.request_seconds[host] += elapsed
+
+    def request_abandoned(self, host):
+        with self._lock:
+            self.in_flight[host] -= 1
+            self.requests[(host, "abandoned")] += 1
+
+    def download_finished(self, result):
+        with self._lock:
+            if result.success:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def queue_depth(self, depth):
+        self.queued = depth
+
+    def parse_time(self, seconds):
+        with self._lock:
+            self.parse_seconds += seconds
+            self.parse_count += 1
+
+    def bytes_per_second(self):
+        """Returns average download throughput over the last rate_window seconds."""
+        now = int(time.monotonic())
+        with self._lock:
+            received = sum(count for second, count in self._buckets if second > now - self.rate_window)
+        return received / self.rate_window
+
+    def snapshot(self):
+        """Returns dictionary with current values of all metrics."""
+        rate = self.bytes_per_second()
+        with self._lock:
+            return {
+                "in_flight": sum(self.in_flight.values()),
+                "in_flight_by_host": {host: count for host, count in self.in_flight.items() if count},
+                "requests": {"{} {}".format(host, status): count for (host, status), count in self.requests.items()},
+                "bytes": sum(self.bytes.values()),
+                "bytes_per_second": rate,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "queue_depth": self.queued,
+                "parse_seconds": self.parse_seconds,
+                "parse_count": self.parse_count
+            }
+
+    def render_prometheus(self):
+        """Returns all metrics in Prometheus text exposition format."""
+        rate = self.bytes_per_second()
+        lines = list()
+
+        def metric(name, kind, help_text, samples):
+            name = "{}_{}".format(PROMETHEUS_PREFIX, name)
+            lines.append("# HELP {} {}".format(name, help_text))
+            lines.append("# TYPE {} {}".format(name, kind))
+            for labels, value in samples:
+                label_text = ",".join('{}="{}"'.format(key, _escape(val)) for key, val in labels)
+                lines.append("{}{} {}".format(name, "{" + label_text + "}" if label_text else "", value))
+
+        with self._lock:
+            metric("requests_in_flight", "gauge", "Number of running HTTP requests.",
+                   [((("host", host),), count) for host, count in sorted(self.in_flight.items())])
+            metric("requests_total", "counter", "Number of finished HTTP requests by host and status code.",
+                   [((("host", host), ("status", status)), count)
+                    for (host, status), count in sorted(self.requests.items())])
+            metric("request_seconds_total", "counter", "Total duration of finished HTTP requests.",
+                   [((("host", host),), seconds) for host, seconds in sorted(self.request_seconds.items())])
+            metric("received_bytes_total", "counter", "Number of received bytes of spectra.",
+                   [((("host", host),), count) for host, count in sorted(self.bytes.items())])
+            metric("received_bytes_per_second", "gauge", "Current download throughput.", [((), rate)])
+            metric("downloads_total", "counter", "Number of finished spectra downloads by result.",
+                   [((("result", "success"),), self.succeeded), ((("result", "error"),), self.failed)])
+            metric("queue_depth", "gauge", "Number of spectra waiting for download.", [((), self.queued)])
+            metric("parse_seconds_total", "counter", "Total duration of SSAP VOTable parsing.",
+                   [((), self.parse_seconds)])
+            metric("parse_total", "counter", "Number of parsed SSAP VOTables.", [((), self.parse_count)])
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    """Escapes label value for Prometheus text format."""
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class PrometheusExporter:
+    """
+    Serves metrics of MetricsRegistry in Prometheus text format over HTTP on a local port. The server runs in
+    a daemon thread.
+    """
+
+    def __init__(self, registry, port=9464, host="127.0.0.1"):
+        """
+        :param registry: MetricsRegistry instance to be exported.
+        :param port: Port of the HTTP server, 0 chooses a free port.
+        :param host: Address the server listens on.
+        """
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    def start(self):
+        """Starts HTTP server. Metrics are available on any path (e.g. /metrics)."""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # do not pollute standard error output
+
+        self._server = HTTPServer((self.host, self.port), Handler)
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        """Stops HTTP server."""
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
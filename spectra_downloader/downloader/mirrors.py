@@ -0,0 +1,138 @@
+import collections
+import threading
+import time
+from urllib.parse import urlsplit
+import requests
+
+
+class HostStats:
+    """Learned statistics of one archive host."""
+
+    def __init__(self):
+        self.duration = None  # exponentially weighted average of download duration in seconds
+        self.throughput = None  # exponentially weighted average of bytes per second
+        self.latency = None  # exponentially weighted average of probe round-trip time in seconds
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.down_until = 0.0
+
+    def healthy(self, now):
+        """Returns True if the host is not suspended because of repeated failures."""
+        return self.down_until <= now
+
+
+class MirrorSelector:
+    """
+    This class groups alternative sources (mirrors) of the same spectrum found in several SSAP results by their
+    PUBDID and learns per-host download throughput. SpectraDownloader uses it to send every download to the fastest
+    healthy mirror and to fail over to other mirrors automatically when a download fails. Hosts failing repeatedly
+    are suspended for a cooldown period. Hosts without measured throughput are preferred so they get measured.
+    """
+
+    def __init__(self, failure_threshold=3, cooldown=60, smoothing=0.3):
+        """
+        :param failure_threshold: Number of consecutive failures after which the host is suspended.
+        :param cooldown: Suspension period of failing host in seconds.
+        :param smoothing: Weight of the newest observation in averages of duration, throughput and latency.
+        """
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self.hosts = collections.defaultdict(HostStats)
+        self._sources = collections.defaultdict(list)  # pubdid -> list of (votable, row)
+        self._lock = threading.Lock()
+
+    def add_votable(self, votable):
+        """
+        Registers all rows of parsed SSAP result as possible sources of spectra identified by their PUBDID.
+        :param votable: Instance of IndexedSSAPVotable.
+        """
+        for row in votable.rows:
+            pubdid = votable.get_pubdid(row)
+            if pubdid:
+                self._sources[pubdid].append((votable, row))
+
+    def sources(self, pubdid):
+        """Returns list of (votable, row) pairs registered for the PUBDID."""
+        return self._sources.get(pubdid, list())
+
+    @staticmethod
+    def host(url):
+        return urlsplit(url).netloc
+
+    def rank(self, urls):
+        """
+        Orders passed URLs from the most to the least preferred one. Suspended hosts are placed at the end, hosts
+        without measured throughput at the beginning (ordered by probe latency if known), the rest is ordered by
+        average throughput, so the ranking does not depend on sizes of the files hosts served.
+        :param urls: List of alternative URLs of one spectrum.
+        :return: New ordered list of URLs.
+        """
+        now = time.monotonic()
+        with self._lock:
+            def key(item):
+                position, url = item
+                stats = self.hosts[self.host(url)]
+                if stats.throughput is None:
+                    return not stats.healthy(now), False, stats.latency or 0.0, position
+                return not stats.healthy(now), True, -stats.throughput, position
+
+            return [url for _, url in sorted(enumerate(urls), key=key)]
+
+    def record_success(self, url, duration, size=None):
+        """Records successful download of size bytes from the URL host that took duration seconds."""
+        with self._lock:
+            stats = self.hosts[self.host(url)]
+            stats.successes += 1
+            stats.consecutive_failures = 0
+            stats.down_until = 0.0
+            stats.duration = self._average(stats.duration, duration)
+            if size is not None and duration > 0:
+                stats.throughput = self._average(stats.throughput, size / duration)
+
+    def record_latency(self, url, latency):
+        """Records successful probe of the URL host that took latency seconds."""
+        with self._lock:
+            stats = self.hosts[self.host(url)]
+            stats.consecutive_failures = 0
+            stats.down_until = 0.0
+            stats.latency = self._average(stats.latency, latency)
+
+    def record_failure(self, url):
+        """Records failed download from the URL host. Host is suspended after too many consecutive failures."""
+        with self._lock:
+            stats = self.hosts[self.host(url)]
+            stats.failures += 1
+            stats.consecutive_failures += 1
+            if stats.consecutive_failures >= self.failure_threshold:
+                stats.down_until = time.monotonic() + self.cooldown
+
+    def _average(self, current, value):
+        if current is None:
+            return value
+        return (1 - self.smoothing) * current + self.smoothing * value
+
+    def probe(self, timeout=5):
+        """
+        Measures latency of every known host by HEAD request to one of its spectra. Hosts that do not respond
+        are recorded as failed.
+        :param timeout: Timeout of probe requests in seconds.
+        """
+        probes = dict()
+        for sources in self._sources.values():
+            for votable, row in sources:
+                url = votable.get_accref(row)
+                if url:
+                    probes.setdefault(self.host(url), url)
+        session = requests.session()
+        for url in probes.values():
+            started = time.monotonic()
+            try:
+                r = session.head(url, timeout=timeout, allow_redirects=True)
+                if r.status_code >= 500:
+                    raise IOError("Unexpected HTTP status code {}".format(r.status_code))
+            except (IOError, requests.RequestException):
+                self.record_failure(url)
+                continue
+            self.record_latency(url, time.monotonic() - started)
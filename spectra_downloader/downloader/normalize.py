@@ -0,0 +1,199 @@
+import os
+import re
+import threading
+import xml.etree.ElementTree as ElementTree
+from concurrent.futures import ProcessPoolExecutor
+import numpy
+from .verification import FITS_BLOCK, fits_data_size, parse_fits_cards
+
+# FITS BITPIX to NumPy dtype mapping
+FITS_IMAGE_TYPES = {8: "u1", 16: ">i2", 32: ">i4", 64: ">i8", -32: ">f4", -64: ">f8"}
+# FITS binary table TFORM codes to NumPy dtype mapping
+FITS_TABLE_TYPES = {"L": "?", "B": "u1", "I": ">i2", "J": ">i4", "K": ">i8", "E": ">f4", "D": ">f8", "A": "S1"}
+WAVELENGTH_NAMES = ("wave", "wavelength", "lambda", "wavelen", "spectral", "loglam")
+FLUX_NAMES = ("flux", "intensity", "flux_density")
+NORMALIZED_EXTENSION = "npy"
+
+
+def _pick_columns(names, ucds=None):
+    """
+    Chooses indexes of wavelength and flux columns by their names (or UCDs). The first two columns are used if
+    the columns can not be recognized.
+    """
+    lowered = [name.lower() for name in names]
+    ucds = ucds if ucds is not None else [""] * len(names)
+    wavelength = flux = None
+    for index, (name, ucd) in enumerate(zip(lowered, ucds)):
+        ucd = (ucd or "").lower()
+        if wavelength is None and (name in WAVELENGTH_NAMES or ucd.startswith("em.wl")):
+            wavelength = index
+        elif flux is None and (name in FLUX_NAMES or ucd.startswith("phot.flux")):
+            flux = index
+    if wavelength is None or flux is None:
+        if len(names) < 2:
+            raise ValueError("Unable to find wavelength and flux columns")
+        return 0, 1
+    return wavelength, flux
+
+
+def _read_fits_image(cards, data):
+    """Reads 1D spectrum stored as FITS image with linear (or log10 with DC-FLAG) wavelength solution."""
+    flux = numpy.frombuffer(data, dtype=FITS_IMAGE_TYPES[int(cards["BITPIX"])]).astype(numpy.float64)
+    flux = flux * float(cards.get("BSCALE", "1")) + float(cards.get("BZERO", "0"))
+    start = float(cards.get("CRVAL1", "1"))
+    step = float(cards.get("CDELT1", cards.get("CD1_1", "1")))
+    reference = float(cards.get("CRPIX1", "1"))
+    wavelength = start + (numpy.arange(len(flux)) + 1 - reference) * step
+    if cards.get("DC-FLAG") == "1":
+        wavelength = 10 ** wavelength
+    return wavelength, flux
+
+
+def _read_fits_table(cards, data):
+    """Reads spectrum stored in FITS binary table (as scalar rows or as one row of arrays)."""
+    names = list()
+    formats = list()
+    for index in range(1, int(cards["TFIELDS"]) + 1):
+        tform = cards["TFORM{}".format(index)].strip()
+        match = re.match(r"(\d*)([A-Z])$", tform)
+        if match is None or match.group(2) not in FITS_TABLE_TYPES:
+            raise ValueError("Unsupported binary table column format {}".format(tform))
+        repeat = int(match.group(1) or "1")
+        names.append(cards.get("TTYPE{}".format(index), "col{}".format(index)))
+        dtype = FITS_TABLE_TYPES[match.group(2)]
+        formats.append((dtype, (repeat,)) if repeat != 1 else dtype)
+    dtype = numpy.dtype({"names": ["f{}".format(i) for i in range(len(names))], "formats": formats})
+    rows = numpy.frombuffer(data, dtype=dtype, count=int(cards["NAXIS2"]))
+    wavelength, flux = _pick_columns(names)
+    return (numpy.ravel(rows["f{}".format(wavelength)]).astype(numpy.float64),
+            numpy.ravel(rows["f{}".format(flux)]).astype(numpy.float64))
+
+
+def read_fits(path):
+    """Reads wavelength and flux arrays from FITS file (primary 1D image or the first binary table)."""
+    with open(path, "rb") as f:
+        content = f.read()
+    offset = 0
+    while offset < len(content):
+        cards, end = parse_fits_cards(content[offset:])
+        if end is None:
+            raise ValueError("Invalid FITS header in {}".format(path))
+        data_start = offset + (end // FITS_BLOCK + 1) * FITS_BLOCK
+        size = fits_data_size(cards)
+        data = content[data_start:data_start + size]
+        if "XTENSION" not in cards and int(cards["NAXIS"]) == 1:
+            return _read_fits_image(cards, data)
+        if cards.get("XTENSION") == "BINTABLE":
+            return _read_fits_table(cards, data)
+        offset = data_start + (size + FITS_BLOCK - 1) // FITS_BLOCK * FITS_BLOCK
+    raise ValueError("No 1D spectrum found in {}".format(path))
+
+
+def read_votable(path):
+    """Reads wavelength and flux arrays from the first table of VOTable with TABLEDATA serialization."""
+    names = list()
+    ucds = list()
+    rows = list()
+    for event, element in ElementTree.iterparse(path):
+        tag = element.tag.split("}")[-1]
+        if tag == "FIELD" and not rows:
+            names.append(element.get("name", ""))
+            ucds.append(element.get("ucd", ""))
+        elif tag == "TR":
+            rows.append([(cell.text or "").strip() for cell in element])
+            element.clear()
+        elif tag == "TABLE" and rows:
+            break
+    wavelength, flux = _pick_columns(names, ucds)
+    values = numpy.array([[row[wavelength], row[flux]] for row in rows], dtype=str).reshape(-1, 2)
+    values = numpy.where(values == "", "nan", values).astype(numpy.float64)
+    return values[:, 0], values[:, 1]
+
+
+def read_text(path, delimiter=None):
+    """Reads wavelength and flux from the first two numeric columns of CSV or whitespace separated text file."""
+    values = numpy.genfromtxt(path, delimiter=delimiter, comments="#", usecols=(0, 1), invalid_raise=False)
+    values = numpy.atleast_2d(values)
+    values = values[~numpy.isnan(values).any(axis=1)]  # drop header lines
+    return values[:, 0], values[:, 1]
+
+
+READERS = {
+    "fits": read_fits,
+    "fit": read_fits,
+    "fts": read_fits,
+    "vot": read_votable,
+    "xml": read_votable,
+    "csv": lambda path: read_text(path, ","),
+    "txt": read_text
+}
+
+
+def normalize_spectrum(path, output_dir):
+    """
+    Converts spectrum file into normalized binary layout - NumPy .npy file with float64 array of shape (2, N)
+    containing wavelength in the first and flux in the second row. The file can be memory-mapped by
+    numpy.load(path, mmap_mode="r").
+    :param path: Path of the downloaded spectrum. Format is determined by file extension.
+    :param output_dir: Directory the normalized file is written to.
+    :return: Path of the normalized file - the whole name of the spectrum extended by .npy, so spectra differing only
+    in extension (e.g. a.fits and a.vot) do not overwrite each other.
+    """
+    name = os.path.basename(path)
+    extension = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    reader = READERS.get(extension)
+    if reader is None:
+        raise ValueError("Unsupported spectrum format of {}".format(path))
+    wavelength, flux = reader(path)
+    output = os.path.join(output_dir, "{}.{}".format(name, NORMALIZED_EXTENSION))
+    numpy.save(output, numpy.vstack((wavelength, flux)).astype(numpy.float64))
+    return output
+
+
+class Normalizer:
+    """
+    Post-download stage converting downloaded spectra into memory-mappable normalized arrays on a process pool.
+    When set on SpectraDownloader, progress callback of every successfully downloaded spectrum is called after its
+    normalization with attribute normalized (or normalization_error) of DownloadResult set.
+    """
+
+    def __init__(self, output_dir=None, max_workers=None):
+        """
+        :param output_dir: Directory of normalized files. Subdirectory "normalized" of download location is used
+        if None.
+        :param max_workers: Number of worker processes (number of CPUs if None).
+        """
+        self.output_dir = output_dir
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+
+    def submit(self, result, location, callback=None):
+        """
+        Submits normalization of successfully downloaded spectrum.
+        :param result: DownloadResult of the spectrum.
+        :param location: Download location of the spectrum.
+        :param callback: Function called with the result once the normalization is finished.
+        :return: threading.Event set after the result is updated and callback invoked.
+        """
+        output_dir = self.output_dir if self.output_dir is not None else os.path.join(location, "normalized")
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir, exist_ok=True)
+        finished = threading.Event()
+
+        def done(future):
+            try:
+                result.normalized = future.result()
+            except Exception as ex:
+                result.normalization_error = ex
+            try:
+                if callback is not None:
+                    callback(result)
+            finally:
+                finished.set()
+
+        future = self._executor.submit(normalize_spectrum, os.path.join(location, result.name), output_dir)
+        future.add_done_callback(done)
+        return finished
+
+    def shutdown(self, wait=True):
+        """Shuts down worker processes."""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,238 @@
+import abc
+import datetime
+from ..ssap_parser import parser
+import requests
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+
+def set_query_params(http_link, params):
+    """
+    Replaces (or appends) HTTP parameters of the passed link. Parameter names are compared case insensitively
+    because SSAP parameter names are case insensitive.
+    :param http_link: HTTP link of SSAP query.
+    :param params: Dictionary of parameters to be set.
+    :return: String containing the modified link.
+    """
+    parts = urlsplit(http_link)
+    lowered = {key.lower() for key in params}
+    query = [(key, val) for key, val in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in lowered]
+    query.extend((key, str(val)) for key, val in params.items())
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query, safe="/:"), parts.fragment))
+
+
+def format_bound(value):
+    """
+    Formats bound of SSAP range parameter - datetime in ISO-8601 (UTC) as required by TIME parameter, numbers by
+    their shortest exact representation.
+    """
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value.isoformat()
+    return repr(value)
+
+
+def fetch_page(http_link, timeout=5):
+    """
+    Fetches and parses single page of SSAP query. The response is parsed as it arrives, compressed responses are
+    decompressed on the fly.
+    :param http_link: Constructed HTTP link of SSAP query.
+    :param timeout: Timeout of HTTP request in seconds.
+    :return: Instance of IndexedSSAPVotable.
+    """
+    r = requests.get(http_link, stream=True, timeout=timeout)
+    try:
+        if r.status_code != 200:
+            raise IOError("Expected HTTP status code to be 200")
+        r.raw.decode_content = True  # undo Content-Encoding while reading
+        page = parser.parse_ssap(r.raw)
+    finally:
+        r.close()
+    if not page.query_ok and not page.query_overflow:
+        raise IOError("SSAP query failed with status {}".format(page.query_status))
+    return page
+
+
+class _PagedQuery(abc.ABC):
+    """Common base of SSAP queries split into several requests. Subclasses define how the pages are fetched."""
+
+    def __init__(self, max_workers, timeout):
+        if max_workers < 1:
+            raise ValueError("at least one worker is required")
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.truncated = False  # set when some records could not be fetched because of OVERFLOW
+
+    @abc.abstractmethod
+    def iter_pages(self):
+        """
+        Generator yielding parsed pages (instances of IndexedSSAPVotable) in the order they arrive. Pages are
+        fetched concurrently.
+        """
+
+    def fetch(self):
+        """
+        Fetches all pages and merges them into one result.
+        :return: Instance of IndexedSSAPVotable containing rows of all pages.
+        """
+        merged = None
+        for page in self.iter_pages():
+            if merged is None:
+                merged = page
+            else:
+                merged.extend(page)
+        if merged is not None:
+            merged.query_status = "OVERFLOW" if self.truncated else "OK"
+        return merged
+
+
+class PagedSSAPQuery(_PagedQuery):
+    """
+    SSAP query split into pages by MAXREC and offset parameters. SSAP standard does not define offset
+    parameter so its name must be passed explicitly and the service must support it. The first page is fetched
+    alone, further pages are fetched concurrently until a page without OVERFLOW status is found.
+    """
+
+    def __init__(self, http_link, offset_param, page_size=1000, max_pages=1000, max_workers=4, timeout=5):
+        """
+        :param http_link: Constructed HTTP link of SSAP query.
+        :param offset_param: Name of HTTP parameter the service uses for result offset.
+        :param page_size: Number of records per page (MAXREC value).
+        :param max_pages: Upper limit of fetched pages.
+        :param max_workers: Number of pages fetched concurrently.
+        :param timeout: Timeout of single HTTP request in seconds.
+        """
+        super().__init__(max_workers, timeout)
+        if page_size < 1:
+            raise ValueError("page size must be positive")
+        self.http_link = http_link
+        self.offset_param = offset_param
+        self.page_size = page_size
+        self.max_pages = max_pages
+
+    def page_link(self, index):
+        """Constructs link of page with passed index."""
+        return set_query_params(self.http_link, {"MAXREC": self.page_size,
+                                                 self.offset_param: index * self.page_size})
+
+    def _last_page(self, page):
+        return not page.query_overflow or len(page.rows) < self.page_size
+
+    def iter_pages(self):
+        self.truncated = False
+        first = fetch_page(self.page_link(0), self.timeout)
+        yield first
+        if self._last_page(first):
+            return
+        first_accref = first.get_accref(first.rows[0])
+        end = self.max_pages  # index behind the last page
+        end_found = False
+        next_index = 1
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            running = dict()
+            while True:
+                while len(running) < self.max_workers and next_index < end:
+                    future = executor.submit(fetch_page, self.page_link(next_index), self.timeout)
+                    running[future] = next_index
+                    next_index += 1
+                if not running:
+                    # max_pages limit reached without finding the last page
+                    self.truncated = not end_found
+                    return
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = running.pop(future)
+                    page = future.result()
+                    if index >= end:
+                        continue  # page behind the end of result
+                    if len(page.rows) > 0 and page.get_accref(page.rows[0]) == first_accref:
+                        raise IOError("Service ignores offset parameter {}".format(self.offset_param))
+                    if self._last_page(page):
+                        end = index + 1
+                        end_found = True
+                    yield page
+        finally:
+            executor.shutdown(wait=False)
+
+
+class PartitionedSSAPQuery(_PagedQuery):
+    """
+    SSAP query split into several queries by partitioning range parameter (e.g. TIME or BAND) into equal
+    intervals. Intervals resulting in OVERFLOW status are bisected again. Records found in more intervals (lying on
+    interval boundary) are yielded only once. Bounds of TIME are datetime instances (SSAP requires ISO-8601 values),
+    bounds of other parameters are numbers.
+    """
+
+    def __init__(self, http_link, param, start, stop, parts=4, max_depth=8, max_workers=4, timeout=5,
+                 formatter=None):
+        """
+        :param http_link: Constructed HTTP link of SSAP query.
+        :param param: Name of SSAP range parameter, e.g. TIME or BAND.
+        :param start: Lower bound of the range (number or datetime).
+        :param stop: Upper bound of the range (number or datetime).
+        :param parts: Number of intervals the range is initially split into.
+        :param max_depth: Maximal number of bisections of one overflowing interval.
+        :param max_workers: Number of intervals fetched concurrently.
+        :param timeout: Timeout of single HTTP request in seconds.
+        :param formatter: Function converting interval bound to its string value in the query. format_bound is
+        used if None.
+        """
+        super().__init__(max_workers, timeout)
+        if not start < stop:
+            raise ValueError("range start must be lower than range stop")
+        if formatter is None and param.upper() == "TIME" and not isinstance(start, datetime.datetime):
+            raise ValueError("bounds of TIME must be datetime instances (or formatter must be passed)")
+        if parts < 1:
+            raise ValueError("at least one part is required")
+        self.http_link = http_link
+        self.param = param
+        self.start = start
+        self.stop = stop
+        self.parts = parts
+        self.max_depth = max_depth
+        self.formatter = formatter if formatter is not None else format_bound
+
+    def interval_link(self, low, high):
+        """Constructs link of query restricted to passed interval."""
+        return set_query_params(self.http_link, {self.param: "{}/{}".format(self.formatter(low),
+                                                                            self.formatter(high))})
+
+    def iter_pages(self):
+        self.truncated = False
+        step = (self.stop - self.start) / self.parts
+        pending = [(self.start + i * step, self.start + (i + 1) * step, 0) for i in range(self.parts)]
+        pending[-1] = (pending[-1][0], self.stop, 0)
+        seen = set()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            running = dict()
+            while pending or running:
+                while pending and len(running) < self.max_workers:
+                    low, high, depth = pending.pop()
+                    future = executor.submit(fetch_page, self.interval_link(low, high), self.timeout)
+                    running[future] = (low, high, depth)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    low, high, depth = running.pop(future)
+                    page = future.result()
+                    if page.query_overflow and depth < self.max_depth:
+                        # interval too large - split it and drop the truncated result
+                        middle = low + (high - low) / 2
+                        pending.append((low, middle, depth + 1))
+                        pending.append((middle, high, depth + 1))
+                        continue
+                    if page.query_overflow:
+                        self.truncated = True
+                    unique = list()
+                    for row in page.rows:
+                        key = page.get_pubdid(row) or page.get_accref(row)
+                        if key not in seen:
+                            seen.add(key)
+                            unique.append(row)
+                    page.rows = unique
+                    yield page
+        finally:
+            executor.shutdown(wait=False)
@@ -0,0 +1,281 @@
+import re
+from .exceptions import DownloadException
+from .verification import FITS_BLOCK, FITS_CARD, fits_data_size, parse_fits_cards
+
+CONTENT_RANGE = re.compile(r"bytes\s+(\d+)-(\d+)/(\d+|\*)")
+# primary header without data written instead of original primary HDU that is not selected
+EMPTY_PRIMARY_HEADER = (b"".join("{:<8}= {:>20}".format(keyword, value).ljust(FITS_CARD).encode()
+                                 for keyword, value in (("SIMPLE", "T"), ("BITPIX", "8"), ("NAXIS", "0"),
+                                                        ("EXTEND", "T"))) +
+                        b"END".ljust(FITS_CARD)).ljust(FITS_BLOCK, b" ")
+
+
+class RangeReader:
+    """
+    Reads byte ranges of remote file using HTTP Range requests. If the server ignores Range header and sends the whole
+    file, the response is read sequentially instead - skipped parts are discarded and the connection is closed when
+    reading is finished, so ranges must be read in increasing order then. Recently read bytes are kept in a buffer.
+    """
+
+    def __init__(self, session, url, timeout=None, readahead=4 * FITS_BLOCK, chunk_size=64 * 1024):
+        """
+        :param session: HTTP session used for requests.
+        :param url: URL of the file.
+        :param timeout: Timeout of the requests in seconds.
+        :param readahead: Minimal number of bytes requested by method read.
+        :param chunk_size: Size of chunks the responses are streamed in.
+        """
+        self.session = session
+        self.url = url
+        self.timeout = timeout
+        self.readahead = readahead
+        self.chunk_size = chunk_size
+        self.status_code = None  # status code of the first response
+        self.headers = dict()  # headers of the first response
+        self.size = None  # size of the whole file if known
+        self.requests = 0
+        self.received = 0
+        self._response = None  # open response
+        self._stream = None  # chunks of the whole file if the server does not support ranges
+        self._whole = False
+        self._position = 0  # offset of pending data of the stream
+        self._pending = b""
+        self._buffer = b""
+        self._buffer_start = 0
+
+    @property
+    def ranges_supported(self):
+        """False if the server sent the whole file instead of requested range, None before the first request."""
+        if self.status_code is None:
+            return None
+        return not self._whole
+
+    def _request(self, offset, size):
+        headers = {"Range": "bytes={}-{}".format(offset, "" if size is None else offset + size - 1),
+                   "Accept-Encoding": "identity"}
+        r = self.session.get(self.url, stream=True, timeout=self.timeout, headers=headers)
+        self.requests += 1
+        if self.status_code is None:
+            self.status_code = r.status_code
+            self.headers = r.headers
+        if r.status_code == 416:
+            # range starts beyond the end of the file
+            r.close()
+            return None
+        if r.status_code not in (200, 206):
+            r.close()
+            raise DownloadException("Unexpected HTTP status code {} for URL: {}".format(r.status_code, self.url),
+                                    self.url, r.status_code)
+        match = CONTENT_RANGE.match(r.headers.get("content-range", ""))
+        if r.status_code == 206 and match is not None and match.group(3) != "*":
+            self.size = int(match.group(3))
+        elif r.status_code == 200:
+            self._whole = True
+            self._stream = r.iter_content(self.chunk_size)
+            self._position = 0
+        self._response = r
+        return r
+
+    def _sequential(self, offset, size):
+        if offset < self._position:
+            raise DownloadException("Server of {} does not support ranges and offset {} was already read".format(
+                self.url, offset))
+        while size is None or size > 0:
+            if not self._pending:
+                self._pending = next(self._stream, b"")
+                self.received += len(self._pending)
+                if not self._pending:
+                    return
+            chunk = self._pending
+            if self._position < offset:
+                skip = min(offset - self._position, len(chunk))
+                self._pending = chunk[skip:]
+                self._position += skip
+                continue
+            part = chunk if size is None else chunk[:size]
+            self._pending = chunk[len(part):]
+            self._position += len(part)
+            if size is not None:
+                size -= len(part)
+            yield part
+
+    def _remote(self, offset, size):
+        """Yields chunks of the range read from the server (None size means until the end of the file)."""
+        if self._stream is not None:
+            yield from self._sequential(offset, size)
+            return
+        if self.size is not None:
+            if offset >= self.size:
+                return
+            if size is not None:
+                size = min(size, self.size - offset)
+        r = self._request(offset, size)
+        if r is None:
+            return
+        if self._stream is not None:
+            # the server sent the whole file
+            yield from self._sequential(offset, size)
+            return
+        try:
+            for chunk in r.iter_content(self.chunk_size):
+                self.received += len(chunk)
+                yield chunk
+        finally:
+            r.close()
+            self._response = None
+
+    def _chunks(self, offset, size):
+        start = offset - self._buffer_start
+        if 0 <= start < len(self._buffer):
+            part = self._buffer[start:] if size is None else self._buffer[start:start + size]
+            yield part
+            offset += len(part)
+            if size is not None:
+                size -= len(part)
+        if size is None or size > 0:
+            yield from self._remote(offset, size)
+
+    def read(self, offset, size):
+        """
+        Reads the range. At least readahead bytes are requested, the rest is kept in the buffer for following reads.
+        :return: Bytes of the range - shorter if the end of the file was reached.
+        """
+        data = b"".join(self._chunks(offset, max(size, self.readahead)))
+        self._buffer = data
+        self._buffer_start = offset
+        return data[:size]
+
+    def copy(self, offset, size, write):
+        """
+        Streams the range to the passed function without holding it in memory.
+        :param offset: Offset of the range.
+        :param size: Size of the range or None to read until the end of the file.
+        :param write: Function called with every chunk of the range.
+        :return: Number of copied bytes.
+        """
+        copied = 0
+        for chunk in self._chunks(offset, size):
+            write(chunk)
+            copied += len(chunk)
+        return copied
+
+    def close(self):
+        """Closes open response (if any) - the rest of the file is not downloaded."""
+        if self._response is not None:
+            self._response.close()
+            self._response = None
+        self._stream = None
+
+
+class FitsHdu:
+    """Location and header keywords of one HDU found in a remote FITS file."""
+
+    def __init__(self, index, offset, header_size, data_size, cards):
+        """
+        :param index: Index of the HDU (0 is the primary HDU).
+        :param offset: Offset of the HDU header in the file.
+        :param header_size: Size of the header in bytes (multiple of FITS block size).
+        :param data_size: Size of the data unit including padding to FITS block size.
+        :param cards: Dictionary of header keywords and their string values.
+        """
+        self.index = index
+        self.offset = offset
+        self.header_size = header_size
+        self.data_size = data_size
+        self.cards = cards
+
+    @property
+    def end(self):
+        """Offset of the next HDU."""
+        return self.offset + self.header_size + self.data_size
+
+    def __repr__(self):
+        return "FitsHdu: index={}, offset={}, header_size={}, data_size={}".format(
+            self.index, self.offset, self.header_size, self.data_size)
+
+
+class PartialFetch:
+    """
+    Partial retrieval of FITS spectra. Headers are read block by block using HTTP Range requests to find boundaries
+    of HDUs and only the selected HDUs (or only their headers) are downloaded. If the primary HDU is not selected, it
+    is replaced by an empty primary header (NAXIS = 0), so the selected extensions form a valid FITS file. Header-only
+    stubs keep the original headers, so data sizes declared in them do not match the file. Files that are not FITS
+    are downloaded whole.
+    """
+
+    def __init__(self, hdus=None, header_only=False, readahead=4, max_header=100 * FITS_BLOCK):
+        """
+        :param hdus: Indexes of downloaded HDUs (0 is the primary HDU) or None for all HDUs.
+        :param header_only: If True, only headers of the selected HDUs are downloaded.
+        :param readahead: Number of FITS blocks requested at once while reading headers.
+        :param max_header: Maximal size of one header in bytes.
+        """
+        self.hdus = set(hdus) if hdus is not None else None
+        self.header_only = header_only
+        self.readahead = readahead
+        self.max_header = max_header
+
+    def _read_header(self, reader, index, offset):
+        """Reads header of HDU starting at the offset. Returns tuple of FitsHdu and header bytes or None."""
+        header = b""
+        while True:
+            block = reader.read(offset + len(header), FITS_BLOCK)
+            if not header and (len(block) < FITS_CARD or (index > 0 and not block.startswith(b"XTENSION"))):
+                # end of the file (or trailing data not forming an extension)
+                return None
+            if len(block) < FITS_BLOCK:
+                raise DownloadException("Header of HDU {} of {} is truncated".format(index, reader.url))
+            header += block
+            cards, end_offset = parse_fits_cards(header)
+            if end_offset is not None:
+                break
+            if len(header) >= self.max_header:
+                raise DownloadException("END card of HDU {} of {} not found in the first {} bytes".format(
+                    index, reader.url, self.max_header))
+        try:
+            size = fits_data_size(cards)
+        except (KeyError, ValueError) as ex:
+            raise DownloadException("Invalid header of HDU {} of {}: {}".format(index, reader.url, ex))
+        data_size = (size + FITS_BLOCK - 1) // FITS_BLOCK * FITS_BLOCK
+        return FitsHdu(index, offset, len(header), data_size, cards), header
+
+    def transfer(self, reader, write):
+        """
+        Downloads selected parts of the remote file.
+        :param reader: RangeReader of the file.
+        :param write: Function called with every chunk of the result.
+        :return: List of FitsHdu instances of all inspected HDUs (None if the file is not FITS).
+        """
+        if not reader.read(0, FITS_CARD).startswith(b"SIMPLE  ="):
+            reader.copy(0, None, write)
+            return None
+        last = max(self.hdus) if self.hdus else 0
+        hdus = list()
+        offset = 0
+        while self.hdus is None or len(hdus) <= last:
+            found = self._read_header(reader, len(hdus), offset)
+            if found is None:
+                break
+            hdu, header = found
+            hdus.append(hdu)
+            selected = self.hdus is None or hdu.index in self.hdus
+            if selected:
+                write(header)
+            elif hdu.index == 0:
+                # original primary header declares data that are not downloaded
+                write(EMPTY_PRIMARY_HEADER)
+            if selected and not self.header_only and hdu.data_size > 0:
+                copied = reader.copy(hdu.offset + hdu.header_size, hdu.data_size, write)
+                if copied < hdu.data_size:
+                    raise DownloadException("Data of HDU {} of {} are truncated".format(hdu.index, reader.url))
+            offset = hdu.end
+        return hdus
+
+    def open(self, session, url, timeout=None):
+        """
+        Creates RangeReader of the remote file reading readahead blocks at once. The reader must be closed.
+        :param session: HTTP session used for requests.
+        :param url: URL of the file.
+        :param timeout: Timeout of the requests in seconds.
+        """
+        return RangeReader(session, url, timeout, self.readahead * FITS_BLOCK)
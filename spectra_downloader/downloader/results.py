@@ -0,0 +1,105 @@
+import collections
+import json
+import os
+import threading
+import time
+
+
+class ResultLog:
+    """
+    Disk-backed log of download results. Every result is appended to JSON lines file as soon as it arrives, so the
+    memory used does not grow with the number of downloaded spectra and results survive crash of the process. Running
+    counters are kept in memory (and restored from the existing log when it is opened). Failed spectra can be queried
+    from the log and submitted again. The instance can be shared by several threads.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Path of the log file. Records are appended to the existing file.
+        """
+        self.path = path
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.errors = collections.Counter()  # number of failures by exception type
+        self._lock = threading.Lock()
+        if os.path.isfile(path):
+            for record in self.records():
+                self._count(record)
+        self._file = open(path, "a")
+        if self._file.tell() > 0:
+            with open(path, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    # terminate incomplete record of crashed process
+                    self._file.write("\n")
+
+    def _count(self, record):
+        self.total += 1
+        if record["success"]:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.errors[record.get("error_type")] += 1
+
+    def record(self, result, keys=None):
+        """
+        Appends result of one download to the log.
+        :param result: DownloadResult instance.
+        :param keys: Dictionary of spectrum identifiers (accref, pubdid) stored with the result.
+        """
+        record = {"name": result.name, "url": result.url, "success": result.success, "time": round(time.time(), 3)}
+        if not result.success:
+            record["error_type"] = type(result.exception).__name__
+            record["error"] = str(result.exception)
+        record.update({key: val for key, val in (keys or dict()).items() if val is not None})
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self._count(record)
+
+    def summary(self):
+        """Returns dictionary of running counters."""
+        with self._lock:
+            return {"total": self.total, "succeeded": self.succeeded, "failed": self.failed,
+                    "errors": dict(self.errors)}
+
+    def records(self):
+        """Iterates over all records of the log (dictionaries) in the order they were written."""
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # incomplete record of crashed process
+                yield record
+
+    def failures(self):
+        """
+        Returns records of spectra whose latest download failed. Spectra that failed and were downloaded
+        successfully later are not included.
+        :return: List of failure records (dictionaries with keys name, url, error_type, error, accref, pubdid).
+        """
+        latest = collections.OrderedDict()  # only failures are kept, so memory does not grow with the batch
+        for record in self.records():
+            key = record.get("accref") or record.get("pubdid") or record["url"]
+            latest.pop(key, None)
+            if not record["success"]:
+                latest[key] = record
+        return list(latest.values())
+
+    def failed_spectra(self, parsed_ssap):
+        """
+        Finds rows of parsed SSAP result whose latest download failed, e.g. to download them again.
+        :param parsed_ssap: Instance of IndexedSSAPVotable the spectra were downloaded from.
+        :return: List of Record instances.
+        """
+        failures = self.failures()
+        accrefs = set(record["accref"] for record in failures if "accref" in record)
+        pubdids = set(record["pubdid"] for record in failures if "pubdid" in record)
+        return [row for row in parsed_ssap.rows
+                if parsed_ssap.get_accref(row) in accrefs or parsed_ssap.get_pubdid(row) in pubdids]
+
+    def close(self):
+        self._file.close()
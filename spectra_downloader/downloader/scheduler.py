@@ -0,0 +1,233 @@
+import collections
+import threading
+import time
+import requests
+from .exceptions import DeferredException
+
+
+class DownloadJob:
+    """
+    Handle of one batch of downloads submitted to Scheduler. Attribute results holds values returned by the tasks
+    of the job in order of their indexes (None for tasks that were not run), attribute success is set when the job
+    is finished.
+    """
+
+    def __init__(self, scheduler, run, count, priority, finish):
+        self.priority = priority
+        self.results = [None] * count
+        self.success = None
+        self.exception = None  # the first exception raised by a task or by finish function
+        self.cancelled = False
+        self._scheduler = scheduler
+        self._run = run
+        self._finish = finish
+        self._next = 0
+        self._deferred = collections.deque()  # (ready time, index) of deferred tasks
+        self._running = 0
+        self._event = threading.Event()
+
+    @property
+    def pending(self):
+        """Number of tasks that were not started yet (including deferred ones)."""
+        return len(self.results) - self._next + len(self._deferred)
+
+    def _next_index(self, now):
+        """Returns index of the next task that can be started now or None."""
+        if self._next < len(self.results):
+            self._next += 1
+            return self._next - 1
+        if self._deferred and self._deferred[0][0] <= now:
+            return self._deferred.popleft()[1]
+        return None
+
+    def done(self):
+        """Returns True if all tasks of the job finished (or were cancelled)."""
+        return self._event.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the job is finished. Returns False if timeout expired. If called from a worker thread of the
+        scheduler (e.g. from a callback of other job), the thread runs pending tasks of the job itself, so the job
+        cannot wait for the worker it blocks.
+        """
+        self._scheduler._help(self)
+        return self._event.wait(timeout)
+
+    def cancel(self):
+        """Cancels tasks of the job that were not started yet."""
+        self._scheduler.cancel(self)
+
+
+class Scheduler:
+    """
+    Runs download jobs of one or several SpectraDownloader instances on one shared budget of worker threads. Jobs
+    with higher priority are served first, jobs of the same priority share the workers fairly - tasks are taken
+    from them in round-robin order. A task raising DeferredException (e.g. because its host is at its concurrency
+    limit) is put back and run again after the requested delay, the worker meanwhile serves other tasks. Worker
+    threads are started when there is work and end when there is none, so an idle scheduler holds no threads. Every
+    worker thread uses its own HTTP session.
+    """
+
+    def __init__(self, max_workers=1):
+        """
+        :param max_workers: Maximal number of concurrently running tasks of all jobs.
+        """
+        if max_workers < 1:
+            raise ValueError("at least one worker is required")
+        self.max_workers = max_workers
+        self._queues = dict()  # priority -> deque of jobs with pending tasks
+        self._threads = set()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._local = threading.local()  # HTTP session of the worker thread
+
+    def submit(self, run, count, priority=0, finish=None):
+        """
+        Submits new job.
+        :param run: Function called as run(session, index) for every index in range(count). Its return value is
+        stored in results of the job.
+        :param count: Number of tasks of the job.
+        :param priority: Priority of the job - jobs with higher priority are served first.
+        :param finish: Function called with the job when all its tasks finished (before the job is marked as done).
+        :return: DownloadJob instance.
+        """
+        job = DownloadJob(self, run, count, priority, finish)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Scheduler is shut down")
+            if count > 0:
+                self._queues.setdefault(priority, collections.deque()).append(job)
+                while len(self._threads) < min(self.max_workers, self._pending()):
+                    thread = threading.Thread(target=self._work, name="spectra-download")
+                    self._threads.add(thread)
+                    thread.start()
+        if count == 0:
+            self._finish_job(job)
+        return job
+
+    def _pending(self):
+        return sum(job.pending for jobs in self._queues.values() for job in jobs)
+
+    def _take(self):
+        """Takes the next task - from the first job of the highest priority that is moved to the end then."""
+        now = time.monotonic()
+        for priority in sorted(self._queues, reverse=True):
+            jobs = self._queues[priority]
+            task = None
+            for _ in range(len(jobs)):
+                job = jobs.popleft()
+                if job.pending == 0:
+                    continue  # tasks were taken by the thread waiting for the job
+                jobs.append(job)
+                index = job._next_index(now)
+                if index is not None:
+                    job._running += 1
+                    task = job, index
+                    break
+            if not jobs:
+                del self._queues[priority]
+            if task is not None:
+                return task
+        return None
+
+    def _ready_in(self):
+        """Returns seconds until the first deferred task is ready or None if there is no pending task."""
+        ready = [job._deferred[0][0] for jobs in self._queues.values() for job in jobs if job._deferred]
+        if not ready:
+            return None
+        return max(0.0, min(ready) - time.monotonic())
+
+    def _finish_job(self, job):
+        if job._finish is not None:
+            try:
+                job._finish(job)
+            except Exception as ex:
+                if job.exception is None:
+                    job.exception = ex
+        job._event.set()
+
+    def _run_task(self, job, index):
+        try:
+            job.results[index] = job._run(self._local.session, index)
+        except DeferredException as ex:
+            with self._condition:
+                if not job.cancelled:
+                    job._deferred.append((time.monotonic() + ex.delay, index))
+                    if job not in self._queues.get(job.priority, ()):
+                        self._queues.setdefault(job.priority, collections.deque()).append(job)
+                    self._condition.notify_all()
+        except Exception as ex:
+            if job.exception is None:
+                job.exception = ex
+        with self._condition:
+            job._running -= 1
+            finished = job.pending == 0 and job._running == 0
+        if finished:
+            self._finish_job(job)
+
+    def _work(self):
+        self._local.session = requests.session()
+        while True:
+            with self._condition:
+                task = self._take()
+                while task is None:
+                    delay = self._ready_in()
+                    if delay is None:
+                        self._threads.discard(threading.current_thread())
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(delay)
+                    task = self._take()
+            self._run_task(*task)
+
+    def _help(self, job):
+        """Runs pending tasks of the job on the current thread if it is a worker thread of this scheduler."""
+        with self._condition:
+            if threading.current_thread() not in self._threads:
+                return
+        while True:
+            with self._condition:
+                index = None
+                while index is None:
+                    if job.pending == 0:
+                        return
+                    index = job._next_index(time.monotonic())
+                    if index is None:
+                        self._condition.wait(max(0.0, job._deferred[0][0] - time.monotonic()))
+                job._running += 1
+            self._run_task(job, index)
+
+    def cancel(self, job):
+        """Cancels tasks of the job that were not started yet. The job finishes when its running tasks end."""
+        with self._condition:
+            if job.pending == 0:
+                return
+            job.cancelled = True
+            job._next = len(job.results)
+            job._deferred.clear()
+            jobs = self._queues.get(job.priority)
+            if jobs is not None and job in jobs:
+                jobs.remove(job)
+                if not jobs:
+                    del self._queues[job.priority]
+            finished = job._running == 0
+        if finished:
+            self._finish_job(job)
+
+    def shutdown(self, wait=True, cancel=False):
+        """
+        Shuts down the scheduler. No new jobs can be submitted.
+        :param wait: If True, blocks until all running tasks (and all queued tasks unless cancelled) finish. It must
+        not be used from callbacks running on worker threads.
+        :param cancel: If True, tasks that were not started yet are cancelled.
+        """
+        with self._condition:
+            self._closed = True
+            jobs = [job for queue in self._queues.values() for job in queue]
+        if cancel:
+            for job in jobs:
+                self.cancel(job)
+        if wait:
+            with self._condition:
+                while self._threads:
+                    self._condition.wait()
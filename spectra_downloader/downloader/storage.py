@@ -0,0 +1,367 @@
+import abc
+import hashlib
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import uuid
+import zipfile
+from .exceptions import SaveException
+
+INDEX_NAME = "index.jsonl"
+PARTIAL_SUFFIX = ".part"
+
+
+class Storage(abc.ABC):
+    """
+    Base class of output storages of downloaded spectra. SpectraDownloader streams every spectrum into a writer
+    returned by method create. The writer has methods write(chunk), commit() called after the whole spectrum was
+    received and verified, and abort() called if the download failed. Its attribute name holds the name the spectrum
+    is stored under.
+    """
+
+    files = False  # True if every spectrum is stored as a file of its name in the location
+
+    def prepare(self, location):
+        """Called at the start of every batch of downloads into the location."""
+        pass
+
+    @abc.abstractmethod
+    def create(self, location, file_name, keys=None):
+        """
+        Creates writer of one spectrum.
+        :param location: String definition of download location.
+        :param file_name: Final name of the spectrum.
+        :param keys: Dictionary of spectrum identifiers (accref, pubdid) stored with the spectrum if supported.
+        :return: Writer object. SaveException is raised if the spectrum is already stored.
+        """
+
+    @abc.abstractmethod
+    def size(self, location, name):
+        """Returns size of stored spectrum in bytes."""
+
+    def close(self):
+        """Releases resources of the storage."""
+        pass
+
+
+class _FileWriter:
+    def __init__(self, storage, location, name):
+        self.storage = storage
+        self.location = location
+        self.name = name
+        self.path = os.path.join(location, name)
+        # spectrum gets its final name only when complete, so interrupted downloads never look finished; temporary
+        # name is unique, so writers of the same name in other processes do not share it
+        self.partial_path = "{}.{}{}".format(self.path, uuid.uuid4().hex[:12], PARTIAL_SUFFIX)
+        self.file = open(self.partial_path, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self):
+        self.file.close()
+        # hard link fails if the file exists, so spectrum stored meanwhile by other process is never overwritten
+        try:
+            os.link(self.partial_path, self.path)
+        except FileExistsError:
+            raise SaveException("File {} already exists".format(self.path))
+        finally:
+            os.remove(self.partial_path)
+
+    def abort(self):
+        # do not leave incomplete or corrupted file behind
+        self.file.close()
+        os.remove(self.partial_path)
+        self.storage._release(self.location, self.name)
+
+
+class DirectoryStorage(Storage):
+    """
+    Default storage writing every spectrum into its own file in download location. The file is written under
+    temporary name with .part suffix and linked to its final name when the spectrum is complete.
+    Files can be spread into subdirectories (shards) so that no directory holds millions of entries. With "hash"
+    sharding the subdirectories are given by hex digest of the file name, with "prefix" sharding by its first
+    characters, e.g. ab/cd/abcdef.fits for depth 2 and width 2. Only the part of the name before the first dot is
+    used, so the shard does not depend on file extension. Existing files are indexed by one pass over the location
+    at the start of every batch, so existence checks and collisions of concurrent downloads are resolved in memory.
+    Complete file gets its final name by a hard link, so a file created meanwhile by other storage instance or process
+    is never overwritten - SaveException is raised instead.
+    """
+
+    SHARDINGS = ("hash", "prefix")
+    files = True
+
+    def __init__(self, sharding=None, depth=2, width=2):
+        """
+        :param sharding: Sharding of files into subdirectories - None (flat directory), "hash" or "prefix".
+        :param depth: Number of subdirectory levels.
+        :param width: Number of characters of one subdirectory name.
+        """
+        if sharding is not None and sharding not in self.SHARDINGS:
+            raise ValueError("Unsupported sharding {}".format(sharding))
+        self.sharding = sharding
+        self.depth = depth
+        self.width = width
+        self._indexes = dict()  # location -> set of relative names of existing files
+        self._directories = dict()  # location -> set of existing shard directories
+        self._lock = threading.Lock()
+
+    def relative_path(self, file_name):
+        """Returns path of the file relative to download location."""
+        if self.sharding is None:
+            return file_name
+        stem = file_name.split(".")[0]
+        if self.sharding == "hash":
+            key = hashlib.md5(stem.encode()).hexdigest()
+        else:
+            key = stem.lower().ljust(self.depth * self.width, "_")
+        parts = [key[level * self.width:(level + 1) * self.width] for level in range(self.depth)]
+        return os.path.join(*(parts + [file_name]))
+
+    def _scan(self, location):
+        """Indexes existing files of the location (including shard directories) by one scandir pass."""
+        names = set()
+        directories = set()
+        pending = [("", self.depth if self.sharding is not None else 0)]
+        while pending:
+            prefix, levels = pending.pop()
+            try:
+                entries = list(os.scandir(os.path.join(location, prefix) if prefix else location))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                name = os.path.join(prefix, entry.name) if prefix else entry.name
+                if levels > 0 and len(entry.name) == self.width and entry.is_dir():
+                    directories.add(name)
+                    pending.append((name, levels - 1))
+                elif entry.is_file() and not entry.name.endswith(PARTIAL_SUFFIX):
+                    names.add(name)
+        self._indexes[location] = names
+        self._directories[location] = directories
+
+    def prepare(self, location):
+        with self._lock:
+            self._scan(location)
+
+    def index(self, location):
+        """Returns set of relative paths of existing files in the location (indexed when used first)."""
+        with self._lock:
+            if location not in self._indexes:
+                self._scan(location)
+            return set(self._indexes[location])
+
+    def _release(self, location, name):
+        with self._lock:
+            self._indexes[location].discard(name)
+
+    def create(self, location, file_name, keys=None):
+        name = self.relative_path(file_name)
+        with self._lock:
+            if location not in self._indexes:
+                self._scan(location)
+            names = self._indexes[location]
+            if name in names:
+                raise SaveException("File {} already exists".format(os.path.join(location, name)))
+            # reserve the name so that concurrent download of the same name fails too
+            names.add(name)
+            directory = os.path.dirname(name)
+            if directory and directory not in self._directories[location]:
+                os.makedirs(os.path.join(location, directory), exist_ok=True)
+                self._directories[location].add(directory)
+        try:
+            return _FileWriter(self, location, name)
+        except BaseException:
+            self._release(location, name)
+            raise
+
+    def size(self, location, name):
+        return os.path.getsize(os.path.join(location, name))
+
+
+class _BundleWriter:
+    def __init__(self, storage, location, file_name, keys):
+        self.storage = storage
+        self.location = location
+        self.file_name = file_name
+        self.keys = keys
+        self.name = file_name
+        # small spectra are kept in memory, large ones are spooled into temporary file
+        self.spool = tempfile.SpooledTemporaryFile(max_size=storage.spool_size)
+        self.size = 0
+
+    def write(self, chunk):
+        self.spool.write(chunk)
+        self.size += len(chunk)
+
+    def commit(self):
+        try:
+            self.spool.seek(0)
+            self.storage._append(self.location, self.file_name, self.keys, self.spool, self.size)
+        finally:
+            self.spool.close()
+
+    def abort(self):
+        self.spool.close()
+
+
+class BundleStorage(Storage):
+    """
+    Storage appending spectra into rolling uncompressed tar or zip bundles (bundle-00000.tar, bundle-00001.tar, ...)
+    instead of creating one file per spectrum. A new bundle is started when the current one reaches bundle_size.
+    Every stored spectrum is recorded in JSON lines index file with its name, bundle, data offset and size and
+    accref/pubdid identifiers, so it can be read by BundleReader without unpacking the bundle. Spectra are stored
+    only after they are completely received and verified, so failed downloads never get into bundles. The instance
+    can be shared by several threads. Method close must be called after the last download to finalize the current
+    bundle (tar end blocks, zip central directory).
+    """
+
+    FORMATS = ("tar", "zip")
+
+    def __init__(self, bundle_format="tar", bundle_size=1024 ** 3, spool_size=16 * 1024 ** 2):
+        """
+        :param bundle_format: Format of bundles - "tar" or "zip".
+        :param bundle_size: Target size of one bundle in bytes.
+        :param spool_size: Maximal size of spectrum kept in memory until it is appended to the bundle.
+        """
+        if bundle_format not in self.FORMATS:
+            raise ValueError("Unsupported bundle format {}".format(bundle_format))
+        self.bundle_format = bundle_format
+        self.bundle_size = bundle_size
+        self.spool_size = spool_size
+        self.entries = dict()  # location -> dictionary of index entries by name
+        self._bundles = dict()  # location -> (bundle name, tarfile or zipfile instance, file object)
+        self._indexes = dict()  # location -> opened index file
+        self._lock = threading.Lock()
+
+    def _entries(self, location):
+        """Returns entries of location index (loaded when the location is used for the first time)."""
+        entries = self.entries.get(location)
+        if entries is None:
+            entries = self.entries[location] = dict()
+            for entry in read_index(location):
+                entries[entry["name"]] = entry
+            self._indexes[location] = open(os.path.join(location, INDEX_NAME), "a")
+        return entries
+
+    def _next_bundle(self, location):
+        """Opens new bundle with number following all bundles of the location."""
+        number = 0
+        for name in os.listdir(location):
+            if name.startswith("bundle-") and name.endswith("." + self.bundle_format):
+                number = max(number, int(name[len("bundle-"):].split(".")[0]) + 1)
+        name = "bundle-{:05d}.{}".format(number, self.bundle_format)
+        file = open(os.path.join(location, name), "w+b")
+        if self.bundle_format == "tar":
+            archive = tarfile.open(fileobj=file, mode="w", format=tarfile.GNU_FORMAT)
+        else:
+            archive = zipfile.ZipFile(file, mode="w", compression=zipfile.ZIP_STORED)
+        self._bundles[location] = (name, archive, file)
+        return self._bundles[location]
+
+    def _close_bundle(self, location):
+        name, archive, file = self._bundles.pop(location)
+        archive.close()
+        file.close()
+
+    def create(self, location, file_name, keys=None):
+        with self._lock:
+            if file_name in self._entries(location):
+                raise SaveException("Spectrum {} already exists in bundles of {}".format(file_name, location))
+        return _BundleWriter(self, location, file_name, keys)
+
+    def _append(self, location, file_name, keys, data, size):
+        """Appends spectrum data (file-like object) into the current bundle and records it in the index."""
+        with self._lock:
+            entries = self._entries(location)
+            if file_name in entries:
+                raise SaveException("Spectrum {} already exists in bundles of {}".format(file_name, location))
+            bundle = self._bundles.get(location)
+            if bundle is None or bundle[2].tell() >= self.bundle_size:
+                if bundle is not None:
+                    self._close_bundle(location)
+                bundle = self._next_bundle(location)
+            name, archive, file = bundle
+            if self.bundle_format == "tar":
+                info = tarfile.TarInfo(file_name)
+                info.size = size
+                offset = archive.offset + len(info.tobuf(archive.format, archive.encoding, archive.errors))
+                archive.addfile(info, data)
+            else:
+                info = zipfile.ZipInfo(file_name)
+                info.file_size = size
+                with archive.open(info, "w") as member:
+                    offset = file.tell()
+                    shutil.copyfileobj(data, member)
+            file.flush()
+            entry = {"name": file_name, "bundle": name, "offset": offset, "size": size}
+            entry.update({key: val for key, val in (keys or dict()).items() if val is not None})
+            entries[file_name] = entry
+            index = self._indexes[location]
+            index.write(json.dumps(entry) + "\n")
+            index.flush()
+
+    def size(self, location, file_name):
+        with self._lock:
+            return self._entries(location)[file_name]["size"]
+
+    def close(self):
+        """Finalizes all opened bundles and index files."""
+        with self._lock:
+            for location in list(self._bundles):
+                self._close_bundle(location)
+            for index in self._indexes.values():
+                index.close()
+            self._indexes.clear()
+            self.entries.clear()
+
+
+def read_index(location):
+    """Reads entries of bundle index in the location. Returns empty list if there is no index."""
+    path = os.path.join(location, INDEX_NAME)
+    if not os.path.isfile(path):
+        return list()
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class BundleReader:
+    """Random access reader of spectra stored in bundles by BundleStorage."""
+
+    def __init__(self, location):
+        """
+        :param location: Download location containing bundles and their index.
+        """
+        self.location = location
+        self.entries = dict()
+        self._aliases = dict()
+        for entry in read_index(location):
+            self.entries[entry["name"]] = entry
+            for key in ("accref", "pubdid"):
+                if entry.get(key):
+                    self._aliases[entry[key]] = entry["name"]
+
+    def names(self):
+        """Returns names of all stored spectra."""
+        return list(self.entries)
+
+    def entry(self, key):
+        """
+        Finds index entry of the spectrum.
+        :param key: Name, accref or pubdid of the spectrum.
+        :return: Dictionary with keys name, bundle, offset, size (and accref, pubdid if known).
+        """
+        if key in self.entries:
+            return self.entries[key]
+        if key in self._aliases:
+            return self.entries[self._aliases[key]]
+        raise KeyError(key)
+
+    def read(self, key):
+        """Reads content of the spectrum identified by its name, accref or pubdid."""
+        entry = self.entry(key)
+        with open(os.path.join(self.location, entry["bundle"]), "rb") as f:
+            f.seek(entry["offset"])
+            return f.read(entry["size"])
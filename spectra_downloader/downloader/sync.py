@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+from .storage import DirectoryStorage
+
+MANIFEST_NAME = ".spectra_manifest.json"
+MANIFEST_VERSION = 1
+# columns (utypes) whose change means the spectrum itself changed
+DEFAULT_FINGERPRINT_COLUMNS = (
+    "ssa:access.reference",
+    "ssa:access.size",
+    "ssa:curation.version",
+    "ssa:dataid.version"
+)
+BACKUP_SUFFIX = ".sync-old"
+
+
+class SyncReport:
+    """Summary of differences between SSAP result and local mirror directory found and resolved by sync."""
+
+    def __init__(self):
+        self.added = list()  # names of newly downloaded spectra
+        self.changed = list()  # names of re-downloaded spectra
+        self.unchanged = 0  # number of spectra already present in the mirror
+        self.adopted = list()  # names of files found in directory but missing in manifest
+        self.pruned = list()  # names of files removed from the mirror
+        self.failed = list()  # DownloadResult instances of failed downloads
+
+    @property
+    def success(self):
+        """Property that signalizes all required downloads succeeded."""
+        return len(self.failed) == 0
+
+    def summary(self):
+        """Returns dictionary with number of spectra in every category."""
+        return {
+            "added": len(self.added),
+            "changed": len(self.changed),
+            "unchanged": self.unchanged,
+            "adopted": len(self.adopted),
+            "pruned": len(self.pruned),
+            "failed": len(self.failed)
+        }
+
+    def __str__(self):
+        return "SyncReport: " + ", ".join("{}={}".format(key, val) for key, val in sorted(self.summary().items()))
+
+
+class MirrorSync:
+    """
+    This class keeps local directory in sync with SSAP query result. Downloaded spectra are recorded in a manifest
+    file stored inside the directory together with fingerprint of their SSAP record. Only spectra missing in the
+    manifest or having a different fingerprint are downloaded, so the work done by sync depends on the size of the
+    change only. Directory itself is indexed once per sync, so spectra whose files were removed are downloaded again.
+    """
+
+    def __init__(self, downloader, location, fingerprint_columns=DEFAULT_FINGERPRINT_COLUMNS,
+                 manifest_name=MANIFEST_NAME):
+        """
+        :param downloader: SpectraDownloader instance used for downloading.
+        :param location: String definition of mirror directory.
+        :param fingerprint_columns: Names or utypes of columns identifying content of the spectrum. Columns
+        missing in the SSAP result are ignored.
+        :param manifest_name: Name of manifest file inside mirror directory.
+        """
+        if not downloader.storage.files:
+            raise ValueError("Sync requires storage writing spectra into separate files")
+        self.downloader = downloader
+        self.location = location
+        self.manifest_path = os.path.join(location, manifest_name)
+        ssap = downloader.parsed_ssap
+        self._fingerprint_indexes = list()
+        for column in fingerprint_columns:
+            try:
+                self._fingerprint_indexes.append(ssap.column_index(column))
+            except KeyError:
+                pass
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self):
+        """Loads manifest of the mirror. Returns dictionary mapping spectrum key to its manifest entry."""
+        if not os.path.isfile(self.manifest_path):
+            return dict()
+        with open(self.manifest_path, "r") as f:
+            content = json.load(f)
+        if content.get("version") != MANIFEST_VERSION:
+            raise ValueError("Unsupported manifest version in {}".format(self.manifest_path))
+        return content["spectra"]
+
+    def save_manifest(self):
+        """Atomically replaces manifest file by current state of the mirror."""
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"version": MANIFEST_VERSION, "spectra": self.manifest}, f)
+        os.replace(temp_path, self.manifest_path)
+
+    def spectrum_key(self, spectrum, datalink):
+        """Returns key identifying the spectrum in the manifest - PUBDID for DataLink download, ACC_REF otherwise."""
+        ssap = self.downloader.parsed_ssap
+        if datalink:
+            return ssap.get_pubdid(spectrum)
+        return ssap.get_accref(spectrum)
+
+    def fingerprint(self, spectrum):
+        """Returns fingerprint of SSAP record of the spectrum."""
+        values = "\x1f".join(spectrum.columns[index] for index in self._fingerprint_indexes)
+        return hashlib.sha1(values.encode()).hexdigest()
+
+    def _expected_name(self, spectrum, datalink):
+        """Returns expected file name of the spectrum (without extension in case of DataLink download)."""
+        accref = self.downloader.parsed_ssap.get_accref(spectrum)
+        if datalink:
+            return self.downloader._file_name_without_extension(accref)
+        return self.downloader._file_name(accref)
+
+    def _existing(self):
+        """Returns set of names of files in mirror directory relative to it (including shard subdirectories)."""
+        storage = self.downloader.storage
+        if isinstance(storage, DirectoryStorage):
+            # index again, files could have been removed since the previous batch
+            storage.prepare(self.location)
+            return storage.index(self.location)
+        return set(os.listdir(self.location))
+
+    def _list_directory(self, datalink):
+        """
+        Maps names of files in mirror directory (without extension for DataLink) to their real names relative to
+        the directory (including shard subdirectories of the storage).
+        """
+        listing = dict()
+        for name in self._existing():
+            base = os.path.basename(name)
+            listing[base.split(".")[0] if datalink else base] = name
+        return listing
+
+    def sync(self, spectra, parameters=None, prune=False, progress_callback=None):
+        """
+        Synchronizes mirror directory with passed spectra. This method is blocking.
+        :param spectra: List of Record instances that should be present in the mirror.
+        :param parameters: DataLink protocol parameters or None for direct download.
+        :param prune: If True, files of spectra recorded in manifest but not passed in spectra are removed.
+        :param progress_callback: Function callback called with DownloadResult of every downloaded spectrum.
+        :return: SyncReport instance.
+        """
+        datalink = parameters is not None
+        if not os.path.isdir(self.location):
+            os.makedirs(self.location)
+        report = SyncReport()
+        wanted = dict()
+        to_download = list()
+        listing = None
+        existing = None
+        for spectrum in spectra:
+            key = self.spectrum_key(spectrum, datalink)
+            fingerprint = self.fingerprint(spectrum)
+            wanted[key] = fingerprint
+            entry = self.manifest.get(key)
+            if entry is not None and entry["fingerprint"] == fingerprint:
+                if existing is None:
+                    existing = self._existing()
+                if entry["name"] not in existing:
+                    # file was removed from the mirror - download it again as a new one
+                    del self.manifest[key]
+                    entry = None
+            if entry is None:
+                if listing is None:
+                    listing = self._list_directory(datalink)
+                name = listing.get(self._expected_name(spectrum, datalink))
+                if name is not None:
+                    # file downloaded before without manifest - adopt it
+                    self.manifest[key] = {"name": name, "fingerprint": fingerprint}
+                    report.adopted.append(name)
+                else:
+                    to_download.append(spectrum)
+            elif entry["fingerprint"] != fingerprint:
+                self._backup(entry["name"])
+                to_download.append(spectrum)
+            else:
+                report.unchanged += 1
+        if to_download:
+            self._download(to_download, parameters, wanted, report, progress_callback)
+        if prune:
+            for key in [key for key in self.manifest if key not in wanted]:
+                name = self.manifest.pop(key)["name"]
+                path = os.path.join(self.location, name)
+                if os.path.isfile(path):
+                    os.remove(path)
+                report.pruned.append(name)
+        self.save_manifest()
+        return report
+
+    def _backup(self, name):
+        path = os.path.join(self.location, name)
+        if os.path.isfile(path):
+            os.replace(path, path + BACKUP_SUFFIX)
+
+    def _restore(self, name):
+        path = os.path.join(self.location, name)
+        if os.path.isfile(path + BACKUP_SUFFIX):
+            os.replace(path + BACKUP_SUFFIX, path)
+
+    def _download(self, spectra, parameters, wanted, report, progress_callback):
+        results = list()
+
+        def collect(result):
+            # results are collected here as they are not kept by downloader with result log
+            results.append(result)
+            if progress_callback is not None:
+                progress_callback(result)
+
+        self.downloader._spectra_download(spectra, parameters, self.location, collect, None, False)
+        for result in results:
+            key = self.spectrum_key(result.spectrum, parameters is not None)
+            entry = self.manifest.get(key)
+            if not result.success:
+                report.failed.append(result)
+                if entry is not None:
+                    self._restore(entry["name"])
+                continue
+            if entry is None:
+                report.added.append(result.name)
+            else:
+                report.changed.append(result.name)
+                backup = os.path.join(self.location, entry["name"] + BACKUP_SUFFIX)
+                if os.path.isfile(backup):
+                    os.remove(backup)
+            self.manifest[key] = {"name": result.name, "fingerprint": wanted[key]}
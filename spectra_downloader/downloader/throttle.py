@@ -0,0 +1,168 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of HTTP requests per second. One instance can be shared by several threads
+    and several SpectraDownloader instances to enforce one global limit.
+    """
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: Maximal number of requests per second.
+        :param burst: Number of requests that can be issued at once after a period of inactivity.
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until the next request is allowed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def try_acquire(self):
+        """Takes token of the next request if it is allowed now. Returns False instead of blocking otherwise."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class HostLimit:
+    """Adaptive concurrency state of one host."""
+
+    def __init__(self, limit):
+        self.limit = float(limit)
+        self.in_flight = 0
+        self.cost = None  # smoothed cost (seconds per byte or seconds) of recent requests
+        self.best_cost = None  # lowest smoothed cost observed
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.congestions = 0
+
+
+class AIMDController:
+    """
+    Adaptive per-host concurrency controller using additive-increase/multiplicative-decrease. Every successful
+    request increases the host limit by increase / limit (so the limit grows by increase per round of requests),
+    every congestion signal multiplies it by decrease. Successful requests are those with 2xx status codes,
+    other responses (e.g. 404) change neither the limit nor the learned cost. Congestion signals are failed
+    requests, throttling status codes (429, 503 and other 5xx) and requests whose cost (duration per byte, or
+    duration if size is unknown) exceeds latency_factor times the best cost observed for the host. The limit is
+    decreased at most once per duration of the signalling request so that one burst of errors does not collapse it.
+    The controller is shared by all threads downloading spectra, each of them holds a slot of the host while its
+    request is running. Downloads use try_acquire, so a worker never waits for a throttled host and serves
+    downloads from other hosts instead.
+    """
+
+    THROTTLING_STATUSES = (429, 503)
+
+    def __init__(self, initial=2, minimum=1, maximum=32, increase=1.0, decrease=0.5, latency_factor=3.0,
+                 smoothing=0.2):
+        """
+        :param initial: Initial concurrency limit of every host.
+        :param minimum: Lower bound of concurrency limit.
+        :param maximum: Upper bound of concurrency limit.
+        :param increase: Additive increase of the limit per round of successful requests.
+        :param decrease: Multiplicative decrease of the limit on congestion.
+        :param latency_factor: Ratio of request cost to the best observed one considered as congestion.
+        :param smoothing: Weight of the newest observation in smoothed request cost.
+        """
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError("limits must satisfy 1 <= minimum <= initial <= maximum")
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.smoothing = smoothing
+        self.hosts = dict()
+        self._condition = threading.Condition()
+
+    def _host(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostLimit(self.initial)
+        return state
+
+    def limit(self, host):
+        """Returns current number of requests allowed to run concurrently against the host."""
+        with self._condition:
+            return int(self._host(host).limit)
+
+    def try_acquire(self, host):
+        """Takes request slot of the host if its current limit allows it. Returns False if the host is at the limit."""
+        with self._condition:
+            state = self._host(host)
+            if state.in_flight >= int(state.limit):
+                return False
+            state.in_flight += 1
+            return True
+
+    def acquire(self, host):
+        """Blocks until a new request to the host is allowed by its current limit."""
+        with self._condition:
+            state = self._host(host)
+            while state.in_flight >= int(state.limit):
+                self._condition.wait()
+            state.in_flight += 1
+
+    def cancel(self, host):
+        """Releases request slot of the host without adapting its limit (e.g. slot of abandoned hedged request)."""
+        with self._condition:
+            self._host(host).in_flight -= 1
+            self._condition.notify_all()
+
+    def release(self, host, status_code, elapsed, size=None):
+        """
+        Releases request slot of the host and adapts its limit by the observed result.
+        :param host: Host name of the request.
+        :param status_code: HTTP status code or None if request failed without response.
+        :param elapsed: Duration of the request in seconds.
+        :param size: Number of transferred bytes if known.
+        """
+        cost = elapsed / size if size else elapsed
+        now = time.monotonic()
+        with self._condition:
+            state = self._host(host)
+            state.in_flight -= 1
+            failed = status_code is None or status_code in self.THROTTLING_STATUSES or status_code >= 500
+            if not failed and not 200 <= status_code < 300:
+                # e.g. missing spectrum says nothing about capacity of the host
+                self._condition.notify_all()
+                return
+            if not failed:
+                state.cost = cost if state.cost is None else (1 - self.smoothing) * state.cost + self.smoothing * cost
+                if state.best_cost is None or state.cost < state.best_cost:
+                    state.best_cost = state.cost
+            slow = not failed and cost > self.latency_factor * state.best_cost
+            if failed or slow:
+                state.congestions += 1
+                if now - state.last_decrease >= elapsed:
+                    state.limit = max(self.minimum, state.limit * self.decrease)
+                    state.last_decrease = now
+            else:
+                state.successes += 1
+                state.limit = min(self.maximum, state.limit + self.increase / state.limit)
+            self._condition.notify_all()
@@ -0,0 +1,310 @@
+import abc
+import base64
+import binascii
+import hashlib
+import struct
+
+FITS_BLOCK = 2880
+FITS_CARD = 80
+
+
+class VerificationResult:
+    """Result of one verification check of downloaded spectrum."""
+
+    def __init__(self, check, ok, message=None, values=None):
+        """
+        :param check: Name of the check.
+        :param ok: True if the check passed.
+        :param message: Description of the failure (or of a skipped check).
+        :param values: Dictionary of computed values (e.g. hex digests).
+        """
+        self.check = check
+        self.ok = ok
+        self.message = message
+        self.values = values if values is not None else dict()
+
+    def __str__(self):
+        return "VerificationResult: check={}, ok={}, message={}".format(self.check, self.ok, self.message)
+
+    def __repr__(self):
+        return str(self)
+
+
+class Verifier(abc.ABC):
+    """
+    Base class of verification stages run inside the download loop. For every downloaded spectrum method begin
+    is called and the returned stage object receives every chunk of data by update method. Method finish of
+    the stage returns VerificationResult. Verifiers never read the written file again.
+    """
+
+    @abc.abstractmethod
+    def begin(self, response, file_name):
+        """
+        Starts verification of one download.
+        :param response: HTTP response (its headers can be used for expected values).
+        :param file_name: Final name of the downloaded file.
+        :return: Stage object with methods update(chunk) and finish() returning VerificationResult.
+        """
+
+
+def _parse_digest_header(value):
+    """
+    Parses Digest (RFC 3230) or Content-Digest/Repr-Digest (RFC 9530) header value into dictionary mapping
+    lower case algorithm name to raw digest bytes.
+    """
+    digests = dict()
+    for item in value.split(","):
+        algorithm, sep, encoded = item.strip().partition("=")
+        if not sep:
+            continue
+        encoded = encoded.strip().strip(":")
+        try:
+            digests[algorithm.lower().replace("-", "")] = base64.b64decode(encoded)
+        except (binascii.Error, ValueError):
+            continue
+    return digests
+
+
+class _ChecksumStage:
+    def __init__(self, algorithms, expected):
+        self.hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+        self.expected = expected
+
+    def update(self, chunk):
+        for digest in self.hashes.values():
+            digest.update(chunk)
+
+    def finish(self):
+        values = {algorithm: digest.hexdigest() for algorithm, digest in self.hashes.items()}
+        mismatches = list()
+        for algorithm, expected in self.expected.items():
+            computed = values.get(algorithm)
+            if computed is not None and computed != expected.lower():
+                mismatches.append("{} mismatch (expected {}, computed {})".format(algorithm, expected, computed))
+        if mismatches:
+            return VerificationResult("checksum", False, "; ".join(mismatches), values)
+        message = None if self.expected else "no expected checksum available"
+        return VerificationResult("checksum", True, message, values)
+
+
+class ChecksumVerifier(Verifier):
+    """
+    Computes hashes of the downloaded data while streaming and compares them with expected values from manifest
+    or with Content-MD5 and Digest (Content-Digest, Repr-Digest) HTTP headers. Manifest values take precedence.
+    The headers are ignored if the response has Content-Encoding, because they cover the encoded body while the
+    hashes are computed from the decoded data.
+    """
+
+    def __init__(self, algorithms=("md5", "sha256"), manifest=None):
+        """
+        :param algorithms: Names of computed hash algorithms (hashlib names).
+        :param manifest: Optional dictionary mapping file name to dictionary of expected hex digests by algorithm.
+        """
+        self.algorithms = tuple(algorithms)
+        self.manifest = manifest if manifest is not None else dict()
+
+    def begin(self, response, file_name):
+        expected = dict()
+        headers = response.headers
+        # encoded content is decoded while streaming so digests of the body can not be compared
+        encoded = bool(headers.get("content-encoding"))
+        content_md5 = None if encoded else headers.get("content-md5")
+        if content_md5:
+            try:
+                expected["md5"] = base64.b64decode(content_md5).hex()
+            except (binascii.Error, ValueError):
+                pass
+        for header in ("digest", "content-digest", "repr-digest"):
+            value = None if encoded else headers.get(header)
+            if value:
+                for algorithm, raw in _parse_digest_header(value).items():
+                    expected[algorithm] = raw.hex()
+        expected.update(self.manifest.get(file_name, dict()))
+        return _ChecksumStage(self.algorithms, {key: val for key, val in expected.items() if key in self.algorithms})
+
+
+class _ContentLengthStage:
+    def __init__(self, expected):
+        self.expected = expected
+        self.size = 0
+
+    def update(self, chunk):
+        self.size += len(chunk)
+
+    def finish(self):
+        values = {"size": self.size}
+        if self.expected is None:
+            return VerificationResult("content-length", True, "no Content-Length available", values)
+        if self.size != self.expected:
+            return VerificationResult("content-length", False, "expected {} bytes, received {}".format(
+                self.expected, self.size), values)
+        return VerificationResult("content-length", True, None, values)
+
+
+class ContentLengthVerifier(Verifier):
+    """Checks that the number of received bytes equals to Content-Length HTTP header."""
+
+    def begin(self, response, file_name):
+        expected = None
+        length = response.headers.get("content-length")
+        # encoded content is decoded while streaming so its length differs
+        if length is not None and not response.headers.get("content-encoding"):
+            try:
+                expected = int(length)
+            except ValueError:
+                pass
+        return _ContentLengthStage(expected)
+
+
+def fits_data_size(cards):
+    """
+    Computes size of HDU data in bytes (without padding) from its header.
+    :param cards: Dictionary of header keywords and their string values.
+    """
+    bitpix = abs(int(cards["BITPIX"]))
+    naxis = int(cards["NAXIS"])
+    if naxis == 0:
+        return 0
+    axes = [int(cards["NAXIS{}".format(i)]) for i in range(1, naxis + 1)]
+    if "XTENSION" not in cards and cards.get("GROUPS") == "T":
+        axes = axes[1:]  # random groups - NAXIS1 is 0
+    count = 1
+    for axis in axes:
+        count *= axis
+    pcount = int(cards.get("PCOUNT", "0"))
+    gcount = int(cards.get("GCOUNT", "1"))
+    return bitpix // 8 * gcount * (pcount + count)
+
+
+def parse_fits_cards(header):
+    """
+    Parses FITS header bytes into dictionary of keyword values (strings without quotes and comments). Parsing stops
+    at END card.
+    :return: Tuple of dictionary and offset of END card (None if END card was not found).
+    """
+    cards = dict()
+    for offset in range(0, len(header) - FITS_CARD + 1, FITS_CARD):
+        card = header[offset:offset + FITS_CARD].decode("ascii", "replace")
+        keyword = card[:8].strip()
+        if keyword == "END":
+            return cards, offset
+        if card[8:10] != "= ":
+            continue
+        value = card[10:].strip()
+        if value.startswith("'"):
+            value = value[1:].split("'")[0].strip()
+        else:
+            value = value.split("/")[0].strip()
+        cards[keyword] = value
+    return cards, None
+
+
+def ones_complement_add(total, words_sum):
+    """Folds carries of 32-bit ones' complement sum."""
+    total += words_sum
+    while total >> 32:
+        total = (total & 0xffffffff) + (total >> 32)
+    return total
+
+
+class _FitsStage:
+    def __init__(self, check_datasum, max_header):
+        self.check_datasum = check_datasum
+        self.max_header = max_header
+        self.header = bytearray()
+        self.cards = None
+        self.error = None
+        self.data_remaining = 0
+        self.datasum = 0
+        self.pending = b""
+
+    def update(self, chunk):
+        if self.error is not None:
+            return
+        if self.cards is None:
+            self.header.extend(chunk)
+            if len(self.header) >= FITS_CARD and not self.header.startswith(b"SIMPLE  ="):
+                self.error = "file does not start with SIMPLE keyword"
+                return
+            end = len(self.header) - len(self.header) % FITS_BLOCK
+            cards, end_offset = parse_fits_cards(bytes(self.header[:end]))
+            if end_offset is None:
+                if len(self.header) > self.max_header:
+                    self.error = "END card not found in the first {} bytes".format(self.max_header)
+                return
+            self.cards = cards
+            try:
+                size = fits_data_size(cards)
+            except (KeyError, ValueError) as ex:
+                self.error = "invalid primary header: {}".format(ex)
+                return
+            self.data_remaining = (size + FITS_BLOCK - 1) // FITS_BLOCK * FITS_BLOCK
+            header_size = (end_offset // FITS_BLOCK + 1) * FITS_BLOCK
+            chunk = bytes(self.header[header_size:])
+            self.header = None
+        if self.check_datasum and self.data_remaining > 0 and chunk:
+            data = self.pending + chunk[:self.data_remaining]
+            self.data_remaining -= min(len(chunk), self.data_remaining)
+            usable = len(data) - len(data) % 4
+            self.pending = data[usable:]
+            words = struct.unpack(">{}I".format(usable // 4), data[:usable])
+            self.datasum = ones_complement_add(self.datasum, sum(words))
+
+    def finish(self):
+        if self.error is None and self.cards is None:
+            self.error = "primary header is incomplete"
+        if self.error is not None:
+            return VerificationResult("fits", False, self.error)
+        values = {"simple": self.cards.get("SIMPLE") == "T"}
+        if not values["simple"]:
+            return VerificationResult("fits", False, "SIMPLE keyword is not T", values)
+        if not self.check_datasum or "DATASUM" not in self.cards:
+            return VerificationResult("fits", True, None if self.check_datasum else "DATASUM not checked", values)
+        if self.data_remaining > 0:
+            return VerificationResult("fits", False, "primary data unit is truncated", values)
+        if self.pending:
+            self.datasum = ones_complement_add(self.datasum, struct.unpack(">I", self.pending.ljust(4, b"\0"))[0])
+        values["datasum"] = self.datasum
+        try:
+            expected = int(self.cards["DATASUM"])
+        except ValueError:
+            return VerificationResult("fits", False, "invalid DATASUM value", values)
+        if expected != self.datasum:
+            return VerificationResult("fits", False, "DATASUM mismatch (expected {}, computed {})".format(
+                expected, self.datasum), values)
+        return VerificationResult("fits", True, None, values)
+
+
+class FitsVerifier(Verifier):
+    """
+    Lightweight sanity check of FITS files. Checks that the primary header starts with SIMPLE = T and ends with END
+    card and optionally verifies DATASUM of the primary data unit computed while streaming. Files with other than FITS
+    extension are skipped.
+    """
+
+    def __init__(self, check_datasum=True, extensions=("fits", "fit", "fts"), max_header=100 * FITS_BLOCK):
+        """
+        :param check_datasum: If True, DATASUM keyword of primary header (if present) is verified.
+        :param extensions: File extensions of FITS files.
+        :param max_header: Maximal size of primary header in bytes.
+        """
+        self.check_datasum = check_datasum
+        self.extensions = tuple(extensions)
+        self.max_header = max_header
+
+    def begin(self, response, file_name):
+        if file_name.rsplit(".", 1)[-1].lower() not in self.extensions:
+            return _SkippedStage("fits", "not a FITS file")
+        return _FitsStage(self.check_datasum, self.max_header)
+
+
+class _SkippedStage:
+    def __init__(self, check, message):
+        self.check = check
+        self.message = message
+
+    def update(self, chunk):
+        pass
+
+    def finish(self):
+        return VerificationResult(self.check, True, self.message)
@@ -0,0 +1,356 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import requests
+from ..ssap_parser import parser
+from .downloader import SpectraDownloader
+from .exceptions import DeferredException, SaveException
+from .storage import Storage
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    votable TEXT NOT NULL,
+    parameters TEXT,
+    location TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    row INTEGER NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    name TEXT,
+    size INTEGER,
+    url TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, row)
+);
+CREATE INDEX IF NOT EXISTS items_state ON items (state, lease_until);
+CREATE INDEX IF NOT EXISTS items_order ON items (state, job_id, row);
+"""
+
+
+class WorkItem:
+    """One spectrum claimed from the work queue."""
+
+    def __init__(self, job_id, row, attempts):
+        self.job_id = job_id
+        self.row = row
+        self.attempts = attempts
+
+    def __str__(self):
+        return "WorkItem: job_id={}, row={}, attempts={}".format(self.job_id, self.row, self.attempts)
+
+    def __repr__(self):
+        return str(self)
+
+
+class WorkQueue:
+    """
+    Durable queue of spectra to be downloaded stored in SQLite database file. Every submitted job stores the SSAP
+    VOTable, DataLink parameters and download location, and one item per spectrum. Workers claim items by leases:
+    a claimed item is not given to other workers until its lease expires, so items of crashed workers are claimed
+    again automatically and an interrupted job is resumed with the spectra that were not finished. Failed
+    downloads are retried until max_attempts is reached. Several processes (or hosts sharing a filesystem with
+    working file locks) can drain one queue in parallel, each of them using its own WorkQueue instance. The database
+    uses rollback journal, as write-ahead log of SQLite does not work over network filesystems.
+    """
+
+    def __init__(self, path, lease=300, max_attempts=3):
+        """
+        :param path: Path of the SQLite database file (created if it does not exist).
+        :param lease: Duration of item lease in seconds.
+        :param max_attempts: Number of attempts after which a failing item is marked as failed.
+        """
+        self.path = path
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._connection = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=DELETE")
+        self._connection.executescript(SCHEMA)
+
+    def _transaction(self):
+        """Starts write transaction so that concurrent claims do not interleave."""
+        self._connection.execute("BEGIN IMMEDIATE")
+
+    def submit(self, votable, location, parameters=None, spectra=None):
+        """
+        Adds new job into the queue.
+        :param votable: String containing the XML result of SSAP query.
+        :param location: String definition of location directory the spectra are downloaded to.
+        :param parameters: DataLink protocol parameters or None for direct download.
+        :param spectra: Indexes of rows to be downloaded. All rows are used if None.
+        :return: Identifier of the job.
+        """
+        if spectra is None:
+            spectra = range(len(parser.parse_ssap(votable).rows))
+        connection = self._connection
+        self._transaction()
+        try:
+            cursor = connection.execute("INSERT INTO jobs (votable, parameters, location, created) VALUES (?, ?, ?, ?)",
+                                        (votable, None if parameters is None else json.dumps(parameters), location,
+                                         time.time()))
+            job_id = cursor.lastrowid
+            connection.executemany("INSERT INTO items (job_id, row, state) VALUES (?, ?, ?)",
+                                   ((job_id, row, PENDING) for row in spectra))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return job_id
+
+    def job(self, job_id):
+        """Returns tuple of VOTable string, DataLink parameters and location of the job."""
+        votable, parameters, location = self._connection.execute(
+            "SELECT votable, parameters, location FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return votable, None if parameters is None else json.loads(parameters), location
+
+    def claim(self, worker, limit=1):
+        """
+        Claims pending items and items with expired lease.
+        :param worker: Unique name of the claiming worker.
+        :param limit: Maximal number of claimed items.
+        :return: List of WorkItem instances (empty if there is nothing to do).
+        """
+        connection = self._connection
+        now = time.time()
+        self._transaction()
+        try:
+            # both queries are ordered by indexes, so no pending row is sorted while the database is locked
+            rows = connection.execute(
+                "SELECT job_id, row, attempts FROM items WHERE state = ? ORDER BY job_id, row LIMIT ?",
+                (PENDING, limit)).fetchall()
+            if len(rows) < limit:
+                rows += connection.execute(
+                    "SELECT job_id, row, attempts FROM items WHERE state = ? AND lease_until < ? LIMIT ?",
+                    (LEASED, now, limit - len(rows))).fetchall()
+            connection.executemany(
+                "UPDATE items SET state = ?, worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND row = ?",
+                ((LEASED, worker, now + self.lease, job_id, row) for job_id, row, _ in rows))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return [WorkItem(job_id, row, attempts + 1) for job_id, row, attempts in rows]
+
+    def renew(self, worker):
+        """Extends leases of all items held by the worker."""
+        self._connection.execute("UPDATE items SET lease_until = ? WHERE state = ? AND worker = ?",
+                                 (time.time() + self.lease, LEASED, worker))
+
+    def stage(self, item, worker, name, size):
+        """
+        Records name and size of the spectrum of claimed item just before it is committed to the storage, so that
+        a later attempt can recognize the spectrum stored by an attempt that did not record its result.
+        :return: True if the item is still leased by the worker.
+        """
+        cursor = self._connection.execute(
+            "UPDATE items SET name = ?, size = ? WHERE job_id = ? AND row = ? AND state = ? AND worker = ?",
+            (name, size, item.job_id, item.row, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def staged(self, item):
+        """Returns tuple of name and size of the spectrum recorded by method stage (None, None if not recorded)."""
+        return self._connection.execute("SELECT name, size FROM items WHERE job_id = ? AND row = ?",
+                                        (item.job_id, item.row)).fetchone()
+
+    def complete(self, item, worker, result):
+        """
+        Records result of claimed item. Failed item is returned to the queue unless it reached max_attempts.
+        Result of a worker whose lease was taken over by another worker is ignored.
+        :param item: Claimed WorkItem instance.
+        :param worker: Name of the worker that claimed the item.
+        :param result: DownloadResult instance of the spectrum.
+        :return: True if the result was recorded.
+        """
+        if result.success:
+            state = DONE
+        else:
+            state = FAILED if item.attempts >= self.max_attempts else PENDING
+        cursor = self._connection.execute(
+            "UPDATE items SET state = ?, worker = NULL, lease_until = NULL, name = ?, url = ?, error = ? "
+            "WHERE job_id = ? AND row = ? AND state = ? AND worker = ?",
+            (state, result.name, result.url, None if result.success else str(result.exception), item.job_id,
+             item.row, LEASED, worker))
+        return cursor.rowcount == 1
+
+    def counts(self, job_id=None):
+        """Returns dictionary mapping item state to the number of items (of the job or of all jobs)."""
+        query = "SELECT state, COUNT(*) FROM items"
+        arguments = tuple()
+        if job_id is not None:
+            query += " WHERE job_id = ?"
+            arguments = (job_id,)
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, FAILED: 0}
+        counts.update(dict(self._connection.execute(query + " GROUP BY state", arguments).fetchall()))
+        return counts
+
+    def failed(self, job_id=None):
+        """Returns list of (job_id, row, name, url, error) tuples of items that failed permanently."""
+        query = "SELECT job_id, row, name, url, error FROM items WHERE state = ?"
+        arguments = (FAILED,)
+        if job_id is not None:
+            query += " AND job_id = ?"
+            arguments += (job_id,)
+        return self._connection.execute(query + " ORDER BY job_id, row", arguments).fetchall()
+
+    def close(self):
+        self._connection.close()
+
+
+class _QueueWriter:
+    """Writer counting stored bytes and renewing the lease of the worker while the spectrum is received."""
+
+    def __init__(self, worker, writer):
+        self.worker = worker
+        self.writer = writer
+        self.size = 0
+
+    @property
+    def name(self):
+        return self.writer.name
+
+    def write(self, chunk):
+        self.writer.write(chunk)
+        self.size += len(chunk)
+        self.worker._heartbeat()
+
+    def commit(self):
+        worker = self.worker
+        worker.queue.stage(worker._item, worker.name, self.writer.name, self.size)
+        try:
+            self.writer.commit()
+        except BaseException:
+            # e.g. file of the same name was stored by other process meanwhile
+            worker.queue.stage(worker._item, worker.name, None, None)
+            raise
+
+    def abort(self):
+        self.writer.abort()
+
+
+class _QueueStorage(Storage):
+    """Storage of QueueWorker recording what the current item stored (see WorkQueue.stage)."""
+
+    def __init__(self, worker, storage):
+        self.worker = worker
+        self.storage = storage
+
+    @property
+    def files(self):
+        return self.storage.files
+
+    def prepare(self, location):
+        self.storage.prepare(location)
+
+    def create(self, location, file_name, keys=None):
+        return _QueueWriter(self.worker, self.storage.create(location, file_name, keys))
+
+    def size(self, location, name):
+        return self.storage.size(location, name)
+
+    def close(self):
+        self.storage.close()
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+
+class QueueWorker:
+    """
+    Worker draining WorkQueue. Parsed VOTables of jobs are cached, so every job is parsed once per worker.
+    Run as many workers (in separate processes or on separate hosts) as needed. Leases of claimed items are
+    renewed while spectra are received, so a long download is not claimed by another worker.
+    """
+
+    def __init__(self, queue, name=None, batch_size=10, factory=None):
+        """
+        :param queue: WorkQueue instance (owned by this worker).
+        :param name: Unique name of the worker. Host name and process id are used if None.
+        :param batch_size: Number of items claimed at once.
+        :param factory: Function creating SpectraDownloader from parsed SSAP result (e.g. to set rate limiter or
+        storage). SpectraDownloader constructor is used if None.
+        """
+        self.queue = queue
+        self.name = name if name is not None else "{}-{}".format(socket.gethostname(), os.getpid())
+        self.batch_size = batch_size
+        self.factory = factory if factory is not None else SpectraDownloader
+        self._jobs = dict()
+        self._item = None  # item being downloaded
+        self._renewed = time.monotonic()
+
+    def _job(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is None:
+            votable, parameters, location = self.queue.job(job_id)
+            downloader = self.factory(parser.parse_ssap(votable))
+            downloader.storage = _QueueStorage(self, downloader.storage)
+            downloader._prepare_download(downloader.parsed_ssap.rows, parameters, location)
+            job = self._jobs[job_id] = (downloader, parameters, location)
+        return job
+
+    def _heartbeat(self):
+        """Renews leases of the worker if a third of the lease passed since the last renewal."""
+        now = time.monotonic()
+        if now - self._renewed >= self.queue.lease / 3:
+            self.queue.renew(self.name)
+            self._renewed = now
+
+    def _stored(self, item, location, downloader):
+        """Returns name of the spectrum of the item if it was stored by previous attempt or None."""
+        name, size = self.queue.staged(item)
+        if name is None:
+            return None
+        try:
+            stored_size = downloader.storage.size(location, name)
+        except (OSError, KeyError):
+            return None
+        return name if stored_size == size else None
+
+    def run(self, progress_callback=None):
+        """
+        Downloads claimed items until the queue contains no claimable item. This method is blocking.
+        :param progress_callback: Function called with DownloadResult of every processed spectrum.
+        :return: Number of processed items.
+        """
+        processed = 0
+        session = requests.session()
+        while True:
+            items = self.queue.claim(self.name, self.batch_size)
+            if not items:
+                return processed
+            for item in items:
+                downloader, parameters, location = self._job(item.job_id)
+                spectrum = downloader.parsed_ssap.rows[item.row]
+                self._item = item
+                result = None
+                while result is None:
+                    try:
+                        result = downloader._download_spectrum(session, spectrum, parameters, location)
+                    except DeferredException as ex:
+                        # host is at its concurrency limit shared with other threads
+                        time.sleep(ex.delay)
+                if type(result.exception) is SaveException and item.attempts > 1:
+                    # spectrum may have been stored by interrupted attempt that did not record its result, other
+                    # file of the same name is still a failure
+                    name = self._stored(item, location, downloader)
+                    if name is not None:
+                        result.name = name
+                        result.exception = None
+                self.queue.complete(item, self.name, result)
+                self.queue.renew(self.name)
+                self._renewed = time.monotonic()
+                processed += 1
+                if progress_callback is not None:
+                    progress_callback(result)
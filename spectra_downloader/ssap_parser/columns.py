@@ -0,0 +1,97 @@
+import numpy
+
+# VOTable datatype to NumPy dtype mapping (char and unicodeChar are decoded as strings)
+NUMPY_TYPES = {
+    "boolean": numpy.bool_,
+    "bit": numpy.bool_,
+    "unsignedbyte": numpy.uint8,
+    "short": numpy.int16,
+    "int": numpy.int32,
+    "long": numpy.int64,
+    "float": numpy.float32,
+    "double": numpy.float64,
+    "floatcomplex": numpy.complex64,
+    "doublecomplex": numpy.complex128
+}
+
+TRUE_LITERALS = ("t", "true", "1")
+NULL_LITERALS = ("", "?")
+
+
+def _fixed_size(arraysize):
+    """
+    Returns number of elements of fixed size array column (product of all dimensions) or None for variable length
+    arrays. Only the last dimension may be variable (marked by *).
+    """
+    if arraysize is None:
+        return 1
+    dimensions = arraysize.split("x")
+    if any("*" in dimension for dimension in dimensions[:-1]):
+        raise ValueError("only the last dimension of arraysize can be variable: {}".format(arraysize))
+    if dimensions[-1].endswith("*"):
+        return None
+    size = 1
+    for dimension in dimensions:
+        size *= int(dimension)
+    return size
+
+
+def _decode_booleans(values):
+    lowered = numpy.char.lower(numpy.array(values, dtype=str))
+    result = numpy.isin(lowered, TRUE_LITERALS)
+    mask = numpy.isin(lowered, NULL_LITERALS)
+    if mask.any():
+        return numpy.ma.masked_array(result, mask)
+    return result
+
+
+def _decode_scalars(values, dtype):
+    strings = numpy.array(values, dtype=str)
+    mask = strings == ""
+    if numpy.issubdtype(dtype, numpy.complexfloating):
+        strings = numpy.where(mask, "nan nan", strings)
+        parts = numpy.array(" ".join(strings).split(), dtype=numpy.float64).reshape(-1, 2)
+        return (parts[:, 0] + 1j * parts[:, 1]).astype(dtype)
+    if numpy.issubdtype(dtype, numpy.floating):
+        return numpy.where(mask, "nan", strings).astype(dtype)
+    result = numpy.where(mask, "0", strings).astype(dtype)
+    if mask.any():
+        return numpy.ma.masked_array(result, mask)
+    return result
+
+
+def _decode_arrays(values, dtype, size):
+    if dtype is numpy.bool_:
+        decode = _decode_booleans
+    else:
+        def decode(tokens):
+            return numpy.array(tokens, dtype=dtype)
+    if size is not None and all(values):
+        # all cells have the same length - decode in one call into 2D array
+        return decode(" ".join(values).split()).reshape(len(values), size)
+    result = numpy.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        result[i] = decode(value.split())
+    return result
+
+
+def decode_column(values, datatype, arraysize=None):
+    """
+    Converts list of string cell values of one column into NumPy array according to the FIELD datatype.
+    Empty cells are decoded as NaN in float columns and masked in integer and boolean columns. Unknown
+    datatypes and character columns are decoded as string arrays. Cells of multidimensional array columns are
+    decoded as flat arrays of all their elements.
+    :param values: List of string values of the column.
+    :param datatype: VOTable datatype of the column (FIELD datatype attribute).
+    :param arraysize: VOTable arraysize of the column (FIELD arraysize attribute).
+    :return: NumPy array (or masked array) with decoded values.
+    """
+    dtype = NUMPY_TYPES.get((datatype or "char").lower())
+    if dtype is None:
+        return numpy.array(values, dtype=str)
+    size = _fixed_size(arraysize)
+    if size == 1:
+        if dtype is numpy.bool_:
+            return _decode_booleans(values)
+        return _decode_scalars(values, dtype)
+    return _decode_arrays(values, dtype, size)
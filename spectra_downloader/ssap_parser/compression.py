@@ -0,0 +1,66 @@
+import bz2
+import gzip
+import io
+import lzma
+
+# leading bytes of supported compressed formats
+MAGIC = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"\x28\xb5\x2f\xfd", "zstd")
+)
+
+
+def detect_compression(head):
+    """
+    Detects compression format from leading bytes of the data.
+    :param head: Bytes at the start of the data (at least 6 bytes unless the data are shorter).
+    :return: Name of compression format (gzip, bz2, xz, zstd) or None for uncompressed data.
+    """
+    for magic, compression in MAGIC:
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def _zstd_reader(fileobj):
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Package zstandard is required to read zstd compressed VOTables "
+                          "(install spectra_downloader[zstd])")
+    return zstandard.ZstdDecompressor().stream_reader(fileobj)
+
+
+def decompressing_reader(fileobj, compression):
+    """
+    Wraps binary file-like object by reader decompressing its data on the fly.
+    :param fileobj: Binary file-like object with compressed data.
+    :param compression: Compression format (gzip, bz2, xz, zstd) or None for uncompressed data.
+    :return: Binary file-like object with decompressed data.
+    """
+    if compression is None:
+        return fileobj
+    if compression == "gzip":
+        return gzip.GzipFile(fileobj=fileobj, mode="rb")
+    if compression == "bz2":
+        return bz2.BZ2File(fileobj, mode="rb")
+    if compression == "xz":
+        return lzma.LZMAFile(fileobj, mode="rb")
+    if compression == "zstd":
+        return _zstd_reader(fileobj)
+    raise ValueError("Unsupported compression {}".format(compression))
+
+
+def open_stream(fileobj):
+    """
+    Wraps binary file-like object by reader decompressing its data on the fly if they are compressed. The format is
+    detected from leading bytes of the data, so nothing but a small buffer is read in advance and the decompressed
+    data never exist in memory as a whole.
+    :param fileobj: Binary file-like object (e.g. opened file or raw HTTP response).
+    :return: Binary file-like object with decompressed data.
+    """
+    if not isinstance(fileobj, io.BufferedReader):
+        fileobj = io.BufferedReader(fileobj)
+    return decompressing_reader(fileobj, detect_compression(fileobj.peek(6)[:6]))
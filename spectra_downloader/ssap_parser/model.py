@@ -6,10 +6,30 @@ PUBDID_COLUMN_UTYPE = "ssa:curation.publisherdid"
 class Field:
     """Helping class for saving meta information about parsed columns"""
 
-    def __init__(self, name, utype):
-        """Initialize Field class with name and utype."""
+    def __init__(self, name, utype, datatype=None, arraysize=None, unit=None, ucd=None):
+        """Initialize Field class with name, utype and optional VOTable type information."""
         self.name = name
         self.utype = utype
+        self.datatype = datatype
+        self.arraysize = arraysize
+        self.unit = unit
+        self.ucd = ucd
+
+
+def find_field(fields, key):
+    """
+    Finds index of field specified by its name or utype (utype is compared case insensitively).
+    :param fields: List of Field instances.
+    :param key: Name or utype of the field.
+    :return: Index of the field. KeyError is raised if there is no such field.
+    """
+    for index, field in enumerate(fields):
+        if field.name == key:
+            return index
+    for index, field in enumerate(fields):
+        if field.utype.lower() == key.lower():
+            return index
+    raise KeyError("Unable to find column {}".format(key))
 
 
 class PossibleDataLinkSpec:
@@ -93,6 +113,7 @@ class IndexedSSAPVotable:
         self._pubdid_index = None
         self.datalink_resource_url = None
         self.datalink_input_params = None
+        self._column_cache = dict()
         for field in column_fields:
             utype = field.utype.lower()
             if utype == ACCREF_COLUMN_UTYPE:
@@ -109,6 +130,54 @@ class IndexedSSAPVotable:
         """
         return self.query_status.upper() == "OK"
 
+    @property
+    def query_overflow(self):
+        """
+        This property indicates the service truncated the result because of MAXREC limit (query status
+        is set to OVERFLOW value). Rows of such result are valid however further rows exist.
+        :return: True if query status is OVERFLOW
+        """
+        return self.query_status.upper() == "OVERFLOW"
+
+    def extend(self, other):
+        """
+        Appends rows of another parsing result (e.g. next page of the same SSAP query) to this instance. Both
+        results must have the same column specification. DataLink specification of this instance is kept.
+        :param other: Instance of IndexedSSAPVotable with the same columns.
+        """
+        own_names = [field.name for field in self.column_fields]
+        other_names = [field.name for field in other.column_fields]
+        if own_names != other_names:
+            raise ValueError("Unable to merge SSAP results with different column specification")
+        self.rows.extend(other.rows)
+        self._column_cache.clear()
+
+    def column_index(self, key):
+        """
+        Finds index of column specified by its name or utype (utype is compared case insensitively).
+        :param key: Name or utype of the column.
+        :return: Index of the column.
+        """
+        return find_field(self.column_fields, key)
+
+    def column(self, key):
+        """
+        Returns values of the whole column decoded into NumPy array according to FIELD datatype and arraysize.
+        The column is decoded on the first access only and the result is cached, columns that are never
+        accessed are never decoded. This method requires NumPy.
+        :param key: Name or utype of the column.
+        :return: NumPy array (or masked array if column contains empty cells) with decoded values.
+        """
+        index = self.column_index(key)
+        decoded = self._column_cache.get(index)
+        if decoded is None:
+            from . import columns
+            field = self.column_fields[index]
+            decoded = columns.decode_column([row.columns[index] for row in self.rows],
+                                            field.datatype, field.arraysize)
+            self._column_cache[index] = decoded
+        return decoded
+
     def setup_datalink(self, resource_url, input_params):
         """This method tries to setup datalink in the object instance. It checks that pubdid field is present in definition
         and datalink specification input params contain this input field too."""
@@ -1,11 +1,23 @@
+import io
 import xml.sax
-from . import model
+from . import compression, model
 
 
 class SsapVotableHandler(xml.sax.ContentHandler):
     """This class is used as a content handler for the SsapParser class"""
 
-    def __init__(self):
+    def __init__(self, columns=None, predicate=None):
+        """
+        :param columns: Optional names or utypes of columns to be kept (ACCREF and PUBDID columns are kept always).
+        Cells of other columns are skipped while parsing. All columns are kept if None.
+        :param predicate: Optional function deciding whether the row is kept. It is called with dictionary mapping
+        names of kept columns to cell values of the row while parsing.
+        """
+        self.projection = columns
+        self.predicate = predicate
+        self.kept_indexes = None  # indexes of kept cells (None if all cells are kept)
+        self.kept_names = None
+        self.cell_index = 0
         self.is_result_resource = False
         self.inside_td = False
         self.result_fields = list()
@@ -39,14 +51,18 @@ class SsapVotableHandler(xml.sax.ContentHandler):
                 # found FIELD tag - save this field as parsed meta info about column
                 name = attrs.get("name", "undefined")
                 utype = attrs.get("utype", "undefined")
-                self.result_fields.append(model.Field(name, utype))
+                self.result_fields.append(model.Field(name, utype, attrs.get("datatype"), attrs.get("arraysize"),
+                                                      attrs.get("unit"), attrs.get("ucd")))
             # PARAM tags are ignored
             elif name == "TR":
                 # found one row TAG in records - must switch to cell reading
+                if self.kept_names is None:
+                    self.setup_projection()
                 self.columns = list()  # invalidate current column to load new data
+                self.cell_index = 0
             elif name == "TD":
-                # found cell tag - switch to reading cell information
-                self.inside_td = True
+                # found cell tag - switch to reading cell information (unless the column is not projected)
+                self.inside_td = self.kept_indexes is None or self.cell_index in self.kept_indexes
         # check if reading another resource - try to find out information about DataLink query possibility
         if self.loading_next_resource:
             # resource must contain tag GROUP with attributes name="inputParams"
@@ -88,17 +104,21 @@ class SsapVotableHandler(xml.sax.ContentHandler):
                     self.loading_datalink_spec = None
         # check for end of column in resource element
         if self.columns is not None and name == "TR":
-            self.result_records.append(model.Record(self.columns))
+            # rows rejected by predicate are dropped immediately
+            if self.predicate is None or self.predicate(dict(zip(self.kept_names, self.columns))):
+                self.result_records.append(model.Record(self.columns))
             self.columns = None
         # check for end of cell inside column
-        if self.inside_td and name == "TD":
-            self.inside_td = True
-            if self.column_data is not None:
-                self.columns.append(self.column_data.strip())  # throw out unnecessary whitespaces
-                self.column_data = None
-            else:
-                # no characters read - insert empty column
-                self.columns.append("")
+        if self.columns is not None and name == "TD":
+            if self.inside_td:
+                self.inside_td = False
+                if self.column_data is not None:
+                    self.columns.append(self.column_data.strip())  # throw out unnecessary whitespaces
+                    self.column_data = None
+                else:
+                    # no characters read - insert empty column
+                    self.columns.append("")
+            self.cell_index += 1
         # check for input param group
         if self.loading_input_param_group and name == "GROUP":
             self.loading_input_param_group = False
@@ -110,6 +130,19 @@ class SsapVotableHandler(xml.sax.ContentHandler):
                 self.loading_datalink_spec.external_params[self.loading_param.name] = self.loading_param
             self.loading_param = None
 
+    def setup_projection(self):
+        """Resolves projected columns once all FIELD tags are known and reduces fields to the kept ones."""
+        if self.projection is not None:
+            kept = set()
+            for key in self.projection:
+                kept.add(model.find_field(self.result_fields, key))
+            for index, field in enumerate(self.result_fields):
+                if field.utype.lower() in (model.ACCREF_COLUMN_UTYPE, model.PUBDID_COLUMN_UTYPE):
+                    kept.add(index)
+            self.kept_indexes = kept
+            self.result_fields = [field for index, field in enumerate(self.result_fields) if index in kept]
+        self.kept_names = [field.name for field in self.result_fields]
+
     def characters(self, content):
         """This method is called whenever parser finds XML text node. Characters are passed together as content."""
         # only text that is expected in votable parsing is inside TD elements
@@ -129,6 +162,9 @@ def _build_result(handler):
     IndexedSSAPVotable.
     """
     """"""
+    if handler.kept_names is None:
+        # no rows were parsed
+        handler.setup_projection()
     votable = model.IndexedSSAPVotable(handler.query_status, handler.result_fields, handler.result_records)
     # choose proper DataLink service, if any
     best = None
@@ -147,19 +183,26 @@ def _build_result(handler):
     return votable
 
 
-def parse_ssap(votable):
+def parse_ssap(votable, columns=None, predicate=None):
     """
     This is a starting method of SSAP parsing. Method creates parser handler and parses passed String - the XML result
     of SSAP query.
-    :param votable: String containing the XML result of SSAP query.
+    :param votable: String or bytes containing the XML result of SSAP query or binary file-like object it is read
+    from. Data compressed by gzip, bzip2, xz or zstd (requires package zstandard) are detected and decompressed
+    on the fly, the file-like object is read incrementally so the decompressed XML is never held in memory as a whole.
+    :param columns: Optional names or utypes of columns to be kept in the result. ACCREF and PUBDID columns are
+    always kept. Cells of other columns are never stored. All columns are kept if None.
+    :param predicate: Optional function called with dictionary mapping names of kept columns to cell values of every
+    row. Rows for which it returns False are dropped while parsing.
     :return: Instance of IndexedSSAPVotable - votable parsed in a useful form.
     """
     # setup new handler object
-    handler = SsapVotableHandler()
+    handler = SsapVotableHandler(columns, predicate)
     # parse passed string argument
-    byte_votable = votable
     if type(votable) is str:
-        byte_votable = votable.encode()
-    xml.sax.parseString(byte_votable, handler)
+        votable = votable.encode()
+    if type(votable) is bytes:
+        votable = io.BytesIO(votable)
+    xml.sax.parse(compression.open_stream(votable), handler)
     # fetch results from handler
     return _build_result(handler)
@@ -0,0 +1,71 @@
+import io
+import time
+import pytest
+import requests
+
+
+class FakeResponse:
+    """Streamed HTTP response with fixed content."""
+
+    def __init__(self, content=b"", status_code=200, headers=None, url=None, delay=0.0):
+        self.content = content
+        self.status_code = status_code
+        self.headers = headers if headers is not None else dict()
+        self.url = url
+        self.raw = io.BytesIO(content)
+        self.delay = delay  # delay before every chunk in seconds
+        self.sent = 0
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for offset in range(0, len(self.content), chunk_size):
+            if self.delay:
+                time.sleep(self.delay)
+            chunk = self.content[offset:offset + chunk_size]
+            self.sent += len(chunk)
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """
+    HTTP session recording requested URLs, their timeouts and created responses. Responses are configured by
+    attributes: content (bytes or function returning content of URL), headers, status_codes (dictionary mapping URL
+    substrings to status codes, 200 is used if none matches) and delay of every chunk.
+    """
+
+    def __init__(self, content=b"data", headers=None, status_codes=None, delay=0.0):
+        self.content = content
+        self.headers = headers if headers is not None else dict()
+        self.status_codes = status_codes if status_codes is not None else dict()
+        self.delay = delay
+        self.requested = list()
+        self.timeouts = list()
+        self.responses = list()
+
+    def respond(self, url, headers=None):
+        """Creates response to the request (subclasses may serve e.g. ranges)."""
+        status_code = next((code for part, code in self.status_codes.items() if part in url), 200)
+        content = self.content(url) if callable(self.content) else self.content
+        return FakeResponse(content, status_code, dict(self.headers), url, self.delay)
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        response = self.respond(url, headers)
+        self.requested.append(url)
+        self.timeouts.append(timeout)
+        self.responses.append(response)
+        return response
+
+
+@pytest.fixture
+def http(request, monkeypatch):
+    """
+    Replaces HTTP sessions and requests.get by one FakeSession and returns it. Arguments of the session can be
+    passed by indirect parametrization, e.g. parametrize("http", [{"status_codes": {"a.org": 404}}], indirect=True).
+    """
+    session = FakeSession(**getattr(request, "param", dict()))
+    monkeypatch.setattr(requests, "session", lambda: session)
+    monkeypatch.setattr(requests, "get", session.get)
+    return session
@@ -0,0 +1,102 @@
+import pytest
+import json
+import os
+from spectra_downloader import cli
+from spectra_downloader.downloader import scheduler
+from tests import test_parser
+
+
+@pytest.fixture
+def fake_session(http):
+    http.content = b"1,2\n"
+    http.headers = {"content-type": "text/csv"}
+
+
+@pytest.fixture
+def votable_file():
+    return os.path.join(os.path.dirname(test_parser.__file__), "test_parser", "ssap1.xml")
+
+
+def read_events(path):
+    with open(path, "r") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_parse_parameters():
+    """Test parsing of DataLink parameters."""
+    assert cli.parse_parameters([]) is None
+    assert cli.parse_parameters(["FORMAT=text/csv", "BAND=1e-7 2e-7"]) == {"FORMAT": "text/csv",
+                                                                         "BAND": "1e-7 2e-7"}
+
+
+def test_read_jobs(tmpdir):
+    """Test reading of job list file with plain and JSON lines."""
+    jobs_file = tmpdir.join("jobs.txt")
+    jobs_file.write("# comment\n\nhttp://archive.org/ssap?REQUEST=queryData\n"
+                    '{"source": "result.xml", "datalink": {"FORMAT": "text/csv"}, "output": "csv"}\n')
+    jobs = cli.read_jobs(str(jobs_file), None, "out")
+    assert len(jobs) == 2
+    assert jobs[0].parameters is None
+    assert jobs[0].location == "out"
+    assert jobs[1].source == "result.xml"
+    assert jobs[1].parameters == {"FORMAT": "text/csv"}
+    assert jobs[1].location == os.path.join("out", "csv")
+
+
+def test_batch_direct(fake_session, votable_file, tmpdir):
+    """Test batch run with direct downloading and JSON lines output."""
+    log = str(tmpdir.join("log.jsonl"))
+    output = str(tmpdir.join("out"))
+    code = cli.main([votable_file, "missing.xml", "-o", output, "-w", "3", "-l", log])
+    assert code == 1  # missing.xml could not be loaded
+    events = read_events(log)
+    assert [event["event"] for event in events[:2]] == ["source", "source_error"]
+    results = [event for event in events if event["event"] == "result"]
+    assert len(results) == 30
+    assert all(event["success"] for event in results)
+    summary = events[-1]
+    assert summary["event"] == "summary"
+    assert summary["total"] == 30
+    assert summary["succeeded"] == 30
+    assert "tg160037.fit" in os.listdir(output)
+    assert len(os.listdir(output)) == 30
+
+
+def test_batch_same_location(fake_session, votable_file, tmpdir):
+    """Test that jobs downloading into one directory share its storage and do not overwrite each other."""
+    log = str(tmpdir.join("log.jsonl"))
+    output = str(tmpdir.join("out"))
+    assert cli.main([votable_file, votable_file, "-o", output, "-w", "3", "-l", log]) == 1
+    summary = read_events(log)[-1]
+    assert summary["total"] == 60
+    assert summary["succeeded"] == 30
+    assert len(os.listdir(output)) == 30
+
+
+def test_no_sources():
+    """Test that at least one source is required."""
+    with pytest.raises(SystemExit):
+        cli.main(["-o", "out"])
+
+
+def test_load_link_timeout(http, votable_file, tmpdir):
+    """Test that SSAP query of link source uses the configured timeout."""
+    with open(votable_file, "rb") as f:
+        http.content = f.read()
+    job = cli.Job("http://archive.org/ssap?REQUEST=queryData", None, str(tmpdir))
+    job.load(12.5, None)
+    assert http.timeouts == [12.5]
+    assert job.downloader.timeout == 12.5
+
+
+def test_batch_shared_scheduler(fake_session, votable_file, tmpdir):
+    """Test that batch downloads run on passed scheduler which is left running."""
+    output = tmpdir.join("log.jsonl")
+    shared = scheduler.Scheduler(max_workers=2)
+    jobs = [cli.Job(votable_file, None, str(tmpdir.join("a"))), cli.Job(votable_file, None, str(tmpdir.join("b")))]
+    with open(str(output), "w") as f:
+        assert cli.BatchRunner(jobs, 2, 5, None, f, scheduler=shared).run()
+    assert jobs[0].downloader.scheduler is shared
+    assert read_events(str(output))[-1]["succeeded"] == 60
+    assert shared.submit(lambda session, index: index, 1).wait(5)
+    shared.shutdown()
@@ -0,0 +1,49 @@
+import bz2
+import gzip
+import io
+import lzma
+import pytest
+from spectra_downloader import parse_ssap
+from spectra_downloader.downloader import downloader
+from spectra_downloader.ssap_parser import compression
+from tests import test_parser
+
+
+@pytest.fixture
+def ssap1():
+    return test_parser.read_file("ssap1.xml").encode()
+
+
+@pytest.mark.parametrize("compress,expected", ((gzip.compress, "gzip"), (bz2.compress, "bz2"),
+                                               (lzma.compress, "xz"), (lambda data: data, None)))
+def test_parse_compressed(ssap1, compress, expected):
+    """Test detection of compression format and parsing of compressed bytes and file-like objects."""
+    data = compress(ssap1)
+    assert compression.detect_compression(data[:6]) == expected
+    rows = parse_ssap(ssap1).rows
+    assert len(parse_ssap(data).rows) == len(rows)
+    assert parse_ssap(io.BytesIO(data)).rows[0].columns == rows[0].columns
+
+
+def test_parse_zstd(ssap1):
+    """Test parsing of zstd compressed VOTable."""
+    zstandard = pytest.importorskip("zstandard")
+    data = zstandard.ZstdCompressor().compress(ssap1)
+    assert compression.detect_compression(data) == "zstd"
+    assert len(parse_ssap(data).rows) == len(parse_ssap(ssap1).rows)
+
+
+def test_from_file(ssap1, tmpdir):
+    """Test that from_file decompresses gzip file while parsing."""
+    path = tmpdir.join("ssap1.xml.gz")
+    path.write_binary(gzip.compress(ssap1))
+    res = downloader.SpectraDownloader.from_file(str(path))
+    assert len(res.parsed_ssap.rows) == len(parse_ssap(ssap1).rows)
+
+
+def test_from_link(ssap1, http):
+    """Test that from_link parses raw stream of the response."""
+    http.content = gzip.compress(ssap1)
+    res = downloader.SpectraDownloader.from_link("http://a.org/ssap.xml")
+    assert len(res.parsed_ssap.rows) == len(parse_ssap(ssap1).rows)
+    assert http.responses[0].closed
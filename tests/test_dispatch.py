@@ -0,0 +1,85 @@
+import pytest
+import threading
+import time
+from spectra_downloader.downloader import downloader, dispatch
+from spectra_downloader.ssap_parser import model
+
+
+def test_slow_callback_off_thread():
+    """Test that queuing does not wait for slow callback and results are delivered in order."""
+    delivered = list()
+    release = threading.Event()
+
+    def callback(result):
+        release.wait()
+        delivered.append(result)
+
+    dispatcher = dispatch.CallbackDispatcher(callback)
+    started = time.monotonic()
+    for index in range(100):
+        dispatcher(index)
+    assert time.monotonic() - started < 0.5
+    release.set()
+    dispatcher.close()
+    assert delivered == list(range(100))
+    with pytest.raises(RuntimeError):
+        dispatcher(100)
+
+
+def test_batching():
+    """Test delivery of results in batches by size and by interval."""
+    batches = list()
+    dispatcher = dispatch.CallbackDispatcher(batches.append, batch_size=3)
+    for index in range(7):
+        dispatcher(index)
+    dispatcher.flush()
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+    dispatcher.close()
+    batches = list()
+    dispatcher = dispatch.CallbackDispatcher(batches.append, interval=0.05)
+    dispatcher(0)
+    dispatcher(1)
+    time.sleep(0.3)
+    assert batches == [[0, 1]]
+    dispatcher.close()
+
+
+@pytest.mark.parametrize("policy,expected", (("drop", [0, 1, 2]), ("coalesce", [0, 1, 5])))
+def test_full_queue_policy(policy, expected):
+    """Test drop and coalesce policies applied when the queue is full."""
+    delivered = list()
+    release = threading.Event()
+    first = threading.Event()
+
+    def callback(result):
+        first.set()
+        release.wait()
+        delivered.append(result)
+
+    dispatcher = dispatch.CallbackDispatcher(callback, max_queue=2, policy=policy)
+    dispatcher(0)
+    first.wait()  # result 0 is being delivered, queue is empty
+    for index in range(1, 6):
+        dispatcher(index)
+    release.set()
+    dispatcher.close()
+    assert delivered == expected
+    assert dispatcher.dropped + dispatcher.coalesced == 3
+
+
+def test_download_with_dispatcher(http, tmpdir):
+    """Test that done callback is called after all results are delivered by dispatcher."""
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record(["http://a.org/{}.fits".format(i)])
+                                                    for i in range(5)])
+    events = list()
+
+    def callback(batch):
+        time.sleep(0.05)
+        events.extend(result.name for result in batch)
+
+    inst = downloader.SpectraDownloader(table)
+    dispatcher = dispatch.CallbackDispatcher(callback, batch_size=2)
+    inst.download_direct(table.rows, str(tmpdir), dispatcher, events.append, False)
+    dispatcher.close()
+    assert events == ["{}.fits".format(i) for i in range(5)] + [True]
@@ -0,0 +1,84 @@
+import pytest
+import threading
+import time
+from spectra_downloader.downloader import hedging
+from tests.conftest import FakeSession
+
+
+class StallingSession(FakeSession):
+    """Session stalling the first request and answering the other ones immediately."""
+
+    def __init__(self, stall=0.5):
+        super().__init__()
+        self.stall = stall
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def get(self, url, stream=False, timeout=None, headers=None):
+        with self._lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            time.sleep(self.stall)
+        return super().get(url, stream, timeout, headers)
+
+
+def test_delay_percentile():
+    """Test adaptive hedging delay."""
+    policy = hedging.HedgingPolicy(percentile=0.9, initial_delay=2.0, min_samples=10)
+    assert policy.delay() == 2.0
+    for i in range(1, 11):
+        policy.record(i / 10)
+    assert policy.delay() == 1.0
+    policy.shutdown()
+
+
+def test_hedged_request_wins():
+    """Test that stalled request is duplicated and the first response is used."""
+    policy = hedging.HedgingPolicy(budget=1.0, initial_delay=0.05)
+    session = StallingSession()
+    started = time.monotonic()
+    response, url = policy.get(session, "http://a.org/x", 5, "http://b.org/x")
+    assert time.monotonic() - started < 0.4
+    assert url == "http://b.org/x"
+    assert policy.hedges == 1
+    time.sleep(0.6)
+    # abandoned response is closed
+    assert session.responses[1].url == "http://a.org/x"
+    assert session.responses[1].closed
+    policy.shutdown()
+
+
+def test_budget_exhausted():
+    """Test that no duplicate request is issued without budget."""
+    policy = hedging.HedgingPolicy(budget=0.0, initial_delay=0.05)
+    session = StallingSession(stall=0.2)
+    response, url = policy.get(session, "http://a.org/x", 5, "http://b.org/x")
+    assert url == "http://a.org/x"
+    assert session.calls == 1
+    assert policy.hedges == 0
+    policy.shutdown()
+
+
+def test_hedge_not_reserved():
+    """Test that duplicate request is not sent if it cannot be reserved and the budget is returned."""
+    policy = hedging.HedgingPolicy(budget=1.0, initial_delay=0.05)
+    session = StallingSession(stall=0.2)
+    reserved = list()
+
+    def reserve(url):
+        reserved.append(url)
+        return False
+
+    response, url = policy.get(session, "http://a.org/x", 5, "http://b.org/x", reserve)
+    assert url == "http://a.org/x"
+    assert reserved == ["http://b.org/x"]
+    assert session.calls == 1
+    assert policy.hedges == 0
+    policy.shutdown()
+
+
+def test_invalid_percentile():
+    """Test validation of percentile."""
+    with pytest.raises(ValueError):
+        hedging.HedgingPolicy(percentile=95)
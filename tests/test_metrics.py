@@ -0,0 +1,58 @@
+import pytest
+from urllib.request import urlopen
+from spectra_downloader.downloader import downloader, metrics
+from spectra_downloader.ssap_parser import model
+
+
+@pytest.fixture
+def table():
+    fields = [model.Field("accref", "ssa:access.reference")]
+    rows = [model.Record([url]) for url in ("http://a.org/1.fits", "http://a.org/2.fits", "http://b.org/busy.fits")]
+    return model.IndexedSSAPVotable("OK", fields, rows)
+
+
+@pytest.mark.parametrize("http", [{"content": b"x" * 1034, "status_codes": {"busy": 503}}], indirect=True)
+def test_registry_collects_download_events(http, table, tmpdir):
+    """Test that registry hook receives events of downloading."""
+    registry = metrics.MetricsRegistry()
+    inst = downloader.SpectraDownloader(table, metrics=registry)
+    inst.download_direct(table.rows, str(tmpdir), None, None, False)
+    snapshot = registry.snapshot()
+    assert snapshot["in_flight"] == 0
+    assert snapshot["requests"] == {"a.org 200": 2, "b.org 503": 1}
+    assert snapshot["bytes"] == 2 * 1034
+    assert snapshot["succeeded"] == 2
+    assert snapshot["failed"] == 1
+    assert snapshot["bytes_per_second"] > 0
+
+
+def test_parse_time(table):
+    """Test that parsing time is reported by factory methods."""
+    registry = metrics.MetricsRegistry()
+    downloader.SpectraDownloader.from_string("<VOTABLE></VOTABLE>", registry)
+    assert registry.parse_count == 1
+
+
+def test_composite_hook():
+    """Test forwarding of events to several hooks."""
+    first, second = metrics.MetricsRegistry(), metrics.MetricsRegistry()
+    hook = metrics.CompositeHook(first, second)
+    hook.request_started("a.org")
+    hook.queue_depth(7)
+    assert first.in_flight["a.org"] == second.in_flight["a.org"] == 1
+    assert first.queued == second.queued == 7
+
+
+def test_prometheus_exporter():
+    """Test serving of metrics in Prometheus text format."""
+    registry = metrics.MetricsRegistry()
+    registry.request_started("a.org")
+    registry.request_finished("a.org", 404, 0.5)
+    exporter = metrics.PrometheusExporter(registry, port=0).start()
+    try:
+        body = urlopen("http://127.0.0.1:{}/metrics".format(exporter.port)).read().decode()
+    finally:
+        exporter.stop()
+    assert "# TYPE spectra_downloader_requests_total counter" in body
+    assert 'spectra_downloader_requests_total{host="a.org",status="404"} 1' in body
+    assert 'spectra_downloader_requests_in_flight{host="a.org"} 0' in body
@@ -0,0 +1,125 @@
+import pytest
+import time
+from spectra_downloader.downloader import downloader, hedging, metrics, mirrors, throttle
+from spectra_downloader.ssap_parser import model
+from tests.conftest import FakeSession
+
+
+@pytest.fixture
+def requested(http):
+    """Replaces HTTP session of downloader and returns list of requested URLs."""
+    http.status_codes = {"down.org": 503}
+    return http.requested
+
+
+def make_table(host, names):
+    fields = [model.Field("accref", "ssa:access.reference"), model.Field("pubdid", "ssa:curation.publisherdid")]
+    rows = [model.Record(["http://{}/data/{}.fits".format(host, name), "ivo://archive/" + name]) for name in names]
+    return model.IndexedSSAPVotable("OK", fields, rows)
+
+
+def test_rank():
+    """Test ordering of mirrors by learned throughput, probe latency and health."""
+    selector = mirrors.MirrorSelector(failure_threshold=1)
+    urls = ["http://slow.org/a", "http://fast.org/a", "http://new.org/a", "http://down.org/a"]
+    selector.record_success(urls[0], 2.0, 1000)
+    selector.record_success(urls[1], 0.5, 1000)
+    selector.record_failure(urls[3])
+    assert selector.rank(urls) == ["http://new.org/a", "http://fast.org/a", "http://slow.org/a",
+                                   "http://down.org/a"]
+    assert selector.hosts["fast.org"].throughput == 2000
+    # larger files take longer but the host serving them faster is preferred
+    selector.record_success("http://big.org/a", 4.0, 100000)
+    selector.record_latency("http://probed.org/a", 0.1)
+    selector.record_latency("http://slow-probe.org/a", 0.5)
+    urls = ["http://slow-probe.org/a", "http://probed.org/a", "http://fast.org/a", "http://big.org/a"]
+    assert selector.rank(urls) == ["http://probed.org/a", "http://slow-probe.org/a", "http://big.org/a",
+                                   "http://fast.org/a"]
+    assert selector.hosts["probed.org"].duration is None
+
+
+def test_average():
+    """Test smoothing of learned duration."""
+    selector = mirrors.MirrorSelector(smoothing=0.5)
+    selector.record_success("http://a.org/x", 1.0)
+    selector.record_success("http://a.org/x", 3.0)
+    assert selector.hosts["a.org"].duration == 2.0
+
+
+def test_cooldown():
+    """Test suspension of repeatedly failing host."""
+    selector = mirrors.MirrorSelector(failure_threshold=2, cooldown=60)
+    selector.record_failure("http://a.org/x")
+    assert selector.hosts["a.org"].healthy(time.monotonic())
+    selector.record_failure("http://a.org/x")
+    assert not selector.hosts["a.org"].healthy(time.monotonic())
+    selector.record_success("http://a.org/x", 1.0)
+    assert selector.hosts["a.org"].healthy(time.monotonic())
+
+
+def test_failover(requested, tmpdir):
+    """Test downloading from mirror when primary archive fails."""
+    primary = make_table("down.org", ["s1", "s2", "s3"])
+    selector = mirrors.MirrorSelector(failure_threshold=1)
+    selector.add_votable(primary)
+    selector.add_votable(make_table("up.org", ["s1", "s2"]))
+    inst = downloader.SpectraDownloader(primary, mirrors=selector)
+    inst.download_direct(primary.rows, str(tmpdir), None, None, False)
+    results = inst.last_download_results
+    assert [result.success for result in results] == [True, True, False]
+    assert results[0].url == "http://up.org/data/s1.fits"
+    assert results[0].name == "s1.fits"
+    # down.org is suspended after the first failure so the second spectrum goes directly to up.org
+    assert requested[:3] == ["http://down.org/data/s1.fits", "http://up.org/data/s1.fits",
+                             "http://up.org/data/s2.fits"]
+    assert sorted(tmpdir.listdir()) == [tmpdir.join("s1.fits"), tmpdir.join("s2.fits")]
+
+
+def test_missing_spectrum_is_not_host_failure(requested, http, tmpdir):
+    """Test that 404 of a spectrum missing in one archive moves to the next mirror without suspending the archive."""
+    http.status_codes["partial.org"] = 404
+    primary = make_table("partial.org", ["s1", "s2"])
+    selector = mirrors.MirrorSelector(failure_threshold=1)
+    selector.add_votable(primary)
+    selector.add_votable(make_table("up.org", ["s1", "s2"]))
+    inst = downloader.SpectraDownloader(primary, mirrors=selector)
+    inst.download_direct(primary.rows, str(tmpdir), None, None, False)
+    assert all(result.success for result in inst.last_download_results)
+    assert selector.hosts["partial.org"].failures == 0
+    assert selector.hosts["partial.org"].healthy(time.monotonic())
+    assert requested == ["http://partial.org/data/s1.fits", "http://up.org/data/s1.fits",
+                         "http://partial.org/data/s2.fits", "http://up.org/data/s2.fits"]
+
+
+def test_hedged_mirror(monkeypatch, tmpdir):
+    """Test that statistics and result belong to the mirror whose hedged request won."""
+
+    class StallingSession(FakeSession):
+        def get(self, url, stream=False, timeout=None, headers=None):
+            if "slow.org" in url:
+                time.sleep(0.5)
+            return super().get(url, stream, timeout, headers)
+
+    monkeypatch.setattr(downloader.requests, "session", StallingSession)
+    primary = make_table("slow.org", ["s1"])
+    selector = mirrors.MirrorSelector()
+    selector.add_votable(primary)
+    selector.add_votable(make_table("fast.org", ["s1"]))
+    policy = hedging.HedgingPolicy(budget=1.0, initial_delay=0.05)
+    registry = metrics.MetricsRegistry()
+    controller = throttle.AIMDController()
+    inst = downloader.SpectraDownloader(primary, mirrors=selector, hedging=policy, metrics=registry,
+                                        concurrency=controller)
+    inst.download_direct(primary.rows, str(tmpdir), None, None, False)
+    policy.shutdown()
+    result = inst.last_download_results[0]
+    assert result.success
+    assert result.url == "http://fast.org/data/s1.fits"
+    assert selector.hosts["fast.org"].successes == 1
+    assert selector.hosts["slow.org"].successes == 0
+    assert dict(registry.bytes) == {"fast.org": 4}
+    assert registry.snapshot()["requests"] == {"fast.org 200": 1, "slow.org abandoned": 1}
+    assert registry.snapshot()["in_flight"] == 0
+    assert controller.hosts["fast.org"].successes == 1
+    assert controller.hosts["slow.org"].successes == 0
+    assert controller.hosts["slow.org"].in_flight == controller.hosts["fast.org"].in_flight == 0
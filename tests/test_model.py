@@ -9,6 +9,16 @@ def test_field():
     field = model.Field(name, utype)
     assert field.name == name
     assert field.utype == utype
+    assert field.datatype is None
+
+
+def test_field_types():
+    """Test instantiation of Field class with VOTable type information."""
+    field = model.Field("accsize", "ssa:access.size", "int", None, "byte", "VOX:Image_FileSize")
+    assert field.datatype == "int"
+    assert field.arraysize is None
+    assert field.unit == "byte"
+    assert field.ucd == "VOX:Image_FileSize"
 
 
 def test_possible_datalink():
@@ -132,3 +142,70 @@ def test_indexed_get_refname(indexed_table):
     assert indexed_table.get_refname(rows[1]) == "ref2.vot"
     assert indexed_table.get_refname(rows[2]) == "ref3.fit"
     assert indexed_table.get_refname(rows[3]) == "ref4.vot"
+
+
+@pytest.mark.parametrize("status", ("overflow", "OVERFLOW", "Overflow"))
+def test_indexed_overflow_status(fields, records, status):
+    """Test OVERFLOW status in IndexedSSAPVotable."""
+    res = model.IndexedSSAPVotable(status, fields, records)
+    assert res.query_overflow
+    assert not res.query_ok
+
+
+def test_indexed_extend(fields, records):
+    """Test merging of two results with the same columns."""
+    res = model.IndexedSSAPVotable("OVERFLOW", fields, records[:2])
+    res.extend(model.IndexedSSAPVotable("OK", fields, records[2:]))
+    assert len(res.rows) == 4
+    assert res.get_pubdid(res.rows[3]) == "did4"
+
+
+def test_indexed_extend_different_columns(fields, records):
+    """Test merging of results with different columns is refused."""
+    res = model.IndexedSSAPVotable("OK", fields, records)
+    with pytest.raises(ValueError):
+        res.extend(model.IndexedSSAPVotable("OK", fields[:2], list()))
+
+
+def test_indexed_column():
+    """Test lazy typed decoding of columns."""
+    numpy = pytest.importorskip("numpy")
+    fields = [
+        model.Field("size", "ssa:access.size", "int"),
+        model.Field("ra", "utype1", "double"),
+        model.Field("pos", "utype2", "float", "2"),
+        model.Field("title", "utype3", "char", "*")
+    ]
+    rows = [
+        model.Record(["10", "1.5", "1 2", "first"]),
+        model.Record(["", "", "3 4", "second"])
+    ]
+    table = model.IndexedSSAPVotable("OK", fields, rows)
+    size = table.column("size")
+    assert size.dtype == numpy.int32
+    assert size[0] == 10
+    assert size.mask[1]
+    ra = table.column("utype1")
+    assert ra[0] == 1.5
+    assert numpy.isnan(ra[1])
+    assert table.column("pos").shape == (2, 2)
+    assert list(table.column("title")) == ["first", "second"]
+    assert table.column("ra") is ra
+    assert set(table._column_cache) == {0, 1, 2, 3}
+    with pytest.raises(KeyError):
+        table.column("missing")
+
+
+def test_decode_arrays():
+    """Test decoding of multidimensional and boolean array columns."""
+    numpy = pytest.importorskip("numpy")
+    from spectra_downloader.ssap_parser import columns
+    matrix = columns.decode_column(["1 2 3 4 5 6", "7 8 9 10 11 12"], "int", "2x3")
+    assert matrix.shape == (2, 6)
+    assert matrix[1, 5] == 12
+    assert len(columns.decode_column(["1 2 3 4", "1 2"], "int", "2x*")[1]) == 2
+    with pytest.raises(ValueError):
+        columns.decode_column(["1 2"], "int", "*x2")
+    flags = columns.decode_column(["T F", "F ?"], "boolean", "2")
+    assert flags.tolist() == [[True, False], [False, None]]
+    assert list(columns.decode_column(["T F 1", "0"], "boolean", "*")[0]) == [True, False, True]
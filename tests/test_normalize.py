@@ -0,0 +1,100 @@
+import pytest
+import os
+from spectra_downloader.downloader import downloader
+from spectra_downloader.ssap_parser import model
+
+numpy = pytest.importorskip("numpy")
+normalize = pytest.importorskip("spectra_downloader.downloader.normalize")
+
+
+def card(keyword, value):
+    return "{:<8}= {:>20}".format(keyword, value).ljust(80).encode()
+
+
+def make_fits_image(flux, crval, cdelt):
+    """Creates FITS file with 1D float32 primary image and linear wavelength solution."""
+    cards = [card("SIMPLE", "T"), card("BITPIX", "-32"), card("NAXIS", "1"), card("NAXIS1", str(len(flux))),
+             card("CRVAL1", str(crval)), card("CDELT1", str(cdelt)), card("CRPIX1", "1")]
+    header = (b"".join(cards) + b"END".ljust(80)).ljust(2880, b" ")
+    data = numpy.asarray(flux, dtype=">f4").tobytes()
+    return header + data.ljust((len(data) + 2879) // 2880 * 2880, b"\0")
+
+
+VOTABLE = """<?xml version="1.0"?>
+<VOTABLE xmlns="http://www.ivoa.net/xml/VOTable/v1.3"><RESOURCE><TABLE>
+<FIELD name="FLUX" datatype="double" ucd="phot.flux.density"/>
+<FIELD name="WAVE" datatype="double" ucd="em.wl"/>
+<DATA><TABLEDATA>
+<TR><TD>1.5</TD><TD>6000</TD></TR>
+<TR><TD></TD><TD>6001</TD></TR>
+</TABLEDATA></DATA></TABLE></RESOURCE></VOTABLE>"""
+
+
+def test_read_fits_image(tmpdir):
+    """Test reading of flux and wavelength solution from FITS image."""
+    path = tmpdir.join("spec.fits")
+    path.write_binary(make_fits_image([1.0, 2.0, 3.0], 6000, 0.5))
+    wavelength, flux = normalize.read_fits(str(path))
+    assert list(wavelength) == [6000, 6000.5, 6001]
+    assert list(flux) == [1, 2, 3]
+
+
+def test_read_votable_and_text(tmpdir):
+    """Test recognition of columns in VOTable and reading of CSV with header line."""
+    path = tmpdir.join("spec.vot")
+    path.write(VOTABLE)
+    wavelength, flux = normalize.read_votable(str(path))
+    assert list(wavelength) == [6000, 6001]
+    assert flux[0] == 1.5 and numpy.isnan(flux[1])
+    path = tmpdir.join("spec.csv")
+    path.write("wave,flux\n6000,1\n6001,2\n")
+    wavelength, flux = normalize.read_text(str(path), ",")
+    assert list(wavelength) == [6000, 6001]
+    assert list(flux) == [1, 2]
+
+
+def test_normalized_names(tmpdir):
+    """Test that spectra differing only in extension or in inner part of the name get distinct outputs."""
+    tmpdir.join("a.fits").write_binary(make_fits_image([1.0, 2.0], 6000, 1))
+    tmpdir.join("a.vot").write(VOTABLE)
+    tmpdir.join("a.b.fits").write_binary(make_fits_image([3.0], 6000, 1))
+    tmpdir.join("a.c.fits").write_binary(make_fits_image([4.0, 5.0, 6.0], 6000, 1))
+    output_dir = str(tmpdir.mkdir("out"))
+    outputs = [normalize.normalize_spectrum(str(tmpdir.join(name)), output_dir)
+               for name in ("a.fits", "a.vot", "a.b.fits", "a.c.fits")]
+    assert [os.path.basename(output) for output in outputs] == ["a.fits.npy", "a.vot.npy", "a.b.fits.npy",
+                                                                "a.c.fits.npy"]
+    assert [numpy.load(output).shape for output in outputs] == [(2, 2), (2, 2), (2, 1), (2, 3)]
+
+
+def test_normalize_spectrum(tmpdir):
+    """Test that normalized file is memory-mappable array of shape (2, N)."""
+    path = tmpdir.join("spec.fits")
+    path.write_binary(make_fits_image([1.0, 2.0], 6000, 1))
+    output = normalize.normalize_spectrum(str(path), str(tmpdir))
+    array = numpy.load(output, mmap_mode="r")
+    assert array.shape == (2, 2)
+    assert array.dtype == numpy.float64
+    with pytest.raises(ValueError):
+        normalize.normalize_spectrum(str(tmpdir.join("spec.unknown")), str(tmpdir))
+
+
+def test_download_normalization(http, tmpdir):
+    """Test that progress callback follows normalization and reports its result."""
+    contents = {"http://a.org/good.fits": make_fits_image([1.0, 2.0], 6000, 1),
+                "http://a.org/bad.fits": b"garbage" * 100}
+    http.content = contents.get
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record([url]) for url in sorted(contents)])
+    normalizer = normalize.Normalizer(max_workers=1)
+    inst = downloader.SpectraDownloader(table, normalizer=normalizer)
+    reported = list()
+    try:
+        inst.download_direct(table.rows, str(tmpdir), reported.append, None, False)
+    finally:
+        normalizer.shutdown()
+    assert len(reported) == 2
+    bad, good = inst.last_download_results
+    assert good.normalized == str(tmpdir.join("normalized", "good.fits.npy"))
+    assert numpy.load(good.normalized, mmap_mode="r").shape == (2, 2)
+    assert isinstance(bad.normalization_error, ValueError)
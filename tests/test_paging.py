@@ -0,0 +1,132 @@
+import datetime
+import gzip
+import pytest
+from urllib.parse import urlsplit, parse_qs
+from spectra_downloader.downloader import paging
+
+VOTABLE = """<VOTABLE><RESOURCE type="results"><INFO name="QUERY_STATUS" value="{status}"/><TABLE>
+<FIELD name="accref" utype="ssa:Access.Reference"/><FIELD name="pubdid" utype="ssa:Curation.PublisherDID"/>
+<DATA><TABLEDATA>{rows}</TABLEDATA></DATA></TABLE></RESOURCE></VOTABLE>"""
+
+ROW = "<TR><TD>http://archive.org/data/spec{0}.fits</TD><TD>ivo://archive.org/spec{0}</TD></TR>"
+
+
+def make_votable(status, numbers):
+    return VOTABLE.format(status=status, rows="".join(ROW.format(n) for n in numbers))
+
+
+@pytest.fixture
+def offset_service(http):
+    """Fake service with 23 records supporting MAXREC and OFFSET parameters."""
+    requested = list()
+
+    def content(link):
+        params = parse_qs(urlsplit(link).query)
+        maxrec = int(params["MAXREC"][0])
+        offset = int(params["OFFSET"][0])
+        requested.append(offset)
+        numbers = range(offset, min(offset + maxrec, 23))
+        status = "OVERFLOW" if offset + maxrec < 23 else "OK"
+        return make_votable(status, numbers).encode()
+
+    http.content = content
+    return requested
+
+
+@pytest.fixture
+def range_service(http):
+    """Fake service with record per BAND unit in range 0-99 returning at most 10 records."""
+
+    def content(link):
+        params = parse_qs(urlsplit(link).query)
+        low, high = (float(val) for val in params["BAND"][0].split("/"))
+        numbers = [n for n in range(100) if low <= n <= high]
+        if len(numbers) > 10:
+            return make_votable("OVERFLOW", numbers[:10]).encode()
+        return make_votable("OK", numbers).encode()
+
+    http.content = content
+
+
+def test_set_query_params():
+    """Test replacing of HTTP parameters in SSAP link."""
+    link = "http://archive.org/ssap?REQUEST=queryData&maxrec=40&POS=1,2"
+    res = paging.set_query_params(link, {"MAXREC": 10, "OFFSET": 20})
+    assert parse_qs(urlsplit(res).query) == {"REQUEST": ["queryData"], "POS": ["1,2"],
+                                            "MAXREC": ["10"], "OFFSET": ["20"]}
+
+
+def test_offset_paging(offset_service):
+    """Test paging by MAXREC and offset parameters."""
+    query = paging.PagedSSAPQuery("http://archive.org/ssap?REQUEST=queryData", "OFFSET", page_size=5,
+                                  max_workers=2)
+    res = query.fetch()
+    assert res.query_ok
+    assert not query.truncated
+    assert sorted(res.get_pubdid(row) for row in res.rows) == \
+        sorted("ivo://archive.org/spec{}".format(n) for n in range(23))
+    assert 0 in offset_service and 20 in offset_service
+    assert max(offset_service) < 30
+
+
+def test_offset_paging_limit(offset_service):
+    """Test paging stops on max_pages limit and signalizes truncated result."""
+    query = paging.PagedSSAPQuery("http://archive.org/ssap", "OFFSET", page_size=5, max_pages=2)
+    res = query.fetch()
+    assert len(res.rows) == 10
+    assert query.truncated
+    assert res.query_overflow
+
+
+def test_range_partitioning(range_service):
+    """Test partitioning of BAND range with bisection of overflowing intervals."""
+    query = paging.PartitionedSSAPQuery("http://archive.org/ssap", "BAND", 0, 99, parts=3)
+    res = query.fetch()
+    assert res.query_ok
+    pubdids = [res.get_pubdid(row) for row in res.rows]
+    assert len(pubdids) == 100
+    assert set(pubdids) == {"ivo://archive.org/spec{}".format(n) for n in range(100)}
+
+
+def test_time_partitioning(http):
+    """Test that TIME intervals are queried in ISO-8601 and bisected as datetimes."""
+    start = datetime.datetime(2020, 1, 1)
+    days = [start + datetime.timedelta(days=n) for n in range(40)]
+    values = list()
+
+    def parse(value):
+        return datetime.datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%f" if "." in value else "%Y-%m-%dT%H:%M:%S")
+
+    def content(link):
+        value = parse_qs(urlsplit(link).query)["TIME"][0]
+        values.append(value)
+        low, high = (parse(bound) for bound in value.split("/"))
+        numbers = [n for n, day in enumerate(days) if low <= day <= high]
+        return make_votable("OVERFLOW" if len(numbers) > 10 else "OK", numbers[:10]).encode()
+
+    http.content = content
+    query = paging.PartitionedSSAPQuery("http://archive.org/ssap", "TIME", start, days[-1], parts=2)
+    res = query.fetch()
+    assert len(set(res.get_pubdid(row) for row in res.rows)) == 40
+    assert "2020-01-01T00:00:00/2020-01-20T12:00:00" in values
+    link = paging.PartitionedSSAPQuery("http://archive.org/ssap", "TIME", start, days[-1],
+                                       formatter=lambda day: day.strftime("%Y-%m-%d")).interval_link(start, days[1])
+    assert parse_qs(urlsplit(link).query)["TIME"] == ["2020-01-01/2020-01-02"]
+
+
+def test_range_invalid():
+    """Test validation of partitioned range."""
+    with pytest.raises(ValueError):
+        paging.PartitionedSSAPQuery("http://archive.org/ssap", "BAND", 10, 5)
+    with pytest.raises(ValueError):
+        # SSAP requires ISO-8601 values of TIME
+        paging.PartitionedSSAPQuery("http://archive.org/ssap", "TIME", 0, 99)
+
+
+def test_fetch_compressed_page(http):
+    """Test that page is parsed from the response stream and decompressed on the fly."""
+    http.content = gzip.compress(make_votable("OK", range(3)).encode())
+    assert len(paging.fetch_page("http://archive.org/ssap").rows) == 3
+    assert http.responses[0].closed
+    with pytest.raises(TypeError):
+        paging._PagedQuery(1, 5)
@@ -45,6 +45,20 @@ def test_parse_ssap1(ssap1):
     assert parsed.get_pubdid(row) == "ivo://asu.cas.cz/stel/ccd700/tg160037"
 
 
+def test_parse_ssap1_types(ssap1):
+    """Test parsing of FIELD type information and lazy typed column decoding."""
+    parsed = parse_ssap(ssap1)
+    field = parsed.column_fields[parsed.column_index("accsize")]
+    assert field.datatype == "int"
+    assert field.unit == "byte"
+    assert field.ucd == "VOX:Image_FileSize"
+    assert parsed._column_cache == dict()
+    pytest.importorskip("numpy")
+    sizes = parsed.column("ssa:Access.Size")
+    assert len(sizes) == 30
+    assert list(parsed._column_cache) == [parsed.column_index("accsize")]
+
+
 def test_parse_ssap2(ssap2):
     """Test parsing of second votable saved in test dir. This votable
     have invalid query status and contains no data."""
@@ -70,3 +84,20 @@ def test_parse_ssap3(ssap3):
     assert parsed.get_accref(row) == "http://voarchive.asu.cas.cz/getproduct/ccd700/data/v509cas/6255-6767/tg160037.vot"
     assert parsed.get_refname(row) == "tg160037.vot"
     assert parsed.get_pubdid(row) == "ivo://asu.cas.cz/stel/ccd700/tg160037"
+
+
+def test_parse_ssap1_projection(ssap1):
+    """Test that only projected columns and rows accepted by predicate are kept while parsing."""
+    full = parse_ssap(ssap1)
+    sizes = [int(row.columns[full.column_index("accsize")]) for row in full.rows]
+    limit = sorted(sizes)[len(sizes) // 2]
+    parsed = parse_ssap(ssap1, ["ssa:Access.Size"], lambda values: int(values["accsize"]) >= limit)
+    assert [field.name for field in parsed.column_fields] == ["accref", "accsize", "ssa_pubDID"]
+    assert all(len(row.columns) == 3 for row in parsed.rows)
+    assert len(parsed.rows) == len([size for size in sizes if size >= limit])
+    assert parsed.datalink_available
+    row = parsed.rows[0]
+    assert parsed.get_accref(row).startswith("http://voarchive.asu.cas.cz/getproduct/ccd700/")
+    assert parsed.get_pubdid(row).startswith("ivo://asu.cas.cz/stel/ccd700/")
+    with pytest.raises(KeyError):
+        parse_ssap(ssap1, ["unknown"])
@@ -0,0 +1,113 @@
+import pytest
+from spectra_downloader.downloader import downloader, partial, verification
+from spectra_downloader.ssap_parser import model
+from tests.conftest import FakeResponse, FakeSession
+
+
+def card(keyword, value):
+    return "{:<8}= {:>20}".format(keyword, value).ljust(80).encode()
+
+
+def make_hdu(first, naxis1, fill, extra=0):
+    """Creates HDU with one dimensional byte data. Extra cards make the header longer than one block."""
+    cards = [card("XTENSION", "'IMAGE   '") if not first else card("SIMPLE", "T"),
+             card("BITPIX", "8"), card("NAXIS", "1"), card("NAXIS1", str(naxis1))]
+    if not first:
+        cards += [card("PCOUNT", "0"), card("GCOUNT", "1")]
+    cards += [card("KEY{}".format(i), str(i)) for i in range(extra)]
+    header = (b"".join(cards) + b"END".ljust(80)).ljust(2880 * ((len(cards) * 80) // 2880 + 1), b" ")
+    return header, (fill * naxis1).ljust((naxis1 + 2879) // 2880 * 2880, b"\0")
+
+
+HDUS = [make_hdu(True, 1000, b"p"), make_hdu(False, 10000, b"a", 40), make_hdu(False, 50000, b"b")]
+FITS = b"".join(header + data for header, data in HDUS)
+
+
+class RangeSession(FakeSession):
+    """Serves FITS file and records requested ranges. Range header is ignored if ranges are not supported."""
+
+    def __init__(self, ranges=True, content=FITS):
+        super().__init__(content)
+        self.ranges = ranges
+        self.ranges_requested = list()
+
+    def respond(self, url, headers=None):
+        value = (headers or dict()).get("Range")
+        self.ranges_requested.append(value)
+        content = self.content
+        if not self.ranges or value is None:
+            return FakeResponse(content, url=url)
+        start, end = value[len("bytes="):].split("-")
+        start, end = int(start), min(int(end) if end else len(content) - 1, len(content) - 1)
+        if start >= len(content):
+            return FakeResponse(status_code=416, url=url)
+        return FakeResponse(content[start:end + 1], 206,
+                            {"content-range": "bytes {}-{}/{}".format(start, end, len(content))}, url)
+
+
+def fetch(session, **kwargs):
+    chunks = list()
+    fetcher = partial.PartialFetch(**kwargs)
+    reader = fetcher.open(session, "http://a.org/a.fits")
+    try:
+        hdus = fetcher.transfer(reader, chunks.append)
+    finally:
+        reader.close()
+    return hdus, b"".join(chunks), reader
+
+
+@pytest.mark.parametrize("ranges", (True, False))
+def test_hdu_boundaries(ranges):
+    """Test that HDU boundaries are found and all HDUs are fetched by default."""
+    hdus, content, reader = fetch(RangeSession(ranges))
+    assert content == FITS
+    assert [(hdu.offset, hdu.header_size, hdu.data_size) for hdu in hdus] == [
+        (0, 2880, 2880), (5760, 5760, 11520), (23040, 2880, 51840)]
+    assert hdus[1].cards["KEY39"] == "39"
+    assert reader.ranges_supported is ranges
+
+
+@pytest.mark.parametrize("ranges", (True, False))
+def test_selected_hdu(ranges):
+    """Test that only the selected extension is fetched and the skipped primary HDU is replaced by empty one."""
+    session = RangeSession(ranges)
+    hdus, content, reader = fetch(session, hdus=[1])
+    assert content == partial.EMPTY_PRIMARY_HEADER + HDUS[1][0] + HDUS[1][1]
+    cards, end_offset = verification.parse_fits_cards(partial.EMPTY_PRIMARY_HEADER)
+    assert verification.fits_data_size(cards) == 0
+    assert cards["EXTEND"] == "T"
+    assert len(hdus) == 2
+    if ranges:
+        assert reader.received < len(FITS) // 2
+    else:
+        # the rest of the file is never read
+        assert session.responses[0].sent < len(FITS)
+
+
+def test_header_only():
+    """Test header-only stubs of all HDUs transfer a small fraction of the file."""
+    session = RangeSession()
+    hdus, content, reader = fetch(session, header_only=True, readahead=1)
+    assert content == b"".join(header for header, data in HDUS)
+    assert len(hdus) == 3
+    assert reader.received < len(FITS) // 4
+    assert all(value.startswith("bytes=") for value in session.ranges_requested)
+
+
+def test_not_fits():
+    """Test that file which is not FITS is downloaded whole."""
+    text = b"wavelength flux\n" * 2000
+    hdus, content, reader = fetch(RangeSession(content=text))
+    assert hdus is None
+    assert content == text
+
+
+def test_downloader_partial(monkeypatch, tmpdir):
+    """Test partial mode of SpectraDownloader."""
+    monkeypatch.setattr(downloader.requests, "session", RangeSession)
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record(["http://a.org/a.fits"])])
+    inst = downloader.SpectraDownloader(table, partial=partial.PartialFetch(hdus=[0], header_only=True))
+    inst.download_direct(table.rows, str(tmpdir), None, None, False)
+    assert inst.last_download_results[0].success
+    assert tmpdir.join("a.fits").read_binary() == HDUS[0][0]
@@ -0,0 +1,51 @@
+import pytest
+from spectra_downloader.downloader import downloader, results
+from spectra_downloader.ssap_parser import model
+
+
+@pytest.fixture
+def failing(http):
+    """Replaces HTTP session of downloader and returns dictionary of URLs responding with 404."""
+    return http.status_codes
+
+
+def make_table(count):
+    fields = [model.Field("accref", "ssa:access.reference"), model.Field("pubdid", "ssa:curation.publisherdid")]
+    rows = [model.Record(["http://a.org/{}.fits".format(i), "ivo://a/{}".format(i)]) for i in range(count)]
+    return model.IndexedSSAPVotable("OK", fields, rows)
+
+
+def test_result_log(failing, tmpdir):
+    """Test that results are written to disk instead of memory and failures can be downloaded again."""
+    path = str(tmpdir.join("results.jsonl"))
+    table = make_table(4)
+    failing.update({"http://a.org/1.fits": 404, "http://a.org/3.fits": 404})
+    log = results.ResultLog(path)
+    inst = downloader.SpectraDownloader(table, result_log=log)
+    inst.download_direct(table.rows, str(tmpdir.join("spectra")), None, None, False)
+    assert inst.last_download_results == list()
+    assert log.summary() == {"total": 4, "succeeded": 2, "failed": 2, "errors": {"DownloadException": 2}}
+    assert [record["pubdid"] for record in log.failures()] == ["ivo://a/1", "ivo://a/3"]
+    failed = log.failed_spectra(table)
+    assert failed == [table.rows[1], table.rows[3]]
+    del failing["http://a.org/3.fits"]
+    inst.download_direct(failed, str(tmpdir.join("spectra")), None, None, False)
+    log.close()
+    # counters are restored from existing log
+    log = results.ResultLog(path)
+    assert log.summary()["total"] == 6
+    assert [record["name"] for record in log.failures()] == ["1.fits"]
+    log.close()
+
+
+def test_incomplete_record(tmpdir):
+    """Test that incomplete last line written by crashed process is ignored."""
+    path = tmpdir.join("results.jsonl")
+    path.write('{"name":"a.fits","url":"http://a.org/a.fits","success":true}\n{"name":"b.f')
+    log = results.ResultLog(str(path))
+    assert log.summary()["succeeded"] == 1
+    log.record(downloader.DownloadResult("c.fits", "http://a.org/c.fits"))
+    log.close()
+    log = results.ResultLog(str(path))
+    assert [record["name"] for record in log.records()] == ["a.fits", "c.fits"]
+    log.close()
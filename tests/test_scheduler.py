@@ -0,0 +1,106 @@
+import pytest
+import threading
+import time
+from spectra_downloader.downloader import downloader, scheduler
+from spectra_downloader.ssap_parser import model
+
+
+def test_fair_share_and_priority():
+    """Test round-robin order of jobs with the same priority and precedence of higher priority jobs."""
+    order = list()
+    gate = threading.Event()
+    inst = scheduler.Scheduler(max_workers=1)
+    # the first job blocks the only worker until other jobs are queued
+    blocker = inst.submit(lambda session, index: gate.wait(), 1)
+    first = inst.submit(lambda session, index: order.append(("a", index)), 3)
+    second = inst.submit(lambda session, index: order.append(("b", index)), 2)
+    urgent = inst.submit(lambda session, index: order.append(("u", index)), 1, priority=10)
+    gate.set()
+    for job in (blocker, first, second, urgent):
+        assert job.wait(5)
+    assert order == [("u", 0), ("a", 0), ("b", 0), ("a", 1), ("b", 1), ("a", 2)]
+    assert first.results == [None] * 3
+
+
+def test_global_budget():
+    """Test that jobs never run more tasks concurrently than the scheduler budget and threads end when idle."""
+    running = [0, 0]
+    lock = threading.Lock()
+
+    def task(session, index):
+        with lock:
+            running[0] += 1
+            running[1] = max(running)
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        return index
+
+    inst = scheduler.Scheduler(max_workers=3)
+    jobs = [inst.submit(task, 10) for _ in range(4)]
+    for job in jobs:
+        assert job.wait(5)
+    assert running[1] == 3
+    assert jobs[0].results == list(range(10))
+    inst.shutdown()
+    assert not inst._threads
+    with pytest.raises(RuntimeError):
+        inst.submit(task, 1)
+
+
+def test_cancel():
+    """Test that cancelled job finishes without running its pending tasks."""
+    started = threading.Event()
+    gate = threading.Event()
+    finished = list()
+
+    def task(session, index):
+        started.set()
+        return gate.wait()
+
+    inst = scheduler.Scheduler(max_workers=1)
+    job = inst.submit(task, 5, finish=lambda job: finished.append(job.cancelled))
+    started.wait()
+    job.cancel()
+    gate.set()
+    assert job.wait(5)
+    assert finished == [True]
+    assert job.results == [True, None, None, None, None]
+
+
+@pytest.mark.parametrize("http", [{"delay": 0.01}], indirect=True)
+def test_overlapping_downloads(http, tmpdir):
+    """Test that overlapping asynchronous downloads of one instance share its scheduler and keep own results."""
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record(["http://a.org/{}.fits".format(i)])
+                                                    for i in range(6)])
+    shared = scheduler.Scheduler(max_workers=2)
+    inst = downloader.SpectraDownloader(table, scheduler=shared)
+    done = list()
+    first = inst.download_direct(table.rows[:3], str(tmpdir), None, done.append)
+    second = inst.download_direct(table.rows[3:], str(tmpdir), None, done.append, priority=1)
+    assert first.wait(5) and second.wait(5)
+    assert [result.name for result in first.results] == ["0.fits", "1.fits", "2.fits"]
+    assert [result.name for result in second.results] == ["3.fits", "4.fits", "5.fits"]
+    assert first.success and second.success
+    assert done == [True, True]
+    inst.shutdown()
+
+
+@pytest.mark.parametrize("http", [{"delay": 0.01}], indirect=True)
+def test_synchronous_download_from_callback(http, tmpdir):
+    """Test that blocking download started from a callback on the only worker thread does not deadlock."""
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record(["http://a.org/{}.fits".format(i)])
+                                                    for i in range(4)])
+    inst = downloader.SpectraDownloader(table, scheduler=scheduler.Scheduler(max_workers=1))
+    nested = list()
+
+    def done(success):
+        job = inst.download_direct(table.rows[2:], str(tmpdir), None, None, False)
+        nested.append([result.name for result in job.results])
+
+    job = inst.download_direct(table.rows[:2], str(tmpdir), None, done)
+    assert job.wait(5)
+    assert nested == [["2.fits", "3.fits"]]
+    inst.shutdown()
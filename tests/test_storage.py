@@ -0,0 +1,146 @@
+import pytest
+import hashlib
+import os
+import tarfile
+import zipfile
+from spectra_downloader.downloader import downloader, normalize, storage
+from spectra_downloader.downloader.exceptions import SaveException
+from spectra_downloader.ssap_parser import model
+
+
+def store(target, location, name, content, keys=None):
+    writer = target.create(location, name, keys)
+    writer.write(content)
+    writer.commit()
+
+
+@pytest.mark.parametrize("bundle_format", storage.BundleStorage.FORMATS)
+def test_bundle_random_access(tmpdir, bundle_format):
+    """Test that spectra are readable from bundles both by index offsets and by standard archive tools."""
+    target = storage.BundleStorage(bundle_format, bundle_size=3000)
+    contents = {"spec{}.fits".format(i): bytes([i]) * (1000 + i) for i in range(5)}
+    for name, content in sorted(contents.items()):
+        store(target, str(tmpdir), name, content, {"accref": "http://a.org/" + name, "pubdid": None})
+    with pytest.raises(SaveException):
+        target.create(str(tmpdir), "spec0.fits")
+    target.close()
+    reader = storage.BundleReader(str(tmpdir))
+    assert sorted(reader.names()) == sorted(contents)
+    assert reader.read("spec3.fits") == contents["spec3.fits"]
+    assert reader.read("http://a.org/spec4.fits") == contents["spec4.fits"]
+    assert "pubdid" not in reader.entry("spec1.fits")
+    bundles = sorted(path.basename for path in tmpdir.listdir() if path.basename.startswith("bundle-"))
+    assert len(bundles) > 1
+    entry = reader.entry("spec4.fits")
+    if bundle_format == "tar":
+        with tarfile.open(str(tmpdir.join(entry["bundle"]))) as archive:
+            assert archive.extractfile("spec4.fits").read() == contents["spec4.fits"]
+    else:
+        with zipfile.ZipFile(str(tmpdir.join(entry["bundle"]))) as archive:
+            assert archive.read("spec4.fits") == contents["spec4.fits"]
+
+
+def test_bundle_reopen(tmpdir):
+    """Test that existing index is respected and a new bundle is started by a new storage."""
+    target = storage.BundleStorage()
+    store(target, str(tmpdir), "a.fits", b"a")
+    target.close()
+    target = storage.BundleStorage()
+    with pytest.raises(SaveException):
+        target.create(str(tmpdir), "a.fits")
+    writer = target.create(str(tmpdir), "b.fits")
+    writer.write(b"partial")
+    writer.abort()
+    store(target, str(tmpdir), "c.fits", b"c")
+    target.close()
+    reader = storage.BundleReader(str(tmpdir))
+    assert sorted(reader.names()) == ["a.fits", "c.fits"]
+    assert reader.entry("c.fits")["bundle"] == "bundle-00001.tar"
+    assert reader.read("a.fits") == b"a"
+
+
+def test_download_into_bundle(http, tmpdir):
+    """Test that downloaded spectra are stored into bundle instead of separate files."""
+    http.content = lambda url: url.encode() * 100
+    fields = [model.Field("accref", "ssa:access.reference"), model.Field("pubdid", "ssa:curation.publisherdid")]
+    rows = [model.Record(["http://a.org/{}.fits".format(i), "ivo://a/{}".format(i)]) for i in range(3)]
+    table = model.IndexedSSAPVotable("OK", fields, rows)
+    target = storage.BundleStorage("zip")
+    inst = downloader.SpectraDownloader(table, storage=target)
+    inst.download_direct(table.rows, str(tmpdir), None, None, False)
+    assert all(result.success for result in inst.last_download_results)
+    inst.download_direct(table.rows[:1], str(tmpdir), None, None, False)
+    target.close()
+    assert type(inst.last_download_results[0].exception) is SaveException
+    assert sorted(path.basename for path in tmpdir.listdir()) == ["bundle-00000.zip", "index.jsonl"]
+    assert storage.BundleReader(str(tmpdir)).read("ivo://a/1") == b"http://a.org/1.fits" * 100
+
+
+def test_bundle_unsupported_features(tmpdir):
+    """Test that bundles can not be combined with normalization or sync which read files of spectra."""
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record(["http://a.org/a.fits"])])
+    target = storage.BundleStorage("tar")
+    normalizer = normalize.Normalizer(max_workers=1)
+    with pytest.raises(ValueError):
+        downloader.SpectraDownloader(table, normalizer=normalizer, storage=target)
+    inst = downloader.SpectraDownloader(table, normalizer=normalizer)
+    inst.storage = target
+    with pytest.raises(ValueError):
+        inst.download_direct(table.rows, str(tmpdir), None, None, False)
+    normalizer.shutdown()
+    with pytest.raises(ValueError):
+        downloader.SpectraDownloader(table, storage=target).sync(str(tmpdir))
+    target.close()
+
+
+SPEC1_DIGEST = hashlib.md5(b"spec1").hexdigest()
+
+
+@pytest.mark.parametrize("sharding,expected", ((None, ["spec1.fits"]), ("prefix", ["sp", "ec", "spec1.fits"]),
+                                               ("hash", [SPEC1_DIGEST[:2], SPEC1_DIGEST[2:4], "spec1.fits"])))
+def test_directory_sharding(tmpdir, sharding, expected):
+    """Test placement of files into shard subdirectories."""
+    target = storage.DirectoryStorage(sharding)
+    expected = os.path.join(*expected)
+    assert target.relative_path("spec1.fits") == expected
+    store(target, str(tmpdir), "spec1.fits", b"data")
+    assert tmpdir.join(expected).read_binary() == b"data"
+    assert storage.DirectoryStorage(sharding).index(str(tmpdir)) == {expected}
+
+
+def test_directory_index(tmpdir):
+    """Test that existence checks use index built at batch start and concurrent writers of one name collide."""
+    target = storage.DirectoryStorage("prefix", depth=1)
+    tmpdir.join("a.fits").write("flat")
+    tmpdir.ensure("b_", "b.fits").write("sharded")
+    tmpdir.ensure("b_", "c.fits.part").write("partial")
+    target.prepare(str(tmpdir))
+    assert target.index(str(tmpdir)) == {"a.fits", os.path.join("b_", "b.fits")}
+    with pytest.raises(SaveException):
+        target.create(str(tmpdir), "b.fits")
+    writer = target.create(str(tmpdir), "c.fits")
+    with pytest.raises(SaveException):
+        target.create(str(tmpdir), "c.fits")
+    writer.abort()
+    store(target, str(tmpdir), "c.fits", b"c")
+    assert tmpdir.join("c_", "c.fits").read_binary() == b"c"
+
+
+def test_directory_no_overwrite(tmpdir):
+    """Test that storage instances with separate indexes do not overwrite file of each other."""
+    first, second = storage.DirectoryStorage(), storage.DirectoryStorage()
+    writers = [target.create(str(tmpdir), "a.fits") for target in (first, second)]
+    writers[0].write(b"first")
+    writers[1].write(b"second")
+    writers[0].commit()
+    with pytest.raises(SaveException):
+        writers[1].commit()
+    assert tmpdir.listdir() == [tmpdir.join("a.fits")]
+    assert tmpdir.join("a.fits").read_binary() == b"first"
+
+
+def test_storage_abstract():
+    """Test that storage must define writer creation and size."""
+    with pytest.raises(TypeError):
+        storage.Storage()
@@ -0,0 +1,94 @@
+import pytest
+import os
+from spectra_downloader.downloader import downloader, storage
+from spectra_downloader.ssap_parser import model
+
+
+@pytest.fixture
+def requested(http):
+    """Replaces HTTP session of downloader and returns list of requested URLs."""
+    http.content = str.encode
+    http.headers = {"content-type": "application/fits"}
+    http.status_codes = {"missing": 404}
+    return http.requested
+
+
+def make_downloader(names, size="100"):
+    fields = [
+        model.Field("accref", "ssa:access.reference"),
+        model.Field("accsize", "ssa:access.size"),
+        model.Field("pubdid", "ssa:curation.publisherdid")
+    ]
+    rows = [model.Record(["http://archive.org/data/{}.fits".format(name), size, "ivo://archive.org/" + name])
+            for name in names]
+    return downloader.SpectraDownloader(model.IndexedSSAPVotable("OK", fields, rows))
+
+
+def test_sync_downloads_only_new(requested, tmpdir):
+    """Test that repeated sync downloads only spectra missing in the mirror."""
+    report = make_downloader(["a", "b"]).sync(str(tmpdir))
+    assert sorted(report.added) == ["a.fits", "b.fits"]
+    assert report.success
+    del requested[:]
+    report = make_downloader(["a", "b", "c"]).sync(str(tmpdir))
+    assert report.added == ["c.fits"]
+    assert report.unchanged == 2
+    assert requested == ["http://archive.org/data/c.fits"]
+
+
+def test_sync_changed_and_prune(requested, tmpdir):
+    """Test re-downloading of changed spectra and pruning of spectra no longer listed."""
+    make_downloader(["a", "b"]).sync(str(tmpdir))
+    report = make_downloader(["a"], size="200").sync(str(tmpdir), prune=True)
+    assert report.changed == ["a.fits"]
+    assert report.pruned == ["b.fits"]
+    assert sorted(os.listdir(str(tmpdir))) == [".spectra_manifest.json", "a.fits"]
+
+
+def test_sync_adopts_existing_files(requested, tmpdir):
+    """Test that files downloaded without manifest are not downloaded again."""
+    tmpdir.join("a.fits").write("data")
+    report = make_downloader(["a", "b"]).sync(str(tmpdir))
+    assert report.adopted == ["a.fits"]
+    assert report.added == ["b.fits"]
+    assert requested == ["http://archive.org/data/b.fits"]
+
+
+def test_sync_failure_keeps_old_file(requested, tmpdir):
+    """Test that failed download of changed spectrum restores its previous version."""
+    tmpdir.join("missing.fits").write("old")
+    make_downloader(["missing"]).sync(str(tmpdir))
+    report = make_downloader(["missing"], size="200").sync(str(tmpdir))
+    assert len(report.failed) == 1
+    assert tmpdir.join("missing.fits").read() == "old"
+    assert str(report) == "SyncReport: added=0, adopted=0, changed=0, failed=1, pruned=0, unchanged=0"
+
+
+def test_sync_sharded(requested, tmpdir):
+    """Test that files in shard subdirectories are adopted and changed ones re-downloaded in place."""
+    inst = make_downloader(["spec1", "spec2"])
+    inst.storage = storage.DirectoryStorage("prefix")
+    inst.download_direct(inst.parsed_ssap.rows[:1], str(tmpdir), None, None, False)
+    assert inst.last_download_results[0].name == os.path.join("sp", "ec", "spec1.fits")
+    inst.storage = storage.DirectoryStorage("prefix")
+    report = inst.sync(str(tmpdir))
+    assert report.adopted == [os.path.join("sp", "ec", "spec1.fits")]
+    assert report.added == [os.path.join("sp", "ec", "spec2.fits")]
+    changed = make_downloader(["spec1"], size="200")
+    changed.storage = storage.DirectoryStorage("prefix")
+    report = changed.sync(str(tmpdir))
+    assert report.changed == [os.path.join("sp", "ec", "spec1.fits")]
+    assert sorted(os.listdir(str(tmpdir.join("sp", "ec")))) == ["spec1.fits", "spec2.fits"]
+
+
+def test_sync_removed_file(requested, tmpdir):
+    """Test that spectrum recorded in manifest is downloaded again when its file was removed."""
+    spectra_downloader = make_downloader(["a", "b"])
+    spectra_downloader.sync(str(tmpdir))
+    tmpdir.join("a.fits").remove()
+    del requested[:]
+    report = spectra_downloader.sync(str(tmpdir))
+    assert report.added == ["a.fits"]
+    assert report.unchanged == 1
+    assert requested == ["http://archive.org/data/a.fits"]
+    assert tmpdir.join("a.fits").check(file=1)
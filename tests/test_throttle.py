@@ -0,0 +1,130 @@
+import pytest
+import threading
+import time
+from spectra_downloader.downloader import downloader, throttle
+from spectra_downloader.ssap_parser import model
+
+
+def test_rate_limiter():
+    """Test that rate limiter spreads requests in time."""
+    limiter = throttle.RateLimiter(50)
+    started = time.monotonic()
+    for i in range(6):
+        limiter.acquire()
+    assert time.monotonic() - started >= 0.09
+
+
+def test_rate_limiter_try_acquire():
+    """Test that non-blocking acquire takes only available tokens."""
+    limiter = throttle.RateLimiter(1, burst=2)
+    assert limiter.try_acquire()
+    assert limiter.try_acquire()
+    assert not limiter.try_acquire()
+
+
+def test_aimd_cancel():
+    """Test that cancelled slot is freed without changing the limit."""
+    controller = throttle.AIMDController(initial=1, maximum=4)
+    assert controller.try_acquire("a.org")
+    assert not controller.try_acquire("a.org")
+    controller.cancel("a.org")
+    assert controller.hosts["a.org"].in_flight == 0
+    assert controller.limit("a.org") == 1
+    assert controller.hosts["a.org"].successes == controller.hosts["a.org"].congestions == 0
+
+
+def test_aimd_additive_increase():
+    """Test that limit grows by one per round of successful requests."""
+    controller = throttle.AIMDController(initial=2, maximum=4)
+    for i in range(2):
+        controller.acquire("a.org")
+        controller.release("a.org", 200, 0.1, 1000)
+    assert controller.limit("a.org") == 2
+    for i in range(3):
+        controller.acquire("a.org")
+        controller.release("a.org", 200, 0.1, 1000)
+    assert controller.limit("a.org") == 3
+    for i in range(20):
+        controller.acquire("a.org")
+        controller.release("a.org", 200, 0.1, 1000)
+    assert controller.limit("a.org") == 4
+
+
+@pytest.mark.parametrize("status", (429, 503, 500, None))
+def test_aimd_multiplicative_decrease(status):
+    """Test that throttling status codes and failures halve the limit."""
+    controller = throttle.AIMDController(initial=8, maximum=8)
+    controller.acquire("a.org")
+    controller.release("a.org", status, 0.1)
+    assert controller.limit("a.org") == 4
+    assert controller.limit("b.org") == 8
+    assert controller.hosts["a.org"].congestions == 1
+
+
+def test_aimd_latency_signal():
+    """Test that request much slower than the best observed one is a congestion signal."""
+    controller = throttle.AIMDController(initial=8, maximum=8, latency_factor=3.0)
+    controller.acquire("a.org")
+    controller.release("a.org", 200, 0.1, 1000)
+    controller.acquire("a.org")
+    controller.release("a.org", 200, 1.0, 1000)
+    assert controller.limit("a.org") == 4
+
+
+def test_aimd_acquire_blocks():
+    """Test that requests over the host limit wait for a free slot."""
+    controller = throttle.AIMDController(initial=1, maximum=1)
+    controller.acquire("a.org")
+    acquired = threading.Event()
+
+    def second():
+        controller.acquire("a.org")
+        acquired.set()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not acquired.wait(0.1)
+    controller.release("a.org", 200, 0.1)
+    assert acquired.wait(1)
+    thread.join()
+
+
+def test_aimd_try_acquire_and_client_errors():
+    """Test non-blocking acquire and that responses other than 2xx do not increase the limit."""
+    controller = throttle.AIMDController(initial=1, maximum=4)
+    assert controller.try_acquire("a.org")
+    assert not controller.try_acquire("a.org")
+    controller.release("a.org", 404, 0.1)
+    for i in range(5):
+        assert controller.try_acquire("a.org")
+        controller.release("a.org", 404, 0.1)
+    assert controller.limit("a.org") == 1
+    assert controller.hosts["a.org"].successes == 0
+
+
+def test_throttled_host_does_not_block_worker(http, tmpdir):
+    """Test that downloads from a host at its limit are deferred while the worker serves other hosts."""
+    requested = http.requested
+    fields = [model.Field("accref", "ssa:access.reference")]
+    urls = ["http://a.org/1.fits", "http://b.org/2.fits", "http://a.org/3.fits", "http://b.org/4.fits"]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record([url]) for url in urls])
+    controller = throttle.AIMDController(initial=1, maximum=1)
+    controller.acquire("a.org")  # slot of a.org is held by other user of the controller
+    inst = downloader.SpectraDownloader(table, concurrency=controller)
+    job = inst.download_direct(table.rows, str(tmpdir))
+    deadline = time.monotonic() + 5
+    while len(requested) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert requested == ["http://b.org/2.fits", "http://b.org/4.fits"]
+    assert not job.done()
+    controller.release("a.org", 200, 0.1)
+    assert job.wait(5)
+    assert job.success
+    assert sorted(requested[2:]) == ["http://a.org/1.fits", "http://a.org/3.fits"]
+    inst.shutdown()
+
+
+def test_aimd_invalid_limits():
+    """Test validation of controller limits."""
+    with pytest.raises(ValueError):
+        throttle.AIMDController(initial=10, maximum=5)
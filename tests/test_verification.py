@@ -0,0 +1,113 @@
+import pytest
+import base64
+import gzip
+import hashlib
+import struct
+from spectra_downloader.downloader import downloader, verification
+from spectra_downloader.downloader.exceptions import VerificationException
+from spectra_downloader.ssap_parser import model
+from tests.conftest import FakeResponse
+
+
+def card(keyword, value):
+    return "{:<8}= {:>20}".format(keyword, value).ljust(80).encode()
+
+
+def make_fits(data, datasum=None):
+    """Creates FITS file with 8-bit primary data unit."""
+    cards = [card("SIMPLE", "T"), card("BITPIX", "8"), card("NAXIS", "1"), card("NAXIS1", str(len(data)))]
+    if datasum is not None:
+        cards.append(card("DATASUM", "'{}'".format(datasum)))
+    header = b"".join(cards) + b"END".ljust(80)
+    header = header.ljust(2880, b" ")
+    return header + data.ljust((len(data) + 2879) // 2880 * 2880, b"\0")
+
+
+def reference_datasum(data):
+    data = data.ljust((len(data) + 3) // 4 * 4, b"\0")
+    total = sum(struct.unpack(">{}I".format(len(data) // 4), data))
+    while total >> 32:
+        total = (total & 0xffffffff) + (total >> 32)
+    return total
+
+
+def run(verifier, response, name="spec.fits", chunk_size=1000):
+    stage = verifier.begin(response, name)
+    for chunk in response.iter_content(chunk_size):
+        stage.update(chunk)
+    return stage.finish()
+
+
+def test_checksum_headers():
+    """Test comparison of computed hashes with Content-MD5 and Digest headers."""
+    content = b"spectrum data"
+    md5 = base64.b64encode(hashlib.md5(content).digest()).decode()
+    sha = base64.b64encode(hashlib.sha256(content).digest()).decode()
+    response = FakeResponse(content, headers={"content-md5": md5, "digest": "SHA-256=" + sha})
+    res = run(verification.ChecksumVerifier(), response)
+    assert res.ok
+    assert res.values["sha256"] == hashlib.sha256(content).hexdigest()
+    response = FakeResponse(b"corrupted data", headers={"content-md5": md5})
+    assert not run(verification.ChecksumVerifier(), response).ok
+
+
+def test_checksum_encoded_response():
+    """Test that digests of encoded body are not compared with hashes of decoded content."""
+    content = b"spectrum data"
+    encoded_md5 = base64.b64encode(hashlib.md5(gzip.compress(content)).digest()).decode()
+    response = FakeResponse(content, headers={"content-md5": encoded_md5, "content-encoding": "gzip"})
+    res = run(verification.ChecksumVerifier(), response)
+    assert res.ok
+    assert res.message == "no expected checksum available"
+    with pytest.raises(TypeError):
+        verification.Verifier()
+
+
+def test_checksum_manifest():
+    """Test comparison of computed hashes with manifest values."""
+    manifest = {"spec.fits": {"md5": hashlib.md5(b"abc").hexdigest()}}
+    assert run(verification.ChecksumVerifier(manifest=manifest), FakeResponse(b"abc")).ok
+    assert not run(verification.ChecksumVerifier(manifest=manifest), FakeResponse(b"abd")).ok
+
+
+def test_content_length():
+    """Test check of Content-Length header."""
+    assert run(verification.ContentLengthVerifier(), FakeResponse(b"abc", headers={"content-length": "3"})).ok
+    assert not run(verification.ContentLengthVerifier(), FakeResponse(b"ab", headers={"content-length": "3"})).ok
+
+
+@pytest.mark.parametrize("chunk_size", (1, 7, 1024, 10000))
+def test_fits_datasum(chunk_size):
+    """Test streaming DATASUM verification with different chunk sizes."""
+    data = bytes(range(256)) * 13 + b"\x01\x02\x03"
+    datasum = reference_datasum(data)
+    res = run(verification.FitsVerifier(), FakeResponse(make_fits(data, datasum)), chunk_size=chunk_size)
+    assert res.ok
+    assert res.values["datasum"] == datasum
+    res = run(verification.FitsVerifier(), FakeResponse(make_fits(data, datasum + 1)), chunk_size=chunk_size)
+    assert not res.ok
+
+
+def test_fits_sanity():
+    """Test detection of files that are not FITS and skipping of other formats."""
+    assert not run(verification.FitsVerifier(), FakeResponse(b"<VOTABLE>" * 100)).ok
+    assert run(verification.FitsVerifier(), FakeResponse(make_fits(b"data"))).ok
+    assert run(verification.FitsVerifier(), FakeResponse(b"1,2,3"), name="spec.csv").ok
+
+
+def test_download_verification(http, tmpdir):
+    """Test that verification results are stored in DownloadResult and corrupted files are removed."""
+    contents = {"http://a.org/good.fits": make_fits(b"data"), "http://a.org/bad.fits": b"garbage" * 100}
+    http.content = contents.get
+    fields = [model.Field("accref", "ssa:access.reference")]
+    table = model.IndexedSSAPVotable("OK", fields, [model.Record([url]) for url in sorted(contents)])
+    inst = downloader.SpectraDownloader(table, verifiers=[verification.FitsVerifier(),
+                                                          verification.ChecksumVerifier()])
+    inst.download_direct(table.rows, str(tmpdir), None, None, False)
+    bad, good = inst.last_download_results
+    assert good.success
+    assert [check.check for check in good.verification] == ["fits", "checksum"]
+    assert not bad.success
+    assert type(bad.exception) is VerificationException
+    assert not bad.verification[0].ok
+    assert tmpdir.listdir() == [tmpdir.join("good.fits")]
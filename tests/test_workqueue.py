@@ -0,0 +1,114 @@
+import pytest
+from spectra_downloader.downloader import workqueue
+
+VOTABLE = """<VOTABLE><RESOURCE type="results"><INFO name="QUERY_STATUS" value="OK"/><TABLE>
+<FIELD name="accref" utype="ssa:Access.Reference"/><FIELD name="pubdid" utype="ssa:Curation.PublisherDID"/>
+<DATA><TABLEDATA>{}</TABLEDATA></DATA></TABLE></RESOURCE></VOTABLE>"""
+
+ROW = "<TR><TD>http://archive.org/data/spec{0}.fits</TD><TD>ivo://archive.org/spec{0}</TD></TR>"
+
+
+@pytest.fixture
+def queue(tmpdir, http):
+    http.content = b"spectrum"
+    queue = workqueue.WorkQueue(str(tmpdir.join("queue.db")), lease=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def test_claim_leases(queue, tmpdir):
+    """Test that leased items are not claimed twice until their lease expires."""
+    job_id = queue.submit(VOTABLE.format("".join(ROW.format(n) for n in range(5))), str(tmpdir))
+    first = queue.claim("a", 3)
+    second = queue.claim("b", 3)
+    assert [item.row for item in first] == [0, 1, 2]
+    assert [item.row for item in second] == [3, 4]
+    assert queue.claim("b") == list()
+    assert queue.counts(job_id)[workqueue.LEASED] == 5
+    # worker a crashed - its leases expire and items are claimed by other worker
+    queue.lease = -1
+    queue.renew("a")
+    reclaimed = queue.claim("b", 10)
+    assert [item.row for item in reclaimed] == [0, 1, 2]
+    assert all(item.attempts == 2 for item in reclaimed)
+
+
+def test_claim_pending_first(queue, tmpdir):
+    """Test that pending items are claimed before expired leases and the queue does not use write-ahead log."""
+    queue.submit(VOTABLE.format("".join(ROW.format(n) for n in range(4))), str(tmpdir))
+    queue.claim("a", 2)
+    queue.lease = -1
+    queue.renew("a")
+    assert [item.row for item in queue.claim("b", 3)] == [2, 3, 0]
+    assert queue._connection.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
+
+
+def test_worker_drains_queue(queue, http, tmpdir):
+    """Test that several workers download all spectra and failures are retried up to max_attempts."""
+    location = str(tmpdir.join("spectra"))
+    job_id = queue.submit(VOTABLE.format("".join(ROW.format(n) for n in range(6))), location)
+    http.status_codes = {"http://archive.org/data/spec4.fits": 404}
+    other = workqueue.WorkQueue(queue.path)
+    results = list()
+    processed = workqueue.QueueWorker(queue, "a", batch_size=2).run(results.append)
+    processed += workqueue.QueueWorker(other, "b", batch_size=2).run(results.append)
+    other.close()
+    assert processed == 7
+    assert queue.counts(job_id) == {"pending": 0, "leased": 0, "done": 5, "failed": 1}
+    assert [row[:3] for row in queue.failed()] == [(job_id, 4, "spec4.fits")]
+    assert sorted(path.basename for path in tmpdir.join("spectra").listdir()) == [
+        "spec{}.fits".format(n) for n in (0, 1, 2, 3, 5)]
+
+
+def test_resume_stored_spectrum(queue, tmpdir):
+    """Test that spectrum stored by interrupted worker before recording its result is not downloaded again."""
+    queue.submit(VOTABLE.format(ROW.format(0)), str(tmpdir))
+    item, = queue.claim("crashed")
+    assert queue.stage(item, "crashed", "spec0.fits", 8)
+    tmpdir.join("spec0.fits").write("spectrum")
+    queue.lease = -1
+    queue.renew("crashed")
+    queue.lease = 60
+    assert workqueue.QueueWorker(queue, "a").run() == 1
+    assert queue.counts()[workqueue.DONE] == 1
+
+
+def test_name_collision_fails(queue, tmpdir):
+    """Test that other file of the same name found by a retried attempt is not reported as the stored spectrum."""
+    queue.submit(VOTABLE.format(ROW.format(0)), str(tmpdir))
+    tmpdir.join("spec0.fits").write("other spectrum")
+    results = list()
+    assert workqueue.QueueWorker(queue, "a").run(results.append) == 2
+    assert queue.counts() == {"pending": 0, "leased": 0, "done": 0, "failed": 1}
+    assert not results[-1].success
+    # recorded size of the stored spectrum must match too
+    queue.submit(VOTABLE.format(ROW.format(1)), str(tmpdir))
+    item, = queue.claim("crashed")
+    queue.stage(item, "crashed", "spec1.fits", 8)
+    tmpdir.join("spec1.fits").write("replaced spectrum")
+    queue.lease = -1
+    queue.renew("crashed")
+    queue.lease = 60
+    workqueue.QueueWorker(queue, "a").run()
+    assert queue.counts()[workqueue.FAILED] == 2
+
+
+def test_lease_renewed_during_download(queue, http, tmpdir, monkeypatch):
+    """Test that lease of the item is renewed while the spectrum is received."""
+    queue.submit(VOTABLE.format(ROW.format(0)), str(tmpdir))
+    queue.lease = 0.03
+    http.content = b"x" * 3072
+    http.delay = 0.02
+    renewals = list()
+    renew = queue.renew
+
+    def record(worker):
+        renewals.append(queue.counts()[workqueue.LEASED])
+        renew(worker)
+
+    monkeypatch.setattr(queue, "renew", record)
+    assert workqueue.QueueWorker(queue, "a").run() == 1
+    # renewed after every chunk and after the item was completed
+    assert renewals == [1, 1, 1, 0]
+    assert queue.counts()[workqueue.DONE] == 1
+    assert tmpdir.join("spec0.fits").size() == 3072